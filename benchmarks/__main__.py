@@ -0,0 +1,327 @@
+"""
+Benchmarks of interactions-transcript.
+
+Run from the root of the repository:
+
+    python -m benchmarks --messages 2000 --latency 0.05
+"""
+
+import argparse
+import asyncio
+import copy
+import io
+import re
+import tempfile
+import time
+import timeit
+import tracemalloc
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from unittest import mock
+
+import aiohttp
+
+from interactions import Channel, Message
+from interactions.ext.transcript import LiveTranscripts, get_transcript, get_transcript_file
+from interactions.ext.transcript.cache import clear_cache
+from interactions.ext.transcript.emoji_convert import convert_emoji
+from interactions.ext.transcript.resolver import Resolver
+from interactions.ext.transcript.utils import normal_markdown, parse_md
+
+from .fake_client import AssetServer, FakeClient, FakeSession
+from .synthetic import CHANNEL_ID, GUILD_ID, make_channel_payload, make_messages
+
+modes = ("html", "plain", "json", "jsonl", "csv")
+
+
+async def _watch_lag(lags, interval=0.001):
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        lags.append(loop.time() - start - interval)
+
+
+async def export(messages, mode, latency, options):
+    client = FakeClient(messages, latency)
+    channel = Channel(**make_channel_payload(), _client=client)
+    if mode not in ("html", "plain"):
+        options = {**options, "max_bytes": None}
+    lags = [0.0]
+    watcher = asyncio.ensure_future(_watch_lag(lags))
+    start = time.perf_counter()
+    try:
+        await get_transcript(channel, limit=len(messages), mode=mode, **options)
+    finally:
+        elapsed = time.perf_counter() - start
+        watcher.cancel()
+    return elapsed, max(lags), client.calls
+
+
+async def bench_mode(messages, mode, latency, repeat, options):
+    times = []
+    lags = []
+    for _ in range(repeat):
+        elapsed, lag, calls = await export(messages, mode, latency, options)
+        times.append(elapsed)
+        lags.append(lag)
+
+    tracemalloc.start()
+    await export(messages, mode, latency, options)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    best = min(times)
+    return {
+        "mode": mode,
+        "seconds": best,
+        "messages/s": len(messages) / best,
+        "peak MiB": peak / 1024 / 1024,
+        "max lag ms": max(lags) * 1000,
+        "api calls": sum(calls.values()),
+        "calls": calls,
+    }
+
+
+async def bench_micro(number):
+    client = FakeClient(make_messages(50))
+    resolver = Resolver(client, GUILD_ID)
+    text = (
+        "**bold** *italic* __underline__ ~~strike~~ `code` ||spoiler|| <@800000000000000001> "
+        "<#900000000000000001> <@&700000000000000001> https://example.com 😀🎉👨‍👩‍👧\n"
+        "> quote\n```py\nprint('hello')\n```"
+    )
+    emoji_text = "hello 😀 world 🎉 family 👨‍👩‍👧 flag 🇫🇷 " * 4
+    session = FakeSession()
+
+    async def timed(coro_factory):
+        start = time.perf_counter()
+        for _ in range(number):
+            await coro_factory()
+        return (time.perf_counter() - start) / number
+
+    results = {
+        "parse_md": await timed(lambda: parse_md(text, resolver, "UTC")),
+        "convert_emoji": await timed(lambda: convert_emoji(emoji_text, session=session)),
+        "normal_markdown": timeit.timeit(lambda: normal_markdown(text), number=number) / number,
+    }
+    await resolver.close()
+    return results
+
+
+def _without_time(transcript):
+    return re.sub(r"\d+ \w+ \d{4} at \d\d:\d\d:\d\d \(\w+\)", "", transcript)
+
+
+async def check_live(count):
+    """
+    Checks that a live transcript equals a cold export after an edit and a deletion that
+    render a referenced message without text again.
+
+    :param count: The number of messages in the channel
+    :return: Whether both transcripts are the same
+    """
+    messages = make_messages(count)
+    # Deleting previous joins target to the group of the message before it, so target is
+    # rendered again after the reply to it was
+    times = [int(m["id"]) >> 22 for m in messages]
+    n = next(n for n in range(count // 2, count - 1) if times[n] - times[n - 2] < 60000)
+    target, previous, reply = messages[n], messages[n - 1], messages[-1]
+    messages[n - 2]["author"] = target["author"]
+    previous["author"] = next(m["author"] for m in messages if m["author"] != target["author"])
+    target["content"] = ""
+    target["attachments"] = [
+        {
+            "id": "1",
+            "filename": "log.txt",
+            "size": 100,
+            "url": f"https://cdn.discordapp.com/attachments/{CHANNEL_ID}/1/log.txt",
+            "proxy_url": f"https://media.discordapp.net/attachments/{CHANNEL_ID}/1/log.txt",
+            "content_type": "text/plain",
+        }
+    ]
+    reply["referenced_message"] = copy.deepcopy(target)
+    reply["message_reference"] = {"message_id": target["id"], "channel_id": str(CHANNEL_ID)}
+    edit = {
+        "id": target["id"],
+        "channel_id": str(CHANNEL_ID),
+        "edited_timestamp": "2023-01-01T00:00:00+00:00",
+    }
+
+    with tempfile.TemporaryDirectory() as directory:
+        live = LiveTranscripts(directory)
+        client = FakeClient(copy.deepcopy(messages))
+        channel = Channel(**make_channel_payload(), _client=client)
+        await live.watch(channel)
+        await live.message_update(Message(**edit, _client=client))
+        await live.message_delete(channel.id, [previous["id"]])
+        transcript = await live.finish(channel)
+        await live.close()
+
+    target.update(edit)
+    reply["referenced_message"] = copy.deepcopy(target)
+    messages.remove(previous)
+    channel = Channel(**make_channel_payload(), _client=FakeClient(copy.deepcopy(messages)))
+    cold = await get_transcript(channel, limit=None)
+    return _without_time(transcript) == _without_time(cold)
+
+
+def _png(width, height):
+    from PIL import Image
+
+    f = io.BytesIO()
+    Image.new("RGB", (width, height), "#5865f2").save(f, "PNG")
+    return f.getvalue()
+
+
+async def check_assets(count):
+    """
+    Bundles the assets of a transcript from a local AssetServer and checks that identical
+    files are stored once, that links answering with a 404 are kept and that large images
+    get a thumbnail.
+
+    :param count: The number of messages in the channel
+    :return: A dict with the number of attachments, missing attachments, downloads, stored files and thumbnails, and whether the bundle is right
+    """
+    messages = make_messages(count, mix={"attachment": 0.5, "emoji": 0, "reaction": 0})
+    try:
+        image = _png(1200, 900)
+    except ImportError:
+        image = None
+    files = {"/attachments/log.txt": (b"ticket log\n" * 100, "text/plain")}
+    if image is not None:
+        files["/attachments/image.png"] = (image, "image/png")
+
+    async with AssetServer(files) as server:
+        attachments = missing = 0
+        for message in messages:
+            for a in message["attachments"]:
+                attachments += 1
+                name = a["filename"] if image is not None else "log.txt"
+                if attachments % 10 == 0:
+                    name, missing = "missing.txt", missing + 1
+                a["url"] = a["proxy_url"] = (
+                    f"http://{server.host}/attachments/{name}?n={attachments}"
+                )
+                a["filename"] = name
+                a["content_type"] = "image/png" if name.endswith(".png") else "text/plain"
+
+        channel = Channel(**make_channel_payload(), _client=FakeClient(messages))
+        file = await get_transcript_file(
+            channel, limit=None, assets="bundle", asset_hosts=[server.host], filename="t.html"
+        )
+        with zipfile.ZipFile(file._fp) as z:
+            names = z.namelist()
+            transcript = z.read("t.html").decode()
+        calls = server.calls
+
+    stored = [n for n in names if n.startswith("assets/") and "/thumbnails/" not in n]
+    thumbnails = [n for n in names if "/thumbnails/" in n]
+    kept = transcript.count(f"http://{server.host}/attachments/missing.txt")
+    return {
+        "attachments": attachments,
+        "missing": missing,
+        "downloads": calls,
+        "stored": len(stored),
+        "thumbnails": len(thumbnails),
+        "ok": (
+            calls == attachments
+            and len(stored) == len(files)
+            and kept >= missing
+            and len(thumbnails) == (image is not None)
+        ),
+    }
+
+
+async def main(args):
+    messages = make_messages(args.messages, users=args.users, seed=args.seed)
+    FakeSession.latency = args.cdn_latency
+    with mock.patch.object(aiohttp, "ClientSession", FakeSession):
+        print(
+            f"{args.messages} messages, {args.latency * 1000:.0f} ms API latency, "
+            f"{args.cdn_latency * 1000:.0f} ms CDN latency, best of {args.repeat}"
+        )
+        executor = ProcessPoolExecutor(args.executor) if args.executor else None
+        options = {"executor": executor, "time_slice": args.time_slice, "max_bytes": args.max_bytes}
+        used = [
+            f"{name}={value if name != 'executor' else args.executor}"
+            for name, value in options.items()
+            if value is not None
+        ]
+        if used:
+            print(", ".join(used))
+        print(
+            f"{'mode':<6}{'seconds':>10}{'messages/s':>14}{'peak MiB':>10}"
+            f"{'max lag ms':>12}{'api calls':>11}"
+        )
+        try:
+            for mode in args.modes:
+                r = await bench_mode(messages, mode, args.latency, args.repeat, options)
+                print(
+                    f"{r['mode']:<6}{r['seconds']:>10.3f}{r['messages/s']:>14.0f}"
+                    f"{r['peak MiB']:>10.1f}{r['max lag ms']:>12.1f}{r['api calls']:>11}"
+                    f"  {r['calls']}"
+                )
+        finally:
+            if executor is not None:
+                executor.shutdown()
+        print(f"CDN requests: {FakeSession.calls}")
+
+        if args.micro:
+            print()
+            print(f"{'function':<16}{'us/call':>10}")
+            for name, seconds in (await bench_micro(args.micro)).items():
+                print(f"{name:<16}{seconds * 1e6:>10.1f}")
+            clear_cache()
+
+        if args.check_live:
+            print()
+            same = await check_live(args.check_live)
+            print(f"live transcript {'matches' if same else 'differs from'} a cold export")
+            clear_cache()
+
+    if args.check_assets:
+        print()
+        r = await check_assets(args.check_assets)
+        print(
+            f"{r['attachments']} attachments ({r['missing']} missing), {r['downloads']} downloads, "
+            f"{r['stored']} files and {r['thumbnails']} thumbnails stored: "
+            f"{'ok' if r['ok'] else 'failed'}"
+        )
+        clear_cache()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description=__doc__.strip())
+    parser.add_argument("--messages", type=int, default=1000, help="messages in the channel")
+    parser.add_argument("--users", type=int, default=10, help="authors in the channel")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the generator")
+    parser.add_argument("--latency", type=float, default=0.0, help="API latency in seconds")
+    parser.add_argument("--cdn-latency", type=float, default=0.0, help="CDN latency in seconds")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per mode, the best is kept")
+    parser.add_argument("--modes", nargs="+", choices=modes, default=list(modes))
+    parser.add_argument(
+        "--executor", type=int, default=0, help="processes to render html in, 0 for none"
+    )
+    parser.add_argument(
+        "--time-slice", type=float, default=None, help="seconds of rendering between yields"
+    )
+    parser.add_argument(
+        "--max-bytes", type=int, default=None, help="split html and plain into parts this big"
+    )
+    parser.add_argument(
+        "--micro", type=int, default=1000, help="calls per microbenchmark, 0 to skip them"
+    )
+    parser.add_argument(
+        "--check-live",
+        type=int,
+        default=0,
+        help="messages of a live transcript to compare with a cold export, 0 to skip it",
+    )
+    parser.add_argument(
+        "--check-assets",
+        type=int,
+        default=0,
+        help="messages of a bundle to download from a local server and check, 0 to skip it",
+    )
+    asyncio.run(main(parser.parse_args()))
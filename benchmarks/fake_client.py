@@ -0,0 +1,158 @@
+"""
+A local stand-in for the HTTP client of the bot, the twemoji CDN and the attachment CDN.
+"""
+
+import asyncio
+
+from aiohttp import web
+
+from interactions.api.cache import Cache
+
+from .synthetic import make_guild
+
+
+class FakeClient:
+    """
+    Serves a synthetic channel with the HTTPClient methods the transcript uses.
+    Every request waits for ``latency`` seconds and is counted in ``calls``.
+    """
+
+    def __init__(self, messages, latency=0.0):
+        """
+        :param messages: The message payloads of the channel, oldest first
+        :param latency: The time in seconds every request takes
+        """
+        self.latency = latency
+        self.calls = {}
+        self.cache = Cache()
+        self.guild = make_guild()
+        self.messages = {int(m["id"]): m for m in messages}
+        self.users = {m["author"]["id"]: m["author"] for m in messages}
+        self._newest_first = sorted(self.messages, reverse=True)
+
+    async def _call(self, name):
+        self.calls[name] = self.calls.get(name, 0) + 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    async def get_channel_messages(
+        self, channel_id, limit=50, around=None, before=None, after=None
+    ):
+        await self._call("get_channel_messages")
+        ids = self._newest_first
+        if before is not None:
+            ids = [i for i in ids if i < int(before)]
+        if after is not None:
+            ids = sorted(i for i in ids if i > int(after))[:limit][::-1]
+        return [self.messages[i] for i in ids[:limit]]
+
+    async def get_guild(self, guild_id, with_counts=False):
+        await self._call("get_guild")
+        return self.guild
+
+    async def get_channel(self, channel_id):
+        await self._call("get_channel")
+        return {
+            "id": str(channel_id),
+            "name": f"channel-{str(channel_id)[-4:]}",
+            "type": 0,
+            "guild_id": self.guild["id"],
+        }
+
+    async def get_member(self, guild_id, member_id):
+        await self._call("get_member")
+        user = self.users.get(str(member_id))
+        if user is None:
+            return None
+        return {
+            "user": user,
+            "nick": None,
+            "roles": [],
+            "joined_at": "2022-01-01T00:00:00+00:00",
+            "deaf": False,
+            "mute": False,
+        }
+
+    async def get_user(self, user_id):
+        await self._call("get_user")
+        return self.users.get(str(user_id))
+
+    async def get_message(self, channel_id, message_id):
+        await self._call("get_message")
+        return self.messages.get(int(message_id))
+
+    async def get_sticker(self, sticker_id):
+        await self._call("get_sticker")
+        return {"id": str(sticker_id), "name": "sticker", "pack_id": "1", "format_type": 1}
+
+
+class FakeResponse:
+    status = 200
+
+    def __init__(self, latency):
+        self.latency = latency
+
+    async def __aenter__(self):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self
+
+    async def __aexit__(self, *exc):
+        pass
+
+
+class FakeSession:
+    """
+    Answers every CDN request with a 200 after ``latency`` seconds, in place of an
+    aiohttp.ClientSession.
+    """
+
+    latency = 0.0
+    calls = 0
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def get(self, url):
+        FakeSession.calls += 1
+        return FakeResponse(self.latency)
+
+    async def close(self):
+        pass
+
+
+class AssetServer:
+    """
+    Serves files over HTTP on a local port in place of the attachment CDN, so bundling can
+    download real responses without network access. Unknown paths answer with a 404, and
+    every request is counted in ``calls``.
+    """
+
+    def __init__(self, files):
+        """
+        :param files: A dict of path to (body, content type) to serve
+        """
+        self.files = files
+        self.calls = 0
+        self.host = None
+        self._runner = None
+
+    async def _handle(self, request):
+        self.calls += 1
+        if request.path not in self.files:
+            return web.Response(status=404)
+        body, content_type = self.files[request.path]
+        return web.Response(body=body, content_type=content_type)
+
+    async def __aenter__(self):
+        app = web.Application()
+        app.router.add_get("/{path:.*}", self._handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        self.host = "127.0.0.1:%d" % self._runner.addresses[0][1]
+        return self
+
+    async def __aexit__(self, *exc):
+        await self._runner.cleanup()
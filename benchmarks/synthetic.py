@@ -0,0 +1,193 @@
+"""
+Builds synthetic channels for the benchmarks.
+"""
+
+import random
+from datetime import datetime, timezone
+
+DISCORD_EPOCH = 1420070400000
+GUILD_ID = 900000000000000000
+CHANNEL_ID = 900000000000000001
+ROLE_ID = 700000000000000001
+
+default_mix = {
+    "reply": 0.1,
+    "embed": 0.1,
+    "attachment": 0.1,
+    "mention": 0.2,
+    "emoji": 0.2,
+    "code": 0.1,
+    "components": 0.05,
+    "reaction": 0.1,
+}
+
+words = (
+    "ticket support please help thanks order refund status update issue server bot "
+    "channel message account payment question answer"
+).split()
+emoji = ["😀", "🎉", "👍", "🔥", "❤️", "👨‍👩‍👧", "🇫🇷", "✅"]
+
+
+def snowflake(timestamp_ms, increment=0):
+    """
+    :param timestamp_ms: The unix time in milliseconds
+    :param increment: The increment of the snowflake
+    :return: The snowflake as a string
+    """
+    return str(((timestamp_ms - DISCORD_EPOCH) << 22) | increment)
+
+
+def make_users(count):
+    """
+    :param count: The number of users
+    :return: A list of user payloads, the last one being a bot
+    """
+    users = []
+    for n in range(count):
+        users.append(
+            {
+                "id": str(800000000000000001 + n),
+                "username": f"user{n}",
+                "discriminator": f"{n % 10000:04d}",
+                "avatar": None,
+                "bot": n == count - 1,
+            }
+        )
+    return users
+
+
+def make_guild():
+    """
+    :return: The guild payload of the synthetic channel
+    """
+    return {
+        "id": str(GUILD_ID),
+        "name": "Benchmark Guild",
+        "icon": None,
+        "roles": [
+            {
+                "id": str(ROLE_ID),
+                "name": "moderators",
+                "color": 0xE67E22,
+                "hoist": False,
+                "position": 1,
+                "permissions": "0",
+                "managed": False,
+                "mentionable": True,
+            }
+        ],
+    }
+
+
+def make_channel_payload():
+    """
+    :return: The payload of the synthetic channel
+    """
+    return {
+        "id": str(CHANNEL_ID),
+        "name": "benchmark",
+        "type": 0,
+        "guild_id": str(GUILD_ID),
+        "topic": "Synthetic channel",
+    }
+
+
+def make_messages(count, mix=None, users=10, seed=0):
+    """
+    Builds the payloads of a synthetic channel history, oldest first.
+
+    :param count: The number of messages
+    :param mix: A dict of feature to the probability of a message having it, see default_mix
+    :param users: The number of authors
+    :param seed: The seed of the random generator
+    :return: A list of message payloads
+    """
+    mix = {**default_mix, **(mix or {})}
+    rnd = random.Random(seed)
+    authors = make_users(users)
+    timestamp = 1660000000000
+    messages = []
+    for n in range(count):
+        timestamp += 1000 * rnd.choice([5, 30, 60, 600])
+        author = rnd.choice(authors)
+        content = " ".join(rnd.choice(words) for _ in range(rnd.randint(3, 20)))
+        if rnd.random() < mix["mention"]:
+            target = rnd.choice(authors)
+            content += rnd.choice(
+                [f" <@{target['id']}>", f" <#{CHANNEL_ID}>", f" <@&{ROLE_ID}>", " **important**"]
+            )
+        if rnd.random() < mix["emoji"]:
+            content += " " + "".join(rnd.choice(emoji) for _ in range(rnd.randint(1, 3)))
+        if rnd.random() < mix["code"]:
+            content += "\n```py\nfor i in range(10):\n    print(i)\n```"
+
+        message = {
+            "id": snowflake(timestamp, n % 4096),
+            "channel_id": str(CHANNEL_ID),
+            "guild_id": str(GUILD_ID),
+            "author": author,
+            "content": content,
+            "timestamp": datetime.fromtimestamp(timestamp / 1000, timezone.utc).isoformat(),
+            "edited_timestamp": None,
+            "type": 0,
+            "embeds": [],
+            "attachments": [],
+            "reactions": [],
+            "components": [],
+            "mentions": [],
+            "mention_roles": [],
+            "pinned": False,
+            "tts": False,
+            "mention_everyone": False,
+        }
+        if messages and rnd.random() < mix["reply"]:
+            reference = rnd.choice(messages[-50:])
+            message["referenced_message"] = reference
+            message["message_reference"] = {
+                "message_id": reference["id"],
+                "channel_id": str(CHANNEL_ID),
+            }
+        if rnd.random() < mix["embed"]:
+            message["embeds"] = [
+                {
+                    "title": "Ticket " + rnd.choice(words),
+                    "description": "Press **Close** to close this ticket",
+                    "color": 0x5865F2,
+                    "fields": [
+                        {"name": rnd.choice(words), "value": rnd.choice(words), "inline": True}
+                        for _ in range(rnd.randint(0, 4))
+                    ],
+                    "footer": {"text": "Benchmark"},
+                }
+            ]
+        if rnd.random() < mix["attachment"]:
+            image = rnd.random() < 0.5
+            message["attachments"] = [
+                {
+                    "id": str(n),
+                    "filename": "image.png" if image else "log.txt",
+                    "size": rnd.randint(100, 5000000),
+                    "url": f"https://cdn.discordapp.com/attachments/{CHANNEL_ID}/{n}/"
+                    + ("image.png" if image else "log.txt"),
+                    "proxy_url": f"https://media.discordapp.net/attachments/{CHANNEL_ID}/{n}/"
+                    + ("image.png" if image else "log.txt"),
+                    "content_type": "image/png" if image else "text/plain",
+                }
+            ]
+        if rnd.random() < mix["components"]:
+            message["components"] = [
+                {
+                    "type": 1,
+                    "components": [
+                        {"type": 2, "style": 4, "label": "Close", "custom_id": "close"},
+                        {"type": 2, "style": 2, "label": "Claim", "custom_id": "claim"},
+                    ],
+                }
+            ]
+        if rnd.random() < mix["reaction"]:
+            message["reactions"] = [
+                {"count": rnd.randint(1, 9), "me": False, "emoji": {"id": None, "name": e}}
+                for e in rnd.sample(emoji, rnd.randint(1, 3))
+            ]
+        messages.append(message)
+    return messages
@@ -1 +1,11 @@
+from .archive import Archive
+from .assets import AssetBundle, bundle_transcript
+from .cache import SqliteBackend, set_backend
+from .capture import capture_transcript, load_capture, render_capture
+from .fragments import FragmentCache
+from .incremental import IncrementalState, export_incremental, load_manifest
+from .live import LiveTranscripts
+from .metrics import MetricsRegistry, registry
+from .offsets import OffsetIndex, build_offset_index
+from .stats import ExportStats
 from .transcript import *
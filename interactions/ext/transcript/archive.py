@@ -0,0 +1,219 @@
+import json
+import sqlite3
+import time
+
+from .search import _embed_texts
+
+_schema = """
+CREATE TABLE IF NOT EXISTS channels (
+    id INTEGER PRIMARY KEY,
+    guild_id INTEGER,
+    name TEXT,
+    transcript TEXT,
+    archived_at REAL
+);
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY,
+    channel_id INTEGER NOT NULL,
+    guild_id INTEGER,
+    author_id INTEGER,
+    author TEXT,
+    time REAL,
+    edited REAL,
+    content TEXT,
+    embeds TEXT,
+    attachments TEXT
+);
+CREATE INDEX IF NOT EXISTS messages_channel ON messages (channel_id, id);
+CREATE INDEX IF NOT EXISTS messages_author ON messages (author_id, id);
+CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+    content, embeds, author, attachments, content='messages', content_rowid='id'
+);
+CREATE TRIGGER IF NOT EXISTS messages_insert AFTER INSERT ON messages BEGIN
+    INSERT INTO messages_fts (rowid, content, embeds, author, attachments)
+    VALUES (new.id, new.content, new.embeds, new.author, new.attachments);
+END;
+CREATE TRIGGER IF NOT EXISTS messages_delete AFTER DELETE ON messages BEGIN
+    INSERT INTO messages_fts (messages_fts, rowid, content, embeds, author, attachments)
+    VALUES ('delete', old.id, old.content, old.embeds, old.author, old.attachments);
+END;
+CREATE TRIGGER IF NOT EXISTS messages_update AFTER UPDATE ON messages BEGIN
+    INSERT INTO messages_fts (messages_fts, rowid, content, embeds, author, attachments)
+    VALUES ('delete', old.id, old.content, old.embeds, old.author, old.attachments);
+    INSERT INTO messages_fts (rowid, content, embeds, author, attachments)
+    VALUES (new.id, new.content, new.embeds, new.author, new.attachments);
+END;
+"""
+
+_upsert = """
+INSERT INTO messages (
+    id, channel_id, guild_id, author_id, author, time, edited, content, embeds, attachments
+) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (id) DO UPDATE SET
+    author = excluded.author,
+    edited = excluded.edited,
+    content = excluded.content,
+    embeds = excluded.embeds,
+    attachments = excluded.attachments
+"""
+
+
+def _message_row(i, channel_id, guild_id):
+    return (
+        int(i.id),
+        channel_id,
+        guild_id,
+        int(i.author.id),
+        i.author.username + "#" + i.author.discriminator,
+        i.id.timestamp.timestamp(),
+        i.edited_timestamp.timestamp() if i.edited_timestamp else None,
+        i.content or "",
+        "\n".join(t for t in _embed_texts(i) if t),
+        json.dumps([{"filename": a.filename, "url": a.url} for a in i.attachments or []]),
+    )
+
+
+class Archive:
+    """
+    Archives exported messages in a sqlite database with a full text index, so the
+    messages of every exported channel can be searched at once.
+
+    Messages are written in batches of ``batch_size``, each in a single transaction, and
+    the database is in WAL mode so searches are not blocked by an export writing to it.
+    Archiving a message again, for example after it was edited, updates it in place.
+    """
+
+    def __init__(self, path, batch_size=500):
+        """
+        :param path: The path of the database, it is created if it does not exist
+        :param batch_size: The number of messages written per transaction
+        """
+        self.path = path
+        self.batch_size = batch_size
+
+        self._db = sqlite3.connect(path, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(_schema)
+        self._rows = []
+
+    def add_channel(self, channel, guild_id=None, transcript=None):
+        """
+        Records an exported channel.
+
+        :param channel: The channel
+        :param guild_id: The id of the guild of the channel, taken from the channel if not given
+        :param transcript: Where the transcript of the channel is kept, such as a path or URL, if anywhere
+        """
+        guild_id = guild_id or channel.guild_id
+        with self._db:
+            self._db.execute(
+                "INSERT INTO channels (id, guild_id, name, transcript, archived_at) "
+                "VALUES (?, ?, ?, ?, ?) ON CONFLICT (id) DO UPDATE SET "
+                "name = excluded.name, archived_at = excluded.archived_at, "
+                "transcript = COALESCE(excluded.transcript, transcript)",
+                (
+                    int(channel.id),
+                    int(guild_id) if guild_id else None,
+                    channel.name,
+                    transcript,
+                    time.time(),
+                ),
+            )
+
+    def add(self, messages, channel, guild_id=None):
+        """
+        Adds messages of a channel to the archive.
+
+        :param messages: The messages
+        :param channel: The channel the messages are from
+        :param guild_id: The id of the guild of the channel, taken from the channel if not given
+        """
+        guild_id = guild_id or channel.guild_id
+        guild_id = int(guild_id) if guild_id else None
+        for i in messages:
+            self._rows.append(_message_row(i, int(channel.id), guild_id))
+            if len(self._rows) >= self.batch_size:
+                self.flush()
+
+    def flush(self):
+        """
+        Writes the pending messages in a single transaction.
+        """
+        if not self._rows:
+            return
+        with self._db:
+            self._db.executemany(_upsert, self._rows)
+        self._rows = []
+
+    def search(self, query, channel_id=None, author_id=None, after=None, before=None, limit=100):
+        """
+        Searches the archived messages.
+
+        :param query: An FTS5 query, such as ``refund`` or ``"order number" AND author:user1``
+        :param channel_id: Only search the messages of this channel
+        :param author_id: Only search the messages of this user
+        :param after: Only search the messages sent after this unix time
+        :param before: Only search the messages sent before this unix time
+        :param limit: The maximum number of results
+        :return: A list of dicts with the id, channel_id, channel, transcript, author, time and snippet of the matching messages, best match first
+        """
+        self.flush()
+        sql = (
+            "SELECT m.id, m.channel_id, c.name, c.transcript, m.author, m.time, "
+            "snippet(messages_fts, -1, '[', ']', '...', 12) "
+            "FROM messages_fts JOIN messages m ON m.id = messages_fts.rowid "
+            "LEFT JOIN channels c ON c.id = m.channel_id "
+            "WHERE messages_fts MATCH ?"
+        )
+        params = [query]
+        for condition, value in (
+            ("m.channel_id = ?", channel_id),
+            ("m.author_id = ?", author_id),
+            ("m.time > ?", after),
+            ("m.time < ?", before),
+        ):
+            if value is not None:
+                sql += " AND " + condition
+                params.append(value)
+        sql += " ORDER BY rank LIMIT ?"
+        params.append(limit)
+        return [
+            {
+                "id": row[0],
+                "channel_id": row[1],
+                "channel": row[2],
+                "transcript": row[3],
+                "author": row[4],
+                "time": row[5],
+                "snippet": row[6],
+            }
+            for row in self._db.execute(sql, params)
+        ]
+
+    def transcripts(self, query, limit=100):
+        """
+        Finds the channels with messages matching a query.
+
+        :param query: An FTS5 query
+        :param limit: The maximum number of channels
+        :return: A list of dicts with the channel_id, channel, transcript and number of matches of every channel, most matches first
+        """
+        self.flush()
+        sql = (
+            "SELECT m.channel_id, c.name, c.transcript, COUNT(*) AS matches "
+            "FROM messages_fts JOIN messages m ON m.id = messages_fts.rowid "
+            "LEFT JOIN channels c ON c.id = m.channel_id "
+            "WHERE messages_fts MATCH ? GROUP BY m.channel_id ORDER BY matches DESC LIMIT ?"
+        )
+        return [
+            {"channel_id": row[0], "channel": row[1], "transcript": row[2], "matches": row[3]}
+            for row in self._db.execute(sql, (query, limit))
+        ]
+
+    def close(self):
+        """
+        Writes the pending messages and closes the database.
+        """
+        self.flush()
+        self._db.close()
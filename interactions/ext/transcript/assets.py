@@ -0,0 +1,300 @@
+import asyncio
+import hashlib
+import mimetypes
+import os
+import re
+import tempfile
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from urllib.parse import urlparse
+
+import aiohttp
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+from .writer import SpooledWriter
+
+asset_hosts = (
+    "cdn.discordapp.com",
+    "media.discordapp.net",
+    "cdn.jsdelivr.net/gh/mahtoid/DiscordUtils",
+    "twemoji.maxcdn.com",
+)
+
+_thumbnail_executor = None
+
+
+def _shared_executor():
+    global _thumbnail_executor
+    if _thumbnail_executor is None:
+        _thumbnail_executor = ProcessPoolExecutor()
+    return _thumbnail_executor
+
+
+class AssetBundle:
+    """
+    Downloads the assets a transcript links to and packs them into a zip next to it.
+
+    Every URL is downloaded once through a single pooled session, with at most
+    ``concurrency`` downloads running at the same time. Responses are streamed to a
+    temporary directory and stored in the zip under the hash of their content, so
+    identical files behind different URLs are only stored once.
+
+    Image attachments also get a downscaled thumbnail, generated in a process pool, which
+    the transcript shows instead of the full image until it is clicked. Thumbnails need
+    Pillow to be installed and are skipped otherwise.
+    """
+
+    def __init__(
+        self,
+        session=None,
+        concurrency=8,
+        hosts=asset_hosts,
+        directory="assets",
+        thumbnail_size=(400, 300),
+        executor=None,
+    ):
+        """
+        :param session: The aiohttp session to download with, a new one is created if not given
+        :param concurrency: The maximum number of downloads running at the same time
+        :param hosts: The hosts (and path prefixes) to download assets from
+        :param directory: The directory in the zip to store the assets in
+        :param thumbnail_size: The maximum width and height of thumbnails, or None to disable them
+        :param executor: The executor to generate thumbnails in, a process pool shared by every bundle is used if not given
+        """
+        self.session = session
+        self.concurrency = concurrency
+        self.directory = directory
+        self.thumbnail_size = thumbnail_size if Image is not None else None
+        self.executor = executor
+        self.pattern = re.compile(
+            r"(chatlog__attachment-thumbnail loading=\"lazy\" src=)?(https?://(?:%s)[^\s\"'<>()]*)"
+            % "|".join(re.escape(h) for h in hosts)
+        )
+        self.paths = {}
+        self.thumbnails = {}
+
+        self._own_session = session is None
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._tasks = {}
+        self._thumbnail_tasks = {}
+        self._hashes = {}
+        self._digests = {}
+        self._thumbnail_jobs = {}
+        self._tmp = tempfile.TemporaryDirectory()
+
+    def add(self, text):
+        """
+        Schedules the download of every asset URL in the text.
+
+        :param text: The rendered html to look for asset URLs in
+        """
+        for thumbnail, url in self.pattern.findall(text):
+            if url not in self._tasks:
+                self._tasks[url] = asyncio.ensure_future(self._download(url))
+            if thumbnail and self.thumbnail_size and url not in self._thumbnail_tasks:
+                self._thumbnail_tasks[url] = asyncio.ensure_future(self._thumbnail(url))
+
+    async def _download(self, url):
+        if self.session is None:
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.concurrency)
+            )
+
+        async with self._semaphore:
+            digest = hashlib.sha256()
+            path = os.path.join(self._tmp.name, hashlib.sha1(url.encode()).hexdigest())
+            try:
+                async with self.session.get(url) as resp:
+                    if resp.status != 200:
+                        return
+                    content_type = resp.content_type
+                    with open(path, "wb") as f:
+                        async for chunk in resp.content.iter_chunked(65536):
+                            digest.update(chunk)
+                            f.write(chunk)
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                return
+
+        digest = digest.hexdigest()
+        self._digests[url] = digest
+        if digest in self._hashes:
+            os.remove(path)
+        else:
+            extension = os.path.splitext(urlparse(url).path)[1]
+            if not extension:
+                extension = mimetypes.guess_extension(content_type or "") or ""
+            self._hashes[digest] = (path, f"{self.directory}/{digest[:32]}{extension}")
+        self.paths[url] = self._hashes[digest][1]
+
+    async def _thumbnail(self, url):
+        await self._tasks[url]
+        if url not in self._digests:
+            return
+
+        digest = self._digests[url]
+        if digest not in self._thumbnail_jobs:
+            self._thumbnail_jobs[digest] = asyncio.ensure_future(self._make_thumbnail(digest))
+        result = await self._thumbnail_jobs[digest]
+        if result is not None:
+            self.thumbnails[url] = result[1]
+
+    async def _make_thumbnail(self, digest):
+        global _thumbnail_executor
+        executor = self.executor or _shared_executor()
+        path, name = self._hashes[digest]
+        thumbnail = path + ".thumbnail"
+        try:
+            made = await asyncio.get_running_loop().run_in_executor(
+                executor, make_thumbnail, path, thumbnail, self.thumbnail_size
+            )
+        except BrokenProcessPool:
+            if executor is _thumbnail_executor:
+                _thumbnail_executor = None
+            return None
+        if not made:
+            return None
+        directory, name = name.rsplit("/", 1)
+        return thumbnail, f"{directory}/thumbnails/{name}"
+
+    async def wait(self):
+        """
+        Waits for every scheduled download and thumbnail to finish.
+        The session is closed if it was created here.
+        """
+        if self._tasks:
+            await asyncio.gather(*self._tasks.values())
+        if self._thumbnail_tasks:
+            await asyncio.gather(*self._thumbnail_tasks.values())
+        if self._own_session and self.session is not None:
+            await self.session.close()
+
+    async def discard(self):
+        """
+        Cancels the pending downloads and removes the downloaded files from disk.
+        """
+        tasks = list(self._tasks.values()) + list(self._thumbnail_tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if self._own_session and self.session is not None:
+            await self.session.close()
+        self._tmp.cleanup()
+
+    def rewrite(self, text):
+        """
+        Replaces the downloaded asset URLs in the text with their path in the zip.
+
+        :param text: The rendered html
+        :return: The html pointing at the bundled assets
+        """
+        return self.pattern.sub(self._rewrite, text)
+
+    def _rewrite(self, match):
+        thumbnail, url = match.groups()
+        if thumbnail and url in self.thumbnails:
+            return thumbnail + self.thumbnails[url]
+        return (thumbnail or "") + self.paths.get(url, url)
+
+    def write(self, file, html_fp, filename):
+        """
+        Writes the rewritten transcript and the downloaded assets into a zip.
+
+        :param file: The path or file object to write the zip to
+        :param html_fp: A binary file object of the rendered html
+        :param filename: The name of the html file in the zip
+        """
+        with zipfile.ZipFile(file, "w", zipfile.ZIP_DEFLATED) as z:
+            with z.open(filename, "w") as out:
+                for line in html_fp:
+                    out.write(self.rewrite(line.decode()).encode())
+            for path, name in self._hashes.values():
+                z.write(path, name)
+            for job in self._thumbnail_jobs.values():
+                if job.result() is not None:
+                    z.write(*job.result())
+
+    async def pack(self, html_fp, filename, file=None):
+        """
+        Waits for the downloads and writes the transcript and its assets into a zip.
+        The downloaded files are removed from disk afterwards.
+
+        :param html_fp: A binary file object of the rendered html, positioned at the start
+        :param filename: The name of the html file in the zip
+        :param file: The path or file object to write the zip to, a spooled temporary file if not given
+        :return: The zip file, positioned at the start if it is a file object
+        """
+        try:
+            await self.wait()
+            if file is None:
+                file = tempfile.SpooledTemporaryFile(max_size=1024 * 1024, mode="w+b")
+            self.write(file, html_fp, filename)
+        finally:
+            self._tmp.cleanup()
+        if not isinstance(file, (str, os.PathLike)):
+            file.seek(0)
+        return file
+
+
+def make_thumbnail(path, thumbnail, size):
+    """
+    Writes a downscaled copy of an image, keeping its format.
+    Images that already fit the size and animated images are left alone.
+
+    :param path: The path of the image
+    :param thumbnail: The path to write the thumbnail to
+    :param size: The maximum width and height of the thumbnail
+    :return: Whether a thumbnail was written
+    """
+    try:
+        with Image.open(path) as image:
+            if getattr(image, "is_animated", False) or (
+                image.width <= size[0] and image.height <= size[1]
+            ):
+                return False
+            image_format = image.format
+            image.thumbnail(size)
+            image.save(thumbnail, format=image_format)
+    except Exception:
+        # Broken, unsupported or oversized images (DecompressionBombError) only lose
+        # their thumbnail
+        return False
+    return True
+
+
+class BundleWriter(SpooledWriter):
+    """
+    A SpooledWriter that schedules the download of assets as soon as they are rendered.
+    """
+
+    def __init__(self, head, footer, footer_size, separator="", max_size=1024 * 1024, bundle=None):
+        """
+        :param bundle: The AssetBundle to collect the assets into
+        """
+        self.bundle = bundle
+        super().__init__(head, footer, footer_size, separator, max_size=max_size)
+
+    def _write(self, text):
+        self.bundle.add(text)
+        super()._write(text)
+
+
+async def bundle_transcript(html_fp, filename, file=None, **kwargs):
+    """
+    Downloads the assets of a rendered html transcript and writes both into a zip.
+
+    :param html_fp: A binary file object of the rendered html
+    :param filename: The name of the html file in the zip
+    :param file: The path or file object to write the zip to, a spooled temporary file if not given
+    :param kwargs: Passed to AssetBundle
+    :return: The zip file, positioned at the start if it is a file object
+    """
+    bundle = AssetBundle(**kwargs)
+    for line in html_fp:
+        bundle.add(line.decode())
+    html_fp.seek(0)
+    return await bundle.pack(html_fp, filename, file)
@@ -1,17 +1,189 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
 from functools import wraps
 
+log = logging.getLogger(__name__)
+
 _internal_cache: dict = {}
+_backend = None
+_missing = object()
+
+
+class SqliteBackend:
+    """
+    Keeps cached results in a sqlite database, so they outlive the export and the process
+    and are shared by every process using the same file, such as the shards of a bot.
+
+    Results are kept for ``ttl`` seconds, and negative results (False or None), such as an
+    emoji image that does not exist, for ``negative_ttl`` seconds. Exports read and write
+    it in a thread, so a locked database does not block the event loop.
+    """
+
+    def __init__(self, path, ttl=7 * 24 * 3600, negative_ttl=3600):
+        """
+        :param path: The path of the database, it is created if it does not exist
+        :param ttl: The number of seconds a result is kept
+        :param negative_ttl: The number of seconds a negative result is kept
+        """
+        self.path = path
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._db = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    @property
+    def db(self):
+        """
+        The connection to the database, opened again in a forked process.
+        """
+        if self._db is None or self._pid != os.getpid():
+            self._db = sqlite3.connect(
+                self.path, timeout=30, isolation_level=None, check_same_thread=False
+            )
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS results "
+                "(key TEXT PRIMARY KEY, value TEXT NOT NULL, expires REAL NOT NULL)"
+            )
+            self._pid = os.getpid()
+        return self._db
+
+    def get(self, key, default=None):
+        """
+        :param key: The key of the result
+        :param default: What to return if there is no result or it expired
+        :return: The result
+        """
+        with self._lock:
+            row = self.db.execute(
+                "SELECT value FROM results WHERE key = ? AND expires > ?", (key, time.time())
+            ).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def set(self, key, value):
+        """
+        Stores a result, it has to be JSON serializable.
+
+        :param key: The key of the result
+        :param value: The result
+        """
+        ttl = self.ttl if value else self.negative_ttl
+        with self._lock:
+            self.db.execute(
+                "INSERT OR REPLACE INTO results (key, value, expires) VALUES (?, ?, ?)",
+                (key, json.dumps(value), time.time() + ttl),
+            )
+
+    def purge(self):
+        """
+        Removes the expired results.
+        """
+        with self._lock:
+            self.db.execute("DELETE FROM results WHERE expires <= ?", (time.time(),))
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+
+def set_backend(backend):
+    """
+    Sets where the results of persisted cached functions are kept besides memory, such as
+    whether emoji images exist. The memory cache is still cleared after every export.
+
+    :param backend: A backend with get(key, default) and set(key, value) methods, such as a SqliteBackend, or None for memory only
+    """
+    global _backend
+    _backend = backend
+
+
+def get_backend():
+    """
+    :return: The backend set with set_backend, if any
+    """
+    return _backend
+
+
+async def load(key, default=None):
+    """
+    Reads a result from the backend in a thread.
+
+    :param key: The key of the result
+    :param default: What to return if there is no result, no backend or the backend fails
+    :return: The result
+    """
+    if _backend is None:
+        return default
+    try:
+        return await asyncio.get_running_loop().run_in_executor(
+            None, _backend.get, key, default
+        )
+    except Exception:
+        log.warning("Could not read %s from the cache backend", key, exc_info=True)
+        return default
+
+
+async def store(key, value):
+    """
+    Writes a result to the backend in a thread, if one is set. A failing backend only
+    loses the result.
+
+    :param key: The key of the result
+    :param value: The result
+    """
+    if _backend is None:
+        return
+    try:
+        await asyncio.get_running_loop().run_in_executor(None, _backend.set, key, value)
+    except Exception:
+        log.warning("Could not write %s to the cache backend", key, exc_info=True)
+
+
+class transient:
+    """
+    Marks the result of a cached function as only valid for now, such as the result of a
+    failed request. It is kept in memory until the end of the export, but not persisted.
+    """
+
+    def __init__(self, value):
+        """
+        :param value: The result
+        """
+        self.value = value
 
 
 def _wrap_and_store_coroutine(cache, key, coro):
     async def func():
         value = await coro
+        if isinstance(value, transient):
+            value = value.value
         cache[key] = value
         return value
 
     return func()
 
 
+async def _load_or_call(cache, key, func, args, kwargs):
+    value = await load(key, _missing)
+    if value is _missing:
+        value = await func(*args, **kwargs)
+        if isinstance(value, transient):
+            value = value.value
+        else:
+            await store(key, value)
+    cache[key] = value
+    return value
+
+
 def _wrap_new_coroutine(value):
     async def new_coroutine():
         return value
@@ -23,13 +195,15 @@ def clear_cache():
     _internal_cache.clear()
 
 
-def cache():
+def cache(ignore=(), persist=False):
     def decorator(func):
         def _make_key(args, kwargs):
             key = [f"{func.__module__}.{func.__name__}"]
             key.extend(repr(o) for o in args)
 
             for k, v in kwargs.items():
+                if k in ignore:
+                    continue
                 key.append(repr(k))
                 key.append(repr(v))
 
@@ -41,12 +215,15 @@ def cache():
             try:
                 value = _internal_cache[key]
             except KeyError:
+                if persist and _backend is not None:
+                    return _load_or_call(_internal_cache, key, func, args, kwargs)
                 value = func(*args, **kwargs)
                 return _wrap_and_store_coroutine(_internal_cache, key, value)
             else:
                 return _wrap_new_coroutine(value)
 
         wrapper.cache = _internal_cache
+        wrapper.key = lambda *args, **kwargs: _make_key(args, kwargs)
         wrapper.clear_cache = _internal_cache.clear()
         return wrapper
 
@@ -0,0 +1,183 @@
+import gzip
+import json
+import time
+from datetime import datetime
+from functools import partial
+from typing import List, Union
+
+from interactions import Channel, Message
+
+from .cache import clear_cache
+from .offsets import build_offset_index
+from .resolver import RateLimiter, Resolver, payload
+from .transcript import _budget, _transcript
+from .utils import to_snowflake
+from .writer import PartWriter
+
+capture_version = 1
+
+
+def _open(path, mode, compress=None):
+    if compress is None:
+        compress = str(path).endswith(".gz")
+    if compress:
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+async def capture_transcript(
+    channel: Channel,
+    path: str,
+    limit: int = 100,
+    compress: bool = None,
+    after: Union[datetime, int] = None,
+    before: Union[datetime, int] = None,
+    authors: List[int] = None,
+    rate_limiter: RateLimiter = None,
+    max_api_calls: int = None,
+    max_api_time: float = None,
+    offset_index: bool = False,
+) -> int:
+    """
+    Fetches the messages of a channel and everything they refer to, and writes them to a
+    capture file that render_capture turns into a transcript of any mode, without the API.
+
+    The capture is made of JSON lines: a header with the channel, a line per message,
+    oldest first, and a line with the resolved members, channels, roles, referenced
+    messages, stickers and emoji checks.
+
+    :param channel: The channel to capture
+    :param path: The path of the capture file
+    :param limit: The maximum number of messages to get, or None to get every message
+    :param compress: Whether to gzip the capture, by default only if the path ends with .gz
+    :param after: Only get the messages sent after this datetime or message id
+    :param before: Only get the messages sent before this datetime or message id
+    :param authors: Only get the messages of these users or user ids
+    :param rate_limiter: A RateLimiter to share with other exports
+    :param max_api_calls: The maximum number of API requests, mentions and references are left unresolved after that
+    :param max_api_time: The number of seconds after which mentions and references are left unresolved
+    :param offset_index: Whether to write an offset index next to the capture, to read messages with OffsetIndex (only without compression)
+    :return: The number of captured messages
+    """
+
+    if compress is None:
+        compress = str(path).endswith(".gz")
+    if offset_index and compress:
+        raise ValueError("Compressed captures can not have an offset index")
+
+    resolver = Resolver(
+        channel._client,
+        channel.guild_id,
+        limiter=rate_limiter,
+        budget=_budget(max_api_calls, max_api_time),
+    )
+    try:
+        msg = await resolver.history(
+            channel,
+            limit,
+            after=to_snowflake(after, high=True),
+            before=to_snowflake(before),
+            authors={to_snowflake(a) for a in authors} if authors else None,
+        )
+        await resolver.prefetch(msg, channel)
+        with _open(path, "w", compress) as f:
+            header = {
+                "version": capture_version,
+                "channel": payload(channel),
+                "limit": limit,
+                "captured_at": time.time(),
+            }
+            f.write(json.dumps({"capture": header}) + "\n")
+            for i in msg:
+                f.write(json.dumps({"message": payload(i)}) + "\n")
+            f.write(json.dumps({"snapshot": resolver.snapshot()}) + "\n")
+    finally:
+        await resolver.close()
+        clear_cache()
+    if offset_index:
+        build_offset_index(path)
+    return len(msg)
+
+
+def load_capture(path, compress=None):
+    """
+    Reads a capture file.
+
+    :param path: The path of the capture file
+    :param compress: Whether the capture is gzipped, by default only if the path ends with .gz
+    :return: A tuple of the header, the message payloads and the resolver snapshot
+    """
+    header, messages, snapshot = None, [], None
+    with _open(path, "r", compress) as f:
+        for line in f:
+            entry = json.loads(line)
+            if "message" in entry:
+                messages.append(entry["message"])
+            elif "capture" in entry:
+                header = entry["capture"]
+                if header["version"] != capture_version:
+                    raise ValueError("Unsupported capture version")
+            elif "snapshot" in entry:
+                snapshot = entry["snapshot"]
+    if header is None or snapshot is None:
+        raise ValueError("Incomplete capture")
+    return header, messages, snapshot
+
+
+async def render_capture(
+    path: str,
+    mode: str = "html",
+    pytz_timezone="UTC",
+    military_time: bool = False,
+    fancy_time: bool = True,
+    max_bytes: int = None,
+    after: Union[datetime, int] = None,
+    before: Union[datetime, int] = None,
+    authors: List[int] = None,
+    compress: bool = None,
+    search_index: bool = False,
+):
+    """
+    Renders a transcript from a capture file, without a client or any API request.
+    The capture can be rendered any number of times, in any mode and timezone.
+
+    :param path: The path of the capture file
+    :param mode: The mode to use for the transcript (html, json, jsonl, csv, or plain)
+    :param pytz_timezone: The timezone to use for the transcript
+    :param military_time: Whether to use military time or not
+    :param fancy_time: Whether to use fancy time or not (only with html mode)
+    :param max_bytes: Split the transcript into self-contained parts of at most this many bytes (only with html or plain mode)
+    :param after: Only render the messages sent after this datetime or message id
+    :param before: Only render the messages sent before this datetime or message id
+    :param authors: Only render the messages of these users or user ids
+    :param compress: Whether the capture is gzipped, by default only if the path ends with .gz
+    :param search_index: Whether to embed a search index of the messages with a search box (only with html mode)
+    :return: A string of the transcript, or a list of strings if max_bytes is set
+    """
+
+    if max_bytes is not None and mode not in ("html", "plain"):
+        raise ValueError("max_bytes is only supported with html or plain mode")
+
+    header, messages, snapshot = load_capture(path, compress)
+    channel = Channel(**header["channel"])
+    resolver = Resolver.from_snapshot(snapshot)
+    resolver.messages = [Message(**i) for i in messages]
+    try:
+        parts = await _transcript(
+            channel,
+            resolver,
+            partial(PartWriter, max_bytes=max_bytes),
+            header["limit"],
+            pytz_timezone,
+            military_time,
+            fancy_time,
+            mode,
+            after=after,
+            before=before,
+            authors=authors,
+            search_index=search_index,
+        )
+    finally:
+        await resolver.close()
+        clear_cache()
+    return parts if max_bytes is not None else parts[0]
@@ -29,25 +29,40 @@
 #                                                                                #
 # Github: https://github.com/glasnt/emojificate                                  #
 ##################################################################################
+import re
 import unicodedata
+from functools import lru_cache
 from grapheme import graphemes
 import emoji
 import aiohttp
 
-from .cache import cache
+from .cache import cache, transient
+from .metrics import timed
 
 
 cdn_fmt = "https://twemoji.maxcdn.com/v/latest/72x72/{codepoint}.png"
 
 
-@cache()
-async def valid_src(src):
+def _found(status):
+    # Only a missing image is a lasting answer, server errors and rate limits are retried
+    # by the next export
+    if status == 200:
+        return True
+    return False if status == 404 else transient(False)
+
+
+@cache(ignore=("session",), persist=True)
+@timed("emoji")
+async def valid_src(src, session=None):
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(src) as resp:
-                return resp.status == 200
+        if session is None:
+            async with aiohttp.ClientSession() as session:
+                async with session.get(src) as resp:
+                    return _found(resp.status)
+        async with session.get(src) as resp:
+            return _found(resp.status)
     except aiohttp.ClientConnectorError:
-        return False
+        return transient(False)
 
 
 def valid_category(char):
@@ -57,39 +72,83 @@ def valid_category(char):
         return False
 
 
-async def codepoint(codes):
+def _codepoint(codes):
     # See https://github.com/twitter/twemoji/issues/419#issuecomment-637360325
     if "200d" not in codes:
         return "-".join([c for c in codes if c != "fe0f"])
     return "-".join(codes)
 
 
-async def convert(char):
+async def codepoint(codes):
+    return _codepoint(codes)
+
+
+# A grapheme cluster never spans two ASCII characters other than CR LF, so only the runs
+# of other characters, with the character on either side, have to be segmented.
+candidate_pattern = re.compile(r"[^\x00-\x7f]+|\r\n")
+
+
+def _segments(string):
+    start = end = None
+    for match in candidate_pattern.finditer(string):
+        a, b = max(match.start() - 1, 0), min(match.end() + 1, len(string))
+        if end is not None and a <= end:
+            end = b
+            continue
+        if end is not None:
+            yield start, end
+        start, end = a, b
+    if end is not None:
+        yield start, end
+
+
+@lru_cache(maxsize=4096)
+def _emoji(char):
+    """
+    :return: The twemoji url and the name of a grapheme cluster, or None if it is kept as is
+    """
     if valid_category(char):
         name = unicodedata.name(char).title()
     else:
         if len(char) == 1:
-            return char
+            return None
         shortcode = emoji.demojize(char)
-        name = (
-            shortcode.replace(":", "")
-            .replace("_", " ")
-            .replace("selector", "")
-            .title()
-        )
-
-    src = cdn_fmt.format(
-        codepoint=await codepoint(["{cp:x}".format(cp=ord(c)) for c in char])
-    )
-
-    if await valid_src(src):
+        name = shortcode.replace(":", "").replace("_", " ").replace("selector", "").title()
+    src = cdn_fmt.format(codepoint=_codepoint(["{cp:x}".format(cp=ord(c)) for c in char]))
+    return src, name
+
+
+async def convert(char, session=None):
+    found = _emoji(char)
+    if found is None:
+        return char
+    src, name = found
+
+    if await valid_src(src, session=session):
         return f'<img class="emoji emoji--small" src="{src}" alt="{char}" title="{name}" aria-label="Emoji: {name}">'
     else:
         return char
 
 
-async def convert_emoji(string):
+async def emoji_sources(string):
+    sources = []
+    for start, end in _segments(string):
+        for ch in graphemes(string[start:end]):
+            found = _emoji(ch)
+            if found is not None:
+                sources.append(found[0])
+    return sources
+
+
+async def convert_emoji(string, session=None):
+    if not isinstance(string, str):
+        string = "".join(string)
     x = []
-    for ch in graphemes(string):
-        x.append(await convert(ch))
+    last = 0
+    for start, end in _segments(string):
+        x.append(string[last:start])
+        for ch in graphemes(string[start:end]):
+            x.append(await convert(ch, session=session))
+        last = end
+    x.append(string[last:])
     return "".join(x)
@@ -0,0 +1,164 @@
+import hashlib
+import os
+import sqlite3
+import time
+
+fragment_version = 1
+dir_path = os.path.abspath((os.path.dirname(os.path.realpath(__file__))))
+_template_version = None
+
+
+def template_version():
+    """
+    Gets a hash of every html template together with fragment_version, so fragments
+    rendered with other templates are never reused.
+
+    :return: The hash as a hex string
+    """
+    global _template_version
+    if _template_version is None:
+        digest = hashlib.sha1(str(fragment_version).encode())
+        for root, dirs, files in sorted(os.walk(dir_path + "/html")):
+            dirs.sort()
+            for name in sorted(files):
+                digest.update(name.encode())
+                with open(os.path.join(root, name), "rb") as f:
+                    digest.update(f.read())
+        _template_version = digest.hexdigest()
+    return _template_version
+
+
+class FragmentCache:
+    """
+    Keeps the rendered output of every message in a sqlite database, so exports of the
+    same channel only render the messages that were not exported before.
+
+    Fragments are keyed by the message id, its edit timestamp and reactions, the name and
+    avatar of its author, the edit timestamp of the message it replies to, the render
+    options and the template version, so edited messages, renamed users and changed
+    options never hit a stale entry. The database can be shared by several processes.
+    Once it holds more than ``max_bytes`` of fragments, the least recently used ones are
+    removed.
+    """
+
+    def __init__(self, path, max_bytes=256 * 1024 * 1024, commit_every=500):
+        """
+        :param path: The path of the database, it is created if it does not exist
+        :param max_bytes: The maximum size of the stored fragments in bytes
+        :param commit_every: The number of new fragments after which they are committed
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.commit_every = commit_every
+        self.hits = 0
+        self.misses = 0
+
+        self._db = sqlite3.connect(path, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS fragments "
+            "(key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, used REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS fragments_used ON fragments (used)")
+        self._db.commit()
+        self._size = self._stored_size()
+        self._pending = 0
+        self._used = set()
+
+    def _stored_size(self):
+        return self._db.execute("SELECT COALESCE(SUM(size), 0) FROM fragments").fetchone()[0]
+
+    @staticmethod
+    def key(message, kind, *options):
+        """
+        Builds the key of the fragment of a message.
+
+        :param message: The message
+        :param kind: The kind of fragment, such as "html", "plain" or "record"
+        :param options: The render options the fragment depends on
+        :return: The key
+        """
+        reactions = [(str(r.emoji), r.count) for r in message.reactions or []]
+        author = message._json.get("author") or {}
+        author = tuple(author.get(k) for k in ("username", "discriminator", "avatar", "bot"))
+        reference = message.referenced_message
+        if reference:
+            reference = (reference._json.get("id"), reference._json.get("edited_timestamp"))
+        digest = hashlib.sha1(
+            repr((kind, options, reactions, author, reference, template_version())).encode()
+        ).hexdigest()
+        return f"{message.id}:{message.edited_timestamp or ''}:{digest}"
+
+    def get(self, key):
+        """
+        :param key: The key of the fragment
+        :return: The fragment, or None if it is not cached
+        """
+        row = self._db.execute("SELECT value FROM fragments WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._used.add(key)
+        return row[0]
+
+    def put(self, key, value):
+        """
+        Stores a fragment.
+
+        :param key: The key of the fragment
+        :param value: The fragment
+        """
+        size = len(key) + len(value.encode())
+        self._db.execute(
+            "INSERT OR REPLACE INTO fragments (key, value, size, used) VALUES (?, ?, ?, ?)",
+            (key, value, size, time.time()),
+        )
+        self._size += size
+        self._pending += 1
+        if self._pending >= self.commit_every:
+            self.flush()
+
+    def flush(self):
+        """
+        Commits the new fragments and the use of the cached ones, and removes the least
+        recently used fragments if the database grew past max_bytes.
+        """
+        if self._used:
+            now = time.time()
+            self._db.executemany(
+                "UPDATE fragments SET used = ? WHERE key = ?", ((now, k) for k in self._used)
+            )
+            self._used.clear()
+        if self._size > self.max_bytes:
+            self._size = self._stored_size()
+            while self._size > self.max_bytes * 0.9:
+                oldest = self._db.execute(
+                    "SELECT key, size FROM fragments ORDER BY used LIMIT 100"
+                ).fetchall()
+                if not oldest:
+                    break
+                self._db.executemany(
+                    "DELETE FROM fragments WHERE key = ?", ((k,) for k, size in oldest)
+                )
+                self._size -= sum(size for k, size in oldest)
+        self._db.commit()
+        self._pending = 0
+
+    def clear(self):
+        """
+        Removes every fragment.
+        """
+        self._db.execute("DELETE FROM fragments")
+        self._db.commit()
+        self._size = 0
+        self._pending = 0
+        self._used.clear()
+
+    def close(self):
+        """
+        Commits and closes the database.
+        """
+        self.flush()
+        self._db.close()
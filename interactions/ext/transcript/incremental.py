@@ -0,0 +1,210 @@
+import json
+import os
+from datetime import datetime
+from functools import partial
+
+from interactions import Channel, Message
+
+from .cache import clear_cache
+from .offsets import build_offset_index
+from .resolver import RateLimiter, Resolver, payload
+from .stats import ExportStats
+from .transcript import _transcript
+from .writer import AppendWriter
+
+manifest_version = 1
+manifest_name = "manifest.json"
+page_names = {
+    "html": "transcript-{}.html",
+    "plain": "transcript.txt",
+    "jsonl": "transcript.jsonl",
+}
+
+
+class IncrementalState:
+    """
+    What an export needs to know about the earlier exports it continues.
+    """
+
+    def __init__(self, previous=None, metadata=None):
+        """
+        :param previous: The last message exported so far, if any
+        :param metadata: A dict of user id to the participant details shown in the html footer
+        """
+        self.previous = previous
+        self.metadata = {} if metadata is None else metadata
+        self.continued = False
+        self.last = None
+
+
+def load_manifest(directory):
+    """
+    Reads the manifest of an incremental export.
+
+    :param directory: The directory of the export
+    :return: The manifest, or None if nothing was exported there yet
+    """
+    try:
+        with open(os.path.join(directory, manifest_name), "r") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def _save_manifest(directory, manifest):
+    path = os.path.join(directory, manifest_name)
+    with open(path + ".tmp", "w") as f:
+        json.dump(manifest, f)
+    os.replace(path + ".tmp", path)
+
+
+def _dump_metadata(metadata):
+    return {
+        user_id: [
+            username,
+            created_at.isoformat(),
+            bot,
+            str(avatar),
+            joined_at.isoformat() if joined_at else None,
+            display_name,
+        ]
+        for user_id, (
+            username,
+            created_at,
+            bot,
+            avatar,
+            joined_at,
+            display_name,
+        ) in metadata.items()
+    }
+
+
+def _load_metadata(metadata):
+    return {
+        user_id: [
+            username,
+            datetime.fromisoformat(created_at),
+            bot,
+            avatar,
+            datetime.fromisoformat(joined_at) if joined_at else None,
+            display_name,
+        ]
+        for user_id, (
+            username,
+            created_at,
+            bot,
+            avatar,
+            joined_at,
+            display_name,
+        ) in metadata.items()
+    }
+
+
+async def export_incremental(
+    channel: Channel,
+    directory: str,
+    mode: str = "html",
+    pytz_timezone="UTC",
+    military_time: bool = False,
+    fancy_time: bool = True,
+    max_bytes: int = 5 * 1024 * 1024,
+    after=None,
+    stats: ExportStats = None,
+    rate_limiter: RateLimiter = None,
+    offset_index: bool = False,
+) -> dict:
+    """
+    Exports the messages sent since the last export of the channel into a directory, and
+    appends them to the files written before.
+
+    The id of the last exported message is kept in a manifest next to the files, with the
+    participant counts and the state of the last message group, so only newer messages are
+    fetched and a group left open by the previous run is continued. Html transcripts are
+    split into pages of at most max_bytes, only the last page is ever rewritten.
+
+    :param channel: The channel to export
+    :param directory: The directory to write the transcript and its manifest to
+    :param mode: The mode to use for the transcript (html, jsonl, or plain)
+    :param pytz_timezone: The timezone to use for the transcript
+    :param military_time: Whether to use military time or not
+    :param fancy_time: Whether to use fancy time or not (only with html mode)
+    :param max_bytes: The size in bytes after which a new html page is started
+    :param after: Where to start the first export, a datetime or message id, from the first message if not given
+    :param stats: An ExportStats to record the stats of this run in
+    :param rate_limiter: A RateLimiter to share with other exports
+    :param offset_index: Whether to keep an offset index next to the transcript, to read messages with OffsetIndex (only with jsonl mode)
+    :return: The manifest
+    """
+
+    if mode not in page_names:
+        raise ValueError("Incremental exports are only supported with html, jsonl or plain mode")
+    if offset_index and mode != "jsonl":
+        raise ValueError("offset_index is only supported with jsonl mode")
+
+    os.makedirs(directory, exist_ok=True)
+    manifest = load_manifest(directory)
+    if manifest is None:
+        manifest = {
+            "version": manifest_version,
+            "channel_id": str(channel.id),
+            "mode": mode,
+            "last_message_id": None,
+            "messages": 0,
+            "participants": {},
+            "metadata": {},
+            "previous": None,
+            "pages": [],
+        }
+    elif manifest["version"] != manifest_version:
+        raise ValueError("Unsupported manifest version")
+    elif manifest["channel_id"] != str(channel.id) or manifest["mode"] != mode:
+        raise ValueError("The directory holds an export of another channel or mode")
+
+    state = IncrementalState(
+        Message(**manifest["previous"]) if manifest["previous"] else None,
+        _load_metadata(manifest["metadata"]),
+    )
+    writer = partial(
+        AppendWriter,
+        pages=manifest["pages"],
+        directory=directory,
+        name=page_names[mode],
+        max_bytes=max_bytes if mode == "html" else None,
+        state=state,
+    )
+    if manifest["last_message_id"] is not None:
+        after = int(manifest["last_message_id"])
+
+    resolver = Resolver(channel._client, channel.guild_id, limiter=rate_limiter)
+    try:
+        await _transcript(
+            channel,
+            resolver,
+            writer,
+            None,
+            pytz_timezone,
+            military_time,
+            fancy_time,
+            mode,
+            stats=stats,
+            after=after,
+            state=state,
+        )
+    finally:
+        await resolver.close()
+        clear_cache()
+
+    if state.last is not None:
+        participants = {}
+        for page in manifest["pages"]:
+            for user_id, count in page["counts"].items():
+                participants[user_id] = participants.get(user_id, 0) + count
+        manifest["last_message_id"] = str(state.last.id)
+        manifest["messages"] = sum(page["messages"] for page in manifest["pages"])
+        manifest["participants"] = participants
+        manifest["metadata"] = _dump_metadata(state.metadata)
+        manifest["previous"] = payload(state.last)
+        _save_manifest(directory, manifest)
+    if offset_index and manifest["pages"]:
+        build_offset_index(os.path.join(directory, page_names[mode]))
+    return manifest
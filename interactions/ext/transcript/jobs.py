@@ -0,0 +1,198 @@
+import asyncio
+import itertools
+import logging
+
+from .resolver import RateLimiter
+
+log = logging.getLogger(__name__)
+
+
+class Priority:
+    HIGH = 0
+    NORMAL = 1
+    LOW = 2
+
+
+class ExportJob:
+    """
+    A handle to an export submitted to a JobQueue.
+
+    ``status`` is one of "pending", "running", "done", "failed" or "cancelled", and
+    ``fetched`` and ``rendered`` count the messages the export has got through so far.
+    Await the job to get the transcript.
+    """
+
+    def __init__(self, id, channel, priority, export, kwargs, callbacks):
+        self.id = id
+        self.channel = channel
+        self.priority = priority
+        self.status = "pending"
+        self.fetched = 0
+        self.rendered = 0
+
+        self._export = export
+        self._kwargs = kwargs
+        self._callbacks = list(callbacks)
+        self._future = asyncio.get_running_loop().create_future()
+        self._future.add_done_callback(self._log_failure)
+        self._task = None
+
+    def __await__(self):
+        return asyncio.shield(self._future).__await__()
+
+    def __repr__(self):
+        return (
+            f"<ExportJob id={self.id} channel={self.channel.id} status={self.status} "
+            f"fetched={self.fetched} rendered={self.rendered}>"
+        )
+
+    def add_callback(self, callback):
+        """
+        Adds a callback that is called with the job whenever its progress or status changes.
+
+        :param callback: A callable taking the job
+        """
+        self._callbacks.append(callback)
+
+    def done(self):
+        """
+        :return: Whether the job has finished, failed or was cancelled
+        """
+        return self._future.done()
+
+    def cancel(self):
+        """
+        Cancels the job, whether it is still waiting or already running.
+
+        :return: Whether the job was cancelled, False if it had already finished
+        """
+        if self.done():
+            return False
+        if self._task is not None:
+            self._task.cancel()
+        else:
+            self._finish("cancelled")
+        return True
+
+    async def _run(self):
+        self.status = "running"
+        self._notify()
+        try:
+            result = await self._export(self.channel, progress=self._progress, **self._kwargs)
+        except asyncio.CancelledError:
+            self._finish("cancelled")
+        except Exception as e:
+            self._finish("failed", exception=e)
+        else:
+            self._finish("done", result=result)
+
+    def _progress(self, fetched, rendered):
+        self.fetched = fetched
+        self.rendered = rendered
+        self._notify()
+
+    def _finish(self, status, result=None, exception=None):
+        self.status = status
+        if status == "cancelled":
+            self._future.cancel()
+        elif exception is not None:
+            self._future.set_exception(exception)
+        else:
+            self._future.set_result(result)
+        self._notify()
+
+    def _log_failure(self, future):
+        # Retrieving the exception here keeps asyncio from reporting it as never retrieved
+        # when nobody awaits the job
+        if not future.cancelled() and future.exception() is not None:
+            log.warning(
+                "Export job %s of channel %s failed",
+                self.id,
+                self.channel.id,
+                exc_info=future.exception(),
+            )
+
+    def _notify(self):
+        for callback in self._callbacks:
+            callback(self)
+
+
+class JobQueue:
+    """
+    Runs exports in the background with a bounded number of workers.
+
+    Jobs with a lower priority number run first, and jobs with the same priority run in
+    the order they were submitted. All jobs share one RateLimiter if a rate is given.
+    """
+
+    def __init__(self, workers=2, rate=None):
+        """
+        :param workers: The maximum number of exports running at the same time
+        :param rate: The maximum number of API requests per second across all jobs, unlimited if not given
+        """
+        self.workers = workers
+        self.rate = rate
+        self.jobs = {}
+
+        self._ids = itertools.count(1)
+        self._queue = None
+        self._workers = []
+        self._limiter = None
+
+    def submit(self, channel, export, priority=Priority.NORMAL, progress=None, **kwargs):
+        """
+        Queues an export.
+
+        :param channel: The channel to export
+        :param export: The export function, get_transcript or get_transcript_file
+        :param priority: The priority of the job, lower runs first
+        :param progress: A callable taking the job, called whenever its progress or status changes
+        :param kwargs: Passed to the export function
+        :return: The ExportJob
+        """
+        if self._queue is None:
+            self._start()
+        if self._limiter is not None:
+            kwargs.setdefault("rate_limiter", self._limiter)
+
+        job = ExportJob(
+            next(self._ids), channel, priority, export, kwargs, [progress] if progress else []
+        )
+        self.jobs[job.id] = job
+        job._future.add_done_callback(lambda _: self.jobs.pop(job.id, None))
+        self._queue.put_nowait((priority, job.id, job))
+        return job
+
+    def _start(self):
+        self._queue = asyncio.PriorityQueue()
+        self._limiter = RateLimiter(self.rate) if self.rate else None
+        self._workers = [asyncio.ensure_future(self._work()) for _ in range(self.workers)]
+
+    async def _work(self):
+        while True:
+            _, _, job = await self._queue.get()
+            if job.done():
+                continue
+            job._task = asyncio.ensure_future(job._run())
+            await asyncio.wait([job._task])
+            if not job.done():
+                job._finish("cancelled")
+
+    async def close(self):
+        """
+        Cancels every pending and running job and stops the workers.
+        """
+        jobs = list(self.jobs.values())
+        for job in jobs:
+            job.cancel()
+        await asyncio.gather(
+            *(job._task for job in jobs if job._task is not None), return_exceptions=True
+        )
+        for job in jobs:
+            if not job.done():
+                job._finish("cancelled")
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        self._queue = None
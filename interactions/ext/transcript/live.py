@@ -0,0 +1,356 @@
+import asyncio
+import json
+import os
+import sqlite3
+from collections import OrderedDict
+from functools import partial
+
+import aiohttp
+
+from interactions import Channel, Message
+
+from .cache import clear_cache
+from .fragments import FragmentCache
+from .resolver import Resolver, payload
+from .transcript import _prerender, _transcript
+from .writer import PartWriter
+
+
+class _LiveChannel:
+    def __init__(self, channel, mode, pytz_timezone, military_time, fancy_time):
+        self.channel = channel
+        self.mode = mode
+        self.pytz_timezone = pytz_timezone
+        self.military_time = military_time
+        self.fancy_time = fancy_time
+        self.messages = {}
+        self.last = None
+        self.resolver = None
+        self.lock = asyncio.Lock()
+
+
+class LiveTranscripts:
+    """
+    Keeps the transcripts of watched channels up to date from gateway events, so a
+    transcript is ready as soon as it is asked for.
+
+    A watched channel is fetched once, then every message created, edited or deleted in
+    it updates its state, and the message is rendered into the fragment cache right away.
+    Finishing the transcript then only puts the rendered fragments together.
+
+    At most ``max_messages`` messages are kept in memory across all watched channels,
+    past that the messages of the least recently active channels are moved to a sqlite
+    database in ``directory``, next to the fragment cache.
+    """
+
+    def __init__(self, directory, max_messages=10000, fragment_cache=None):
+        """
+        :param directory: The directory to keep the evicted messages and the fragment cache in
+        :param max_messages: The maximum number of messages kept in memory
+        :param fragment_cache: The FragmentCache to render the messages into, one is opened in directory if not given
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.max_messages = max_messages
+        self.fragment_cache = fragment_cache or FragmentCache(
+            os.path.join(directory, "fragments.db")
+        )
+        self.channels = OrderedDict()
+
+        self._db = sqlite3.connect(os.path.join(directory, "live.db"), timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS messages (channel_id INTEGER NOT NULL, "
+            "id INTEGER NOT NULL, payload TEXT NOT NULL, PRIMARY KEY (channel_id, id))"
+        )
+        self._db.commit()
+        self._session = None
+        self._size = 0
+
+    def _resolver(self, state):
+        if state.resolver is None:
+            if self._session is None:
+                self._session = aiohttp.ClientSession()
+            state.resolver = Resolver(
+                state.channel._client, state.channel.guild_id, session=self._session
+            )
+        return state.resolver
+
+    def _stored(self, channel_id, message_id):
+        row = self._db.execute(
+            "SELECT payload FROM messages WHERE channel_id = ? AND id = ?",
+            (channel_id, message_id),
+        ).fetchone()
+        return Message(**json.loads(row[0])) if row else None
+
+    def _get(self, state, message_id):
+        i = state.messages.get(message_id)
+        if i is None:
+            i = self._stored(int(state.channel.id), message_id)
+        return i
+
+    def _neighbour(self, state, message_id, after=False):
+        ids = [k for k in state.messages if (k > message_id if after else k < message_id)]
+        best = (min if after else max)(ids) if ids else None
+        sql = (
+            "SELECT MIN(id) FROM messages WHERE channel_id = ? AND id > ?"
+            if after
+            else "SELECT MAX(id) FROM messages WHERE channel_id = ? AND id < ?"
+        )
+        row = self._db.execute(sql, (int(state.channel.id), message_id)).fetchone()
+        if row[0] is not None and (best is None or (row[0] < best if after else row[0] > best)):
+            best = row[0]
+        return self._get(state, best) if best is not None else None
+
+    async def _render(self, state, i, previous):
+        resolver = self._resolver(state)
+        if i.referenced_message:
+            reference = int(i.referenced_message._json["id"])
+            key = ("message", int(state.channel.id), reference)
+            if key not in resolver.cache:
+                stored = self._get(state, reference)
+                if stored is not None:
+                    resolver.cache[key] = stored
+        await _prerender(
+            self.fragment_cache,
+            resolver,
+            i,
+            previous,
+            state.channel,
+            state.mode,
+            state.pytz_timezone,
+            state.military_time,
+        )
+
+    def _put(self, state, i):
+        if int(i.id) not in state.messages:
+            self._size += 1
+        state.messages[int(i.id)] = i
+        self._resolver(state).cache[("message", int(state.channel.id), int(i.id))] = i
+        if state.last is None or int(i.id) >= int(state.last.id):
+            state.last = i
+
+    async def _update_replies(self, state, message_id, message):
+        channel_id = int(state.channel.id)
+        self._resolver(state).cache[("message", channel_id, message_id)] = message
+        replies = [
+            i
+            for i in state.messages.values()
+            if i.referenced_message and int(i.referenced_message._json["id"]) == message_id
+        ]
+        for (reply_id,) in self._db.execute(
+            "SELECT id FROM messages WHERE channel_id = ? "
+            "AND json_extract(payload, '$.referenced_message.id') = ?",
+            (channel_id, str(message_id)),
+        ).fetchall():
+            if reply_id not in state.messages:
+                replies.append(self._stored(channel_id, reply_id))
+        for reply in replies:
+            reply = Message(
+                **{**payload(reply), "referenced_message": payload(message) if message else None}
+            )
+            self._put(state, reply)
+            await self._render(state, reply, self._neighbour(state, int(reply.id)))
+
+    def _evict(self):
+        for channel_id, state in list(self.channels.items()):
+            if self._size <= self.max_messages:
+                break
+            if not state.messages:
+                continue
+            with self._db:
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO messages (channel_id, id, payload) VALUES (?, ?, ?)",
+                    (
+                        (channel_id, message_id, json.dumps(payload(i)))
+                        for message_id, i in state.messages.items()
+                    ),
+                )
+            self._size -= len(state.messages)
+            state.messages = {}
+            state.resolver = None
+
+    async def watch(
+        self,
+        channel: Channel,
+        mode: str = "html",
+        pytz_timezone="UTC",
+        military_time: bool = False,
+        fancy_time: bool = True,
+    ):
+        """
+        Starts keeping the transcript of a channel up to date. The messages already in the
+        channel are fetched and rendered first.
+
+        :param channel: The channel to watch
+        :param mode: The mode of the transcript (html, json, jsonl, csv, or plain)
+        :param pytz_timezone: The timezone to use for the transcript
+        :param military_time: Whether to use military time or not
+        :param fancy_time: Whether to use fancy time or not (only with html mode)
+        """
+        channel_id = int(channel.id)
+        if channel_id in self.channels:
+            return
+        state = _LiveChannel(channel, mode, pytz_timezone, military_time, fancy_time)
+        self.channels[channel_id] = state
+        async with state.lock:
+            try:
+                with self._db:
+                    self._db.execute("DELETE FROM messages WHERE channel_id = ?", (channel_id,))
+                history = await self._resolver(state).history(channel, None)
+                previous = None
+                for i in history:
+                    self._put(state, i)
+                    await self._render(state, i, previous)
+                    previous = i
+            except BaseException:
+                self.unwatch(channel)
+                raise
+            self.fragment_cache.flush()
+            self._evict()
+
+    def watching(self, channel):
+        """
+        :param channel: A channel or channel id
+        :return: Whether the channel is watched
+        """
+        return int(getattr(channel, "id", channel)) in self.channels
+
+    async def message_create(self, message: Message):
+        """
+        Adds a message to the transcript of its channel, if it is watched.
+
+        :param message: The created message
+        """
+        state = self.channels.get(int(message.channel_id))
+        if state is None:
+            return
+        self.channels.move_to_end(int(message.channel_id))
+        async with state.lock:
+            if state.last is None or int(message.id) > int(state.last.id):
+                previous = state.last
+            else:
+                previous = self._neighbour(state, int(message.id))
+            self._put(state, message)
+            await self._render(state, message, previous)
+            self._evict()
+
+    async def message_update(self, message: Message):
+        """
+        Applies an edit to the transcript of its channel, if it is watched.
+
+        :param message: The edited message, only the changed fields have to be set
+        """
+        state = self.channels.get(int(message.channel_id))
+        if state is None:
+            return
+        self.channels.move_to_end(int(message.channel_id))
+        async with state.lock:
+            i = self._get(state, int(message.id))
+            if i is not None:
+                i = Message(**{**payload(i), **payload(message)})
+            elif message.author is not None:
+                i = message
+            else:
+                return
+            self._put(state, i)
+            await self._render(state, i, self._neighbour(state, int(i.id)))
+            await self._update_replies(state, int(i.id), i)
+            self._evict()
+
+    async def message_delete(self, channel_id, message_ids):
+        """
+        Removes messages from the transcript of their channel, if it is watched.
+
+        :param channel_id: The id of the channel of the messages
+        :param message_ids: The ids of the deleted messages
+        """
+        state = self.channels.get(int(channel_id))
+        if state is None:
+            return
+        async with state.lock:
+            for message_id in map(int, message_ids):
+                if state.messages.pop(message_id, None) is not None:
+                    self._size -= 1
+                with self._db:
+                    self._db.execute(
+                        "DELETE FROM messages WHERE channel_id = ? AND id = ?",
+                        (int(channel_id), message_id),
+                    )
+                if state.last is not None and int(state.last.id) == message_id:
+                    state.last = self._neighbour(state, message_id)
+                await self._update_replies(state, message_id, None)
+                following = self._neighbour(state, message_id, after=True)
+                if following is not None:
+                    await self._render(state, following, self._neighbour(state, int(following.id)))
+
+    async def finish(self, channel: Channel, max_bytes: int = None, keep: bool = False, **kwargs):
+        """
+        Gets the transcript of a watched channel from its state, without fetching it again.
+
+        :param channel: The watched channel
+        :param max_bytes: Split the transcript into self-contained parts of at most this many bytes (only with html or plain mode)
+        :param keep: Whether to keep watching the channel, its state is dropped otherwise
+        :param kwargs: Passed on to the export, such as stats or search_index
+        :return: A string of the transcript, or a list of strings if max_bytes is set
+        """
+        channel_id = int(channel.id)
+        state = self.channels.get(channel_id)
+        if state is None:
+            raise ValueError("The channel is not watched")
+        if max_bytes is not None and state.mode not in ("html", "plain"):
+            raise ValueError("max_bytes is only supported with html or plain mode")
+
+        async with state.lock:
+            messages = {
+                message_id: Message(**json.loads(data))
+                for message_id, data in self._db.execute(
+                    "SELECT id, payload FROM messages WHERE channel_id = ?", (channel_id,)
+                )
+            }
+            messages.update(state.messages)
+            resolver = self._resolver(state)
+            resolver.messages = [messages[k] for k in sorted(messages)]
+            try:
+                parts = await _transcript(
+                    channel,
+                    resolver,
+                    partial(PartWriter, max_bytes=max_bytes),
+                    None,
+                    state.pytz_timezone,
+                    state.military_time,
+                    state.fancy_time,
+                    state.mode,
+                    fragment_cache=self.fragment_cache,
+                    **kwargs,
+                )
+            finally:
+                resolver.messages = None
+                clear_cache()
+            if not keep:
+                self.unwatch(channel)
+        return parts if max_bytes is not None else parts[0]
+
+    def unwatch(self, channel):
+        """
+        Stops watching a channel and drops its state.
+
+        :param channel: A channel or channel id
+        """
+        channel_id = int(getattr(channel, "id", channel))
+        state = self.channels.pop(channel_id, None)
+        if state is not None:
+            self._size -= len(state.messages)
+        with self._db:
+            self._db.execute("DELETE FROM messages WHERE channel_id = ?", (channel_id,))
+
+    async def close(self):
+        """
+        Closes the databases and the HTTP session.
+        """
+        self.fragment_cache.close()
+        self._db.close()
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
@@ -0,0 +1,167 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+_frame = ContextVar("transcript_frame", default=None)
+
+
+class _Frame:
+    __slots__ = ("stats", "name", "parent", "children", "profiler", "peak", "snapshot")
+
+    def __init__(self, stats, name, parent, profiler=None):
+        self.stats = stats
+        self.name = name
+        self.parent = parent
+        self.children = 0.0
+        self.profiler = profiler
+        self.peak = 0
+
+
+def current_stats():
+    """
+    :return: The ExportStats of the export being measured in the current context, if any
+    """
+    frame = _frame.get()
+    return frame.stats if frame is not None else None
+
+
+@contextmanager
+def measure(stats, profiler=None):
+    """
+    Records the stages run in the current context into an ExportStats.
+
+    :param stats: The ExportStats to record into, or None to record nothing
+    :param profiler: The MemoryProfiler to record the memory of the stages with, if any
+    """
+    if stats is None:
+        yield None
+        return
+    token = _frame.set(_Frame(stats, None, None, profiler))
+    if profiler is not None:
+        profiler.start()
+    try:
+        yield stats
+    finally:
+        _frame.reset(token)
+        if profiler is not None:
+            profiler.stop()
+            stats.memory = profiler.report()
+
+
+@contextmanager
+def stage(name):
+    """
+    Times the block as a stage of the export being measured, if any.
+    The time of nested stages is only counted towards the innermost one.
+
+    :param name: The name of the stage
+    """
+    parent = _frame.get()
+    if parent is None:
+        yield
+        return
+    profiler = parent.profiler
+    frame = _Frame(parent.stats, name, parent, profiler)
+    token = _frame.set(frame)
+    if profiler is not None:
+        profiler.enter(frame)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        if profiler is not None:
+            profiler.exit(frame)
+        _frame.reset(token)
+        parent.children += elapsed
+        parent.stats.record(name, max(elapsed - frame.children, 0.0))
+
+
+def timed(name):
+    """
+    Decorates a coroutine function so every call is timed as a stage.
+
+    :param name: The name of the stage
+    """
+
+    def decorator(func):
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            if _frame.get() is None:
+                return await func(*args, **kwargs)
+            with stage(name):
+                return await func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+class MetricsRegistry:
+    """
+    Sums up the stats of every export in the process and renders them in the Prometheus
+    text format. Nothing is collected until it is enabled.
+    """
+
+    def __init__(self, prefix="transcript"):
+        """
+        :param prefix: The prefix of the metric names
+        """
+        self.prefix = prefix
+        self.enabled = False
+        self.exports = {}
+        self.messages = {}
+        self.seconds = {}
+        self.calls = {}
+        self.lookups = {}
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def clear(self):
+        self.exports.clear()
+        self.messages.clear()
+        self.seconds.clear()
+        self.calls.clear()
+        self.lookups.clear()
+
+    def add(self, stats, mode):
+        """
+        Adds the stats of a finished export.
+
+        :param stats: The ExportStats of the export
+        :param mode: The mode of the export
+        """
+        self.exports[mode] = self.exports.get(mode, 0) + 1
+        self.messages[mode] = self.messages.get(mode, 0) + stats.messages
+        for name, seconds in stats.stages.items():
+            self.seconds[name] = self.seconds.get(name, 0.0) + seconds
+            self.calls[name] = self.calls.get(name, 0) + stats.calls[name]
+        for source, count in stats.lookups.items():
+            self.lookups[source] = self.lookups.get(source, 0) + count
+
+    def render(self):
+        """
+        :return: The metrics in the Prometheus text exposition format
+        """
+        lines = []
+        for metric, help, label, values in (
+            ("exports_total", "Number of finished exports.", "mode", self.exports),
+            ("messages_total", "Number of exported messages.", "mode", self.messages),
+            ("stage_seconds_total", "Time spent in each export stage.", "stage", self.seconds),
+            ("stage_calls_total", "Number of calls of each export stage.", "stage", self.calls),
+            ("lookups_total", "Number of entity lookups by source.", "source", self.lookups),
+        ):
+            name = f"{self.prefix}_{metric}"
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} counter")
+            for key, value in sorted(values.items()):
+                lines.append(f'{name}{{{label}="{key}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
@@ -0,0 +1,180 @@
+import json
+import mmap
+import os
+import struct
+from array import array
+from bisect import bisect_left, bisect_right
+
+from .utils import to_snowflake
+
+index_magic = b"TRIDX001"
+_header = struct.Struct("=8sQQ")
+
+
+def index_path(path):
+    """
+    :param path: The path of a jsonl transcript or capture file
+    :return: The path of its offset index
+    """
+    return str(path) + ".idx"
+
+
+def _message_id(line):
+    entry = json.loads(line)
+    if "message" in entry:
+        return int(entry["message"]["id"])
+    if "Metadata" in entry:
+        return int(entry["Metadata"]["id"])
+    return None
+
+
+def _read_index(path):
+    try:
+        with open(index_path(path), "rb") as f:
+            data = f.read()
+    except FileNotFoundError:
+        return array("Q"), array("Q"), 0
+    magic, count, end = _header.unpack_from(data)
+    if magic != index_magic:
+        raise ValueError("Unsupported offset index")
+    ids = array("Q", data[_header.size : _header.size + count * 8])
+    offsets = array("Q", data[_header.size + count * 8 : _header.size + count * 16])
+    return ids, offsets, end
+
+
+def build_offset_index(path):
+    """
+    Writes the offset index of a jsonl transcript or uncompressed capture file, mapping
+    the id of every message to the byte offset of its line, next to the file.
+
+    If the file was indexed before, only the lines added since are read, so a file that is
+    appended to, such as the transcript of an incremental export, is cheap to index again.
+
+    :param path: The path of the file
+    :return: The number of indexed messages
+    """
+    ids, offsets, end = _read_index(path)
+    if os.path.getsize(path) < end:
+        ids, offsets, end = array("Q"), array("Q"), 0
+    with open(path, "rb") as f:
+        f.seek(end)
+        offset = end
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            message_id = _message_id(line)
+            if message_id is not None:
+                ids.append(message_id)
+                offsets.append(offset)
+            offset += len(line)
+    if any(ids[k] > ids[k + 1] for k in range(len(ids) - 1)):
+        pairs = sorted(zip(ids, offsets))
+        ids = array("Q", (message_id for message_id, _ in pairs))
+        offsets = array("Q", (line_offset for _, line_offset in pairs))
+
+    tmp = index_path(path) + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(_header.pack(index_magic, len(ids), offset))
+        f.write(ids.tobytes())
+        f.write(offsets.tobytes())
+    os.replace(tmp, index_path(path))
+    return len(ids)
+
+
+class OffsetIndex:
+    """
+    Reads messages of a jsonl transcript or capture file by id or time without loading
+    the file, through its offset index.
+
+    The file and its index are memory-mapped, and the ids are a sorted array, so finding
+    a message is a binary search and reading a range only touches the lines in it.
+    Messages are returned as the dicts they were written as: the records of a jsonl
+    transcript, or the message payloads of a capture.
+    """
+
+    def __init__(self, path):
+        """
+        :param path: The path of the file, its index has to be built with build_offset_index
+        """
+        self.path = path
+        with open(index_path(path), "rb") as f:
+            self._index = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, count, end = _header.unpack_from(self._index)
+        if magic != index_magic:
+            self._index.close()
+            raise ValueError("Unsupported offset index")
+        self._view = view = memoryview(self._index)
+        self._ids = view[_header.size : _header.size + count * 8].cast("Q")
+        self._offsets = view[_header.size + count * 8 : _header.size + count * 16].cast("Q")
+        with open(path, "rb") as f:
+            self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if end else None
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def position(self, message):
+        """
+        :param message: A message, message id or datetime
+        :return: The position of the first indexed message at or after it
+        """
+        return bisect_left(self._ids, to_snowflake(message))
+
+    def _entry(self, entry):
+        entry = json.loads(entry)
+        return entry.get("message", entry)
+
+    def _lines(self, start, stop):
+        return [
+            self._data[self._offsets[k] : self._data.find(b"\n", self._offsets[k])]
+            for k in range(max(start, 0), min(stop, len(self._ids)))
+        ]
+
+    def get(self, message):
+        """
+        :param message: A message or message id
+        :return: The message, or None if it is not in the file
+        """
+        n = self.position(message)
+        if n == len(self._ids) or self._ids[n] != to_snowflake(message):
+            return None
+        return self._entry(self._lines(n, n + 1)[0])
+
+    def range(self, after=None, before=None, limit=None):
+        """
+        :param after: Only read the messages sent after this datetime or message id
+        :param before: Only read the messages sent before this datetime or message id
+        :param limit: The maximum number of messages to read, the oldest first
+        :return: A list of the messages, oldest first
+        """
+        start = bisect_right(self._ids, to_snowflake(after, high=True)) if after else 0
+        stop = bisect_left(self._ids, to_snowflake(before)) if before else len(self._ids)
+        if limit is not None:
+            stop = min(stop, start + limit)
+        return [self._entry(line) for line in self._lines(start, stop)]
+
+    def around(self, message, count=50):
+        """
+        :param message: A message, message id or datetime
+        :param count: The number of messages to read
+        :return: A list of up to count messages centered on the message, oldest first
+        """
+        n = self.position(message)
+        start = max(min(n - count // 2, len(self._ids) - count), 0)
+        return [self._entry(line) for line in self._lines(start, start + count)]
+
+    def close(self):
+        """
+        Unmaps the file and its index.
+        """
+        self._ids.release()
+        self._offsets.release()
+        self._view.release()
+        self._index.close()
+        if self._data is not None:
+            self._data.close()
@@ -0,0 +1,119 @@
+import random
+import tracemalloc
+
+_filters = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<unknown>"),
+)
+_running = False
+
+
+class MemoryProfiler:
+    """
+    Records the tracemalloc peak of every stage of an export, and the allocation sites
+    that grew the most during the first calls of the fetch, normalize, render and
+    serialize stages. Taking snapshots is slow on a large heap, so they are only taken
+    around a few calls.
+
+    tracemalloc traces the whole process, so only one export is profiled at a time.
+    """
+
+    def __init__(
+        self, top=10, snapshots=1, frames=1, stages=("fetch", "normalize", "render", "serialize")
+    ):
+        """
+        :param top: The number of allocation sites to keep per stage
+        :param snapshots: The number of calls of each stage to compare snapshots around
+        :param frames: The number of frames to store per allocation
+        :param stages: The stages to record the allocation sites of
+        """
+        self.top = top
+        self.snapshots = snapshots
+        self.stages = stages
+        self.frames = frames
+        self.peaks = {}
+        self.sites = {}
+
+        self._taken = {}
+        self._started = False
+
+    @classmethod
+    def sample(cls, fraction, **kwargs):
+        """
+        Creates a profiler for a fraction of the calls.
+
+        :param fraction: The probability of profiling, from 0 to 1
+        :param kwargs: Passed to MemoryProfiler
+        :return: A MemoryProfiler, or None if this export is not sampled or another one is being profiled
+        """
+        if _running or not fraction or random.random() >= fraction:
+            return None
+        return cls(**kwargs)
+
+    def start(self):
+        global _running
+        _running = True
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+            self._started = True
+        tracemalloc.reset_peak()
+
+    def stop(self):
+        global _running
+        if self._started:
+            tracemalloc.stop()
+            self._started = False
+        _running = False
+
+    def enter(self, frame):
+        """
+        Called when a stage starts.
+
+        :param frame: The frame of the stage
+        """
+        frame.peak = 0
+        frame.parent.peak = max(frame.parent.peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.reset_peak()
+        frame.snapshot = None
+        if frame.name in self.stages and self._taken.get(frame.name, 0) < self.snapshots:
+            self._taken[frame.name] = self._taken.get(frame.name, 0) + 1
+            frame.snapshot = tracemalloc.take_snapshot().filter_traces(_filters)
+
+    def exit(self, frame):
+        """
+        Called when a stage ends.
+
+        :param frame: The frame of the stage
+        """
+        if frame.snapshot is not None:
+            snapshot = tracemalloc.take_snapshot().filter_traces(_filters)
+            sites = self.sites.setdefault(frame.name, {})
+            for stat in snapshot.compare_to(frame.snapshot, "lineno"):
+                if stat.size_diff > 0:
+                    site = str(stat.traceback[0])
+                    size, count = sites.get(site, (0, 0))
+                    sites[site] = (size + stat.size_diff, count + stat.count_diff)
+            frame.snapshot = None
+        peak = max(frame.peak, tracemalloc.get_traced_memory()[1])
+        self.peaks[frame.name] = max(self.peaks.get(frame.name, 0), peak)
+        frame.parent.peak = max(frame.parent.peak, peak)
+
+    def report(self):
+        """
+        :return: A dict of stage to its peak in bytes and its top allocation sites, as (site, bytes, blocks) tuples
+        """
+        return {
+            name: {
+                "peak": peak,
+                "sites": sorted(
+                    (
+                        (site, size, count)
+                        for site, (size, count) in self.sites.get(name, {}).items()
+                    ),
+                    key=lambda s: s[1],
+                    reverse=True,
+                )[: self.top],
+            }
+            for name, peak in self.peaks.items()
+        }
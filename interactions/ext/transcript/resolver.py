@@ -0,0 +1,500 @@
+import asyncio
+import re
+import time
+
+import aiohttp
+
+from interactions import (
+    Channel,
+    Guild,
+    LibraryException,
+    Member,
+    Message,
+    Snowflake,
+    Sticker,
+    User,
+)
+
+from .cache import load, store
+from .emoji_convert import emoji_sources, valid_src
+from .metrics import current_stats, stage, timed
+from .utils import Regex
+
+models = {
+    "guild": Guild,
+    "channel": Channel,
+    "member": Member,
+    "user": User,
+    "message": Message,
+    "sticker": Sticker,
+}
+
+
+class RateLimiter:
+    """
+    Spaces out requests so that no more than ``rate`` of them start per second.
+    """
+
+    def __init__(self, rate):
+        """
+        :param rate: The maximum number of requests per second
+        """
+        self.interval = 1 / rate
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        """
+        Waits until the next request is allowed to start.
+        """
+        async with self._lock:
+            now = time.monotonic()
+            if self._next > now:
+                await asyncio.sleep(self._next - now)
+                now = self._next
+            self._next = now + self.interval
+
+
+class BudgetExhausted(Exception):
+    """
+    Raised instead of making a lookup once the ApiBudget of the resolver is used up.
+    """
+
+
+class ApiBudget:
+    """
+    Limits the lookups an export makes, by number or by the time since the export started.
+    Fetching the history and the guild is never limited, but does count towards the budget.
+    """
+
+    def __init__(self, max_calls=None, max_time=None):
+        """
+        :param max_calls: The maximum number of API requests, unlimited if not given
+        :param max_time: The number of seconds after which no more lookups are made, unlimited if not given
+        """
+        self.max_calls = max_calls
+        self.max_time = max_time
+        self.calls = 0
+        self._start = time.monotonic()
+
+    @property
+    def exhausted(self):
+        """
+        Whether no more lookups may be made.
+        """
+        return (self.max_calls is not None and self.calls >= self.max_calls) or (
+            self.max_time is not None and time.monotonic() - self._start >= self.max_time
+        )
+
+    def spend(self):
+        """
+        Takes a request from the budget.
+
+        :return: Whether the request may be made
+        """
+        if self.exhausted:
+            return False
+        self.calls += 1
+        return True
+
+
+class Resolver:
+    """
+    Looks up the entities a transcript refers to, such as members, channels, roles,
+    referenced messages and stickers.
+
+    Every result, including misses, is cached, and concurrent lookups of the same entity
+    share a single request. Entities already in the cache the client keeps from gateway
+    events are taken from there, only the others are requested. The cache, HTTP session
+    and rate limiter can be handed to several resolvers so exports of channels in the
+    same guild fetch everything once.
+
+    ``memo`` holds the html of embeds and components already rendered in the export, so
+    repeated bot output is only rendered once. When ``messages`` is set, the history is
+    taken from it instead of the API, as when rendering a capture.
+    """
+
+    def __init__(self, client, guild_id, session=None, cache=None, limiter=None, budget=None):
+        """
+        :param client: The HTTP client of the bot
+        :param guild_id: The id of the guild of the exported channel
+        :param session: The aiohttp session for CDN requests, one is created when first needed if not given
+        :param cache: The dict to cache results in, can be shared between resolvers
+        :param limiter: The RateLimiter every API request has to pass, if any
+        :param budget: The ApiBudget limiting the lookups of this resolver, if any
+        """
+        self.client = client
+        self.guild_id = int(guild_id) if guild_id else None
+        self.cache = {} if cache is None else cache
+        self.limiter = limiter
+        self.budget = budget
+        self.degraded = False
+        self.memo = {}
+        self.messages = None
+
+        self._session = session
+        self._own_session = session is None
+        self._sources = set()
+
+    @property
+    def session(self):
+        """
+        The aiohttp session used for CDN requests.
+        """
+        if self._session is None:
+            self._session = aiohttp.ClientSession()
+        return self._session
+
+    async def close(self):
+        """
+        Closes the aiohttp session if it was created by this resolver.
+        """
+        if self._own_session and self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def _request(self, endpoint, *args, essential=False, **kwargs):
+        stats = current_stats()
+        if essential:
+            if self.budget is not None:
+                self.budget.calls += 1
+        elif self.budget is not None and not self.budget.spend():
+            self.degraded = True
+            if stats is not None:
+                stats.api_skipped += 1
+            raise BudgetExhausted(endpoint)
+        if self.limiter is not None:
+            await self.limiter.acquire()
+        start = time.perf_counter()
+        try:
+            return await getattr(self.client, endpoint)(*args, **kwargs)
+        except LibraryException:
+            if essential:
+                raise
+            return None
+        finally:
+            if stats is not None:
+                stats.api_call(endpoint, time.perf_counter() - start)
+
+    @classmethod
+    def from_snapshot(cls, snapshot):
+        """
+        Creates a resolver that answers from a snapshot only, without making any request.
+        Entities missing from the snapshot are treated as deleted.
+
+        :param snapshot: A snapshot returned by Resolver.snapshot
+        :return: The resolver
+        """
+        resolver = cls(None, snapshot["guild_id"])
+        resolver.degraded = snapshot["degraded"]
+        for key, data in snapshot["entities"]:
+            resolver.cache[tuple(key)] = models[key[0]](**data) if data is not None else None
+        for src, valid in snapshot["emoji"].items():
+            valid_src.cache[valid_src.key(src)] = valid
+        return resolver
+
+    def snapshot(self):
+        """
+        Exports every resolved entity and emoji check as plain data, so rendering can be
+        done somewhere without access to the API, such as another process.
+
+        :return: A dict of the resolved entities and emoji checks
+        """
+        entities = []
+        for key, value in self.cache.items():
+            if isinstance(value, asyncio.Future):
+                continue
+            entities.append((list(key), payload(value) if value is not None else None))
+        emoji = {}
+        for src in self._sources:
+            key = valid_src.key(src)
+            if key in valid_src.cache:
+                emoji[src] = valid_src.cache[key]
+        return {
+            "guild_id": self.guild_id,
+            "entities": entities,
+            "emoji": emoji,
+            "degraded": self.degraded,
+        }
+
+    async def prefetch(self, messages, channel):
+        """
+        Resolves everything the messages refer to ahead of rendering, with concurrent requests.
+        This covers the guild, mentioned members, users, roles and channels, referenced
+        messages, stickers and the twemoji images of every emoji.
+
+        :param messages: The messages that are going to be rendered
+        :param channel: The channel the messages are from
+        """
+        guild = await self.guild()
+        texts = [guild.name or "", channel.name or ""]
+        references = set()
+        stickers = set()
+        for i in messages:
+            texts.extend(_message_texts(i))
+            if i.referenced_message:
+                references.add(int(i.referenced_message._json["id"]))
+            if i.sticker_items and i.sticker_items[0].format_type == 3:
+                stickers.add(int(i.sticker_items[0].id))
+
+        refs = await asyncio.gather(*(self.message(int(channel.id), ref) for ref in references))
+        for ref in refs:
+            if ref is not None:
+                texts.extend([ref.content or "", ref.author.username or ""])
+        await asyncio.gather(*(self.sticker(sticker) for sticker in stickers))
+
+        content = "\n".join(texts)
+        member_ids = {int(m) for m in re.findall(Regex.REGEX_MEMBERS_2, content)}
+        channel_ids = {int(c) for c in re.findall(Regex.REGEX_CHANNELS_2, content)}
+        members = await asyncio.gather(*(self.member(m) for m in member_ids))
+        users = await asyncio.gather(
+            *(
+                self.user(m)
+                for m, member in zip(member_ids, members)
+                if member is None or not member.name
+            )
+        )
+        channels = await asyncio.gather(*(self.channel(c) for c in channel_ids))
+
+        names = [m.name for m in members if m is not None and m.name]
+        names += [u.username for u in users if u is not None and u.username]
+        names += [c.name for c in channels if c is not None and c.name]
+        names += [r.name for r in guild.roles or [] if r.name]
+        sources = set()
+        for text in texts + names:
+            sources.update(await emoji_sources(text))
+        self._sources.update(sources)
+        await asyncio.gather(*(valid_src(src, session=self.session) for src in sources))
+
+    def _gateway(self, key):
+        cache = getattr(self.client, "cache", None)
+        if cache is None:
+            return None
+        if key[0] == "member":
+            id = (Snowflake(key[1]), Snowflake(key[2]))
+        else:
+            id = Snowflake(key[-1])
+        return cache[models[key[0]]].get(id)
+
+    @timed("resolve")
+    async def _get(self, key, factory):
+        if key not in self.cache:
+            if self.client is None:
+                return None
+            stats = current_stats()
+            cached = self._gateway(key)
+            if cached is not None:
+                if stats is not None:
+                    stats.lookup("gateway")
+                self.cache[key] = cached
+                return cached
+            if stats is not None:
+                stats.lookup("api")
+            self.cache[key] = asyncio.ensure_future(factory())
+        value = self.cache[key]
+        if not isinstance(value, asyncio.Future):
+            return value
+        try:
+            result = await asyncio.shield(value)
+        except BudgetExhausted:
+            self.cache.pop(key, None)
+            return None
+        except Exception:
+            self.cache.pop(key, None)
+            raise
+        self.cache[key] = result
+        return result
+
+    @timed("fetch")
+    async def history(self, channel, limit, progress=None, after=None, before=None, authors=None):
+        """
+        Gets the latest messages of a channel, oldest first.
+
+        Pages are fetched backwards from ``before`` and the pagination stops as soon as it
+        reaches ``after``, so only the requested window is fetched.
+
+        :param channel: The channel to get the messages from
+        :param limit: The maximum number of messages to get, or None for every message in the window
+        :param progress: A callable taking the number of messages got so far, called after every page
+        :param after: The snowflake to get the messages after, if any
+        :param before: The snowflake to get the messages before, if any
+        :param authors: A set of author ids to only get the messages of, if any
+        :return: A list of messages
+        """
+        if self.messages is not None:
+            return self._captured_history(limit, progress, after, before, authors)
+        messages = []
+        while limit is None or len(messages) < limit:
+            count = 100 if limit is None or authors else min(limit - len(messages), 100)
+            payloads = await self._request(
+                "get_channel_messages",
+                channel_id=int(channel.id),
+                limit=count,
+                before=before,
+                essential=True,
+            )
+            if not payloads:
+                break
+            before = int(payloads[-1]["id"])
+            end = len(payloads) < count or (after is not None and before <= after)
+            if after is not None:
+                payloads = [p for p in payloads if int(p["id"]) > after]
+            if authors:
+                payloads = [p for p in payloads if int(p["author"]["id"]) in authors]
+            if limit is not None:
+                payloads = payloads[: limit - len(messages)]
+            with stage("normalize"):
+                messages.extend(Message(**payload, _client=self.client) for payload in payloads)
+            if progress is not None:
+                progress(len(messages))
+            if end:
+                break
+        messages.reverse()
+        return messages
+
+    def _captured_history(self, limit, progress, after, before, authors):
+        messages = [
+            i
+            for i in self.messages
+            if (after is None or int(i.id) > after)
+            and (before is None or int(i.id) < before)
+            and (not authors or int(i.author.id) in authors)
+        ]
+        if limit is not None:
+            messages = messages[-limit:] if limit else []
+        if progress is not None:
+            progress(len(messages))
+        return messages
+
+    async def guild(self):
+        """
+        Gets the guild of the exported channel.
+
+        :return: The guild
+        """
+
+        async def factory():
+            return Guild(**await self._request("get_guild", self.guild_id, essential=True))
+
+        return await self._get(("guild", self.guild_id), factory)
+
+    async def channel(self, channel_id):
+        """
+        :param channel_id: The id of the channel
+        :return: The channel, or None if it does not exist
+        """
+
+        async def factory():
+            data = await self._request("get_channel", channel_id)
+            return Channel(**data) if data else None
+
+        return await self._get(("channel", channel_id), factory)
+
+    async def member(self, member_id):
+        """
+        :param member_id: The id of the member
+        :return: The member of the guild, or None if they are not in it
+        """
+
+        async def factory():
+            data = await self._request("get_member", self.guild_id, member_id)
+            return Member(**data) if data else None
+
+        return await self._get(("member", self.guild_id, member_id), factory)
+
+    async def user(self, user_id):
+        """
+        :param user_id: The id of the user
+        :return: The user, or None if they do not exist
+        """
+
+        async def factory():
+            data = await self._request("get_user", user_id)
+            return User(**data) if data else None
+
+        return await self._get(("user", user_id), factory)
+
+    async def role(self, role_id):
+        """
+        :param role_id: The id of the role
+        :return: The role from the guild, or None if it does not exist
+        """
+        guild = await self.guild()
+        for role in guild.roles or []:
+            if int(role.id) == role_id:
+                return role
+        return None
+
+    async def message(self, channel_id, message_id):
+        """
+        :param channel_id: The id of the channel the message is in
+        :param message_id: The id of the message
+        :return: The message, or None if it does not exist
+        """
+
+        async def factory():
+            data = await self._request("get_message", channel_id, message_id)
+            return Message(**data) if data else None
+
+        return await self._get(("message", channel_id, message_id), factory)
+
+    async def sticker(self, sticker_id):
+        """
+        Stickers are also kept in the cache backend, if one is set.
+
+        :param sticker_id: The id of the sticker
+        :return: The sticker, or None if it does not exist
+        """
+
+        async def factory():
+            key = f"sticker:{int(sticker_id)}"
+            data = await load(key)
+            if data is None:
+                data = await self._request("get_sticker", sticker_id)
+                # A failed request also gives None, so only stickers that were found are kept
+                if data is not None:
+                    await store(key, data)
+            return Sticker(**data) if data else None
+
+        return await self._get(("sticker", int(sticker_id)), factory)
+
+
+def payload(model):
+    """
+    Gets the payload of a model without the references to the client the library adds to
+    it, so it can be pickled or stored as JSON.
+
+    :param model: The model, such as a Message
+    :return: The payload as plain data
+    """
+    return _strip(model._json)
+
+
+def _strip(data):
+    if isinstance(data, dict):
+        return {k: _strip(v) for k, v in data.items() if not k.startswith("_")}
+    if isinstance(data, list):
+        return [_strip(v) for v in data]
+    return data
+
+
+def _message_texts(i):
+    texts = [i.content or "", i.author.username or ""]
+    for e in i.embeds or []:
+        texts.extend([e.title or "", e.description or ""])
+        for field in e.fields or []:
+            texts.extend([field.name or "", field.value or ""])
+    for row in i.components or []:
+        for c in row.components or []:
+            texts.extend([c.label or "", c.placeholder or "", str(c.emoji) if c.emoji else ""])
+            for option in c.options or []:
+                texts.extend(
+                    [
+                        str(option.label),
+                        option.description or "",
+                        str(option.emoji) if option.emoji else "",
+                    ]
+                )
+    for r in i.reactions or []:
+        texts.append(str(r.emoji))
+    return texts
@@ -0,0 +1,156 @@
+import base64
+import gzip
+import json
+import os
+import re
+
+import pytz
+
+dir_path = os.path.abspath((os.path.dirname(os.path.realpath(__file__))))
+token_pattern = re.compile(r"\w{2,}")
+
+
+def tokenize(text):
+    """
+    :param text: The text to split
+    :return: The set of lowercase words of at least two characters in the text
+    """
+    return set(token_pattern.findall(text.lower()))
+
+
+def _embed_texts(i):
+    texts = []
+    for e in i.embeds or []:
+        texts.extend([e.title or "", e.description or ""])
+        for field in e.fields or []:
+            texts.extend([field.name or "", field.value or ""])
+        if e.footer:
+            texts.append(e.footer.text or "")
+    return texts
+
+
+def _message_text(i):
+    texts = [i.content or ""] + _embed_texts(i)
+    for a in i.attachments or []:
+        texts.append(a.filename or "")
+    return "\n".join(texts)
+
+
+def _number_size(n):
+    return len(str(n)) + 1
+
+
+class SearchIndex:
+    """
+    Builds an inverted index of the messages of a html transcript while it is rendered,
+    along with the author and day of every message, and embeds it in the footer so the
+    transcript can be searched and filtered without scanning the page.
+
+    Messages are added as they are rendered and committed once their message group is
+    written, so every part of a split transcript gets the index of its own messages.
+    """
+
+    def __init__(self, pytz_timezone="UTC"):
+        """
+        :param pytz_timezone: The timezone the days of the messages are taken in
+        """
+        self.timezone = pytz.timezone(pytz_timezone)
+        with open(dir_path + "/html/script/search.html", "r") as f:
+            self.template = f.read()
+        self._template_size = len(self.template.replace("{{SEARCH_INDEX}}", "").encode())
+        self._group = []
+        self._group_size = 0
+        self._reset()
+
+    def _reset(self):
+        self._ids = []
+        self._authors = []
+        self._days = []
+        self._users = {}
+        self._names = []
+        self._day_numbers = {}
+        self._tokens = {}
+        self._size = 64
+
+    def add(self, i):
+        """
+        Adds a message to the index, as part of the message group being rendered.
+
+        :param i: The message
+        """
+        user_id = str(i.author.id)
+        name = f"{i.author.username}#{i.author.discriminator}"
+        day = i.id.timestamp.astimezone(self.timezone).strftime("%Y-%m-%d")
+        tokens = tokenize(_message_text(i))
+        self._group.append((str(i.id), user_id, name, day, tokens))
+        self._group_size += (
+            len(str(i.id))
+            + len(json.dumps(name))
+            + len(day)
+            + 24
+            + sum(len(json.dumps(t)) + 12 for t in tokens)
+        )
+
+    def commit(self):
+        """
+        Moves the messages of the message group that was just written into the index of
+        the current part.
+        """
+        for message_id, user_id, name, day, tokens in self._group:
+            n = len(self._ids)
+            self._ids.append(message_id)
+            self._size += len(message_id) + 3
+            if user_id not in self._users:
+                self._users[user_id] = len(self._users)
+                self._names.append([user_id, name])
+                self._size += len(json.dumps([user_id, name])) + 1
+            self._authors.append(self._users[user_id])
+            self._size += _number_size(self._users[user_id])
+            if day not in self._day_numbers:
+                self._day_numbers[day] = len(self._day_numbers)
+                self._size += len(day) + 3
+            self._days.append(self._day_numbers[day])
+            self._size += _number_size(self._day_numbers[day])
+            for token in tokens:
+                postings = self._tokens.get(token)
+                if postings is None:
+                    postings = self._tokens[token] = []
+                    self._size += len(json.dumps(token)) + 3
+                self._size += _number_size(n - postings[-1] if postings else n)
+                postings.append(n)
+        self._group = []
+        self._group_size = 0
+
+    def size(self):
+        """
+        :return: An upper bound of the size in bytes of what render would return, with the message group being rendered committed
+        """
+        return self._template_size + (self._size + self._group_size) * 4 // 3 + 4
+
+    def data(self):
+        """
+        :return: The index of the current part as plain data, with the postings delta encoded
+        """
+        return {
+            "ids": self._ids,
+            "authors": self._authors,
+            "days": self._days,
+            "users": self._names,
+            "dayNames": sorted(self._day_numbers, key=self._day_numbers.get),
+            "tokens": {
+                token: [n - (postings[k - 1] if k else 0) for k, n in enumerate(postings)]
+                for token, postings in self._tokens.items()
+            },
+        }
+
+    def render(self):
+        """
+        Renders the search box with the index of the current part, and starts the index of
+        the next part.
+
+        :return: The html of the search box
+        """
+        blob = json.dumps(self.data(), separators=(",", ":")).encode()
+        blob = base64.b64encode(gzip.compress(blob, mtime=0)).decode()
+        self._reset()
+        return self.template.replace("{{SEARCH_INDEX}}", blob)
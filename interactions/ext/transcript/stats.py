@@ -0,0 +1,74 @@
+class ExportStats:
+    """
+    Collects how an export went. Pass an instance as ``stats`` to an export and read it
+    once the export is done.
+
+    ``stages`` maps every stage of the export (fetch, resolve, emoji, markdown, render and
+    serialize) to the seconds spent in it, not counting the stages nested in it, and
+    ``calls`` to how many times it ran.
+
+    ``api_calls`` and ``api_seconds`` map every API endpoint the export requested to the
+    number of requests and the total time they took, and ``api_skipped`` counts the lookups
+    that were not made because the budget of the export was used up. ``lookups`` counts the
+    entities looked up by where they were found, "gateway" for the cache of the client and
+    "api" for a request.
+
+    ``memory`` is only set for exports that were profiled, and maps every stage to its
+    tracemalloc peak in bytes and its top allocation sites, as (site, bytes, blocks) tuples.
+    """
+
+    def __init__(self):
+        self.channel_id = None
+        self.mode = None
+        self.messages = 0
+        self.max_loop_lag = 0.0
+        self.slices = 0
+        self.stages = {}
+        self.calls = {}
+        self.api_calls = {}
+        self.api_seconds = {}
+        self.api_skipped = 0
+        self.lookups = {}
+        self.memory = None
+
+    def __repr__(self):
+        return (
+            f"<ExportStats channel_id={self.channel_id} mode={self.mode} messages={self.messages} max_loop_lag={self.max_loop_lag:.4f}s "
+            f"slices={self.slices}>"
+        )
+
+    def record(self, stage, seconds):
+        """
+        Adds a run of a stage.
+
+        :param stage: The name of the stage
+        :param seconds: The time the run took
+        """
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+        self.calls[stage] = self.calls.get(stage, 0) + 1
+
+    def lookup(self, source):
+        """
+        Adds a lookup of an entity.
+
+        :param source: Where the entity was found, "gateway" or "api"
+        """
+        self.lookups[source] = self.lookups.get(source, 0) + 1
+
+    @property
+    def gateway_ratio(self):
+        """
+        The fraction of lookups answered by the cache of the client, None without lookups.
+        """
+        total = sum(self.lookups.values())
+        return self.lookups.get("gateway", 0) / total if total else None
+
+    def api_call(self, endpoint, seconds):
+        """
+        Adds a request to the API.
+
+        :param endpoint: The name of the HTTPClient method
+        :param seconds: The time the request took
+        """
+        self.api_calls[endpoint] = self.api_calls.get(endpoint, 0) + 1
+        self.api_seconds[endpoint] = self.api_seconds.get(endpoint, 0.0) + seconds
@@ -0,0 +1,69 @@
+import asyncio
+import time
+
+
+class TimeSlicer:
+    """
+    Splits long synchronous work into slices, yielding to the event loop whenever a slice
+    has run for longer than the budget.
+    """
+
+    def __init__(self, budget=None):
+        """
+        :param budget: The time in seconds a slice may run for, or None to never yield
+        """
+        self.budget = budget
+        self.slices = 1
+        self._start = time.perf_counter()
+
+    async def tick(self):
+        """
+        Yields to the event loop if the current slice is over its budget.
+        Call it between two units of work.
+        """
+        if self.budget is None:
+            return
+        if time.perf_counter() - self._start >= self.budget:
+            await asyncio.sleep(0)
+            self.slices += 1
+            self._start = time.perf_counter()
+
+
+class LagMonitor:
+    """
+    Measures how late the event loop wakes up a task that sleeps for a fixed interval,
+    which is how long other tasks had to wait for the loop while it was running.
+    """
+
+    def __init__(self, interval=0.01):
+        """
+        :param interval: The time in seconds between two measurements
+        """
+        self.interval = interval
+        self.max_lag = 0.0
+        self._task = None
+
+    def start(self):
+        """
+        Starts measuring in the background.
+        """
+        self._task = asyncio.ensure_future(self._run())
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            self.max_lag = max(self.max_lag, loop.time() - expected)
+
+    async def stop(self):
+        """
+        Stops measuring.
+
+        :return: The largest lag measured, in seconds
+        """
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        return self.max_lag
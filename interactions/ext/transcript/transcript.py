@@ -16,11 +16,19 @@ You should have received a copy of the GNU General Public License
 along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
 
+import asyncio
 import html
 import io
+import json
+import logging
 import os
+import tempfile
+from concurrent.futures import Executor
 from datetime import datetime, timedelta
+from functools import partial
+from typing import Callable, List, Union
 
+import aiohttp
 import pandas as pd
 import pytz
 
@@ -28,14 +36,24 @@ from interactions import (
     Channel,
     ComponentType,
     Extension,
-    Guild,
+    File,
     Message,
     MessageType,
-    Sticker,
+    extension_listener,
 )
 
+from .archive import Archive
+from .assets import AssetBundle, BundleWriter, asset_hosts as default_asset_hosts
 from .cache import clear_cache
 from .emoji_convert import convert_emoji
+from .fragments import FragmentCache
+from .jobs import ExportJob, JobQueue, Priority
+from .metrics import measure, registry, stage
+from .profiling import MemoryProfiler
+from .resolver import ApiBudget, RateLimiter, Resolver, payload
+from .search import SearchIndex
+from .stats import ExportStats
+from .timing import LagMonitor, TimeSlicer
 from .utils import (
     Default,
     get_file_icon,
@@ -45,15 +63,109 @@ from .utils import (
     parse_md,
     parse_msg_ref,
     styles,
+    to_snowflake,
 )
+from .writer import PartWriter, SpooledWriter
 
+log = logging.getLogger(__name__)
 newline = "\n"
 dir_path = os.path.abspath((os.path.dirname(os.path.realpath(__file__))))
+render_chunk_size = 250
 
 
 class Transcript(Extension):
-    def __init__(self, client):
+    def __init__(self, client, workers=2, rate=None, live_directory=None, max_live_messages=10000):
+        """
+        :param client: The client of the bot
+        :param workers: The maximum number of submitted exports running at the same time
+        :param rate: The maximum number of API requests per second across all submitted exports, unlimited if not given
+        :param live_directory: The directory of the live transcripts, live transcripts are disabled if not given
+        :param max_live_messages: The maximum number of messages of live transcripts kept in memory
+        """
+        from .live import LiveTranscripts
+
         self.client = client
+        self.jobs = JobQueue(workers, rate)
+        self.live = (
+            LiveTranscripts(live_directory, max_live_messages) if live_directory else None
+        )
+
+    def submit(
+        self,
+        channel: Channel,
+        priority: int = Priority.NORMAL,
+        progress: Callable[[ExportJob], None] = None,
+        file: bool = False,
+        **kwargs,
+    ) -> ExportJob:
+        """
+        Queues an export to run in the background.
+
+        :param channel: The channel to get the transcript from
+        :param priority: The priority of the export, lower runs first (Priority.HIGH, NORMAL or LOW)
+        :param progress: A callable taking the job, called whenever its progress or status changes
+        :param file: Whether to export with get_transcript_file instead of get_transcript
+        :param kwargs: Passed to get_transcript or get_transcript_file
+        :return: The job of the export, await it to get the transcript
+        """
+        return self.jobs.submit(
+            channel,
+            get_transcript_file if file else get_transcript,
+            priority=priority,
+            progress=progress,
+            **kwargs,
+        )
+
+    def _live(self):
+        if self.live is None:
+            raise ValueError("Live transcripts need a live_directory")
+        return self.live
+
+    async def watch(self, channel: Channel, **kwargs):
+        """
+        Starts keeping a live transcript of a channel, updated from the messages created,
+        edited and deleted in it, so finish returns it without fetching the channel again.
+
+        :param channel: The channel to watch
+        :param kwargs: Passed to LiveTranscripts.watch, such as mode or pytz_timezone
+        """
+        await self._live().watch(channel, **kwargs)
+
+    async def finish(self, channel: Channel, **kwargs):
+        """
+        Gets the live transcript of a watched channel and stops watching it.
+
+        :param channel: The watched channel
+        :param kwargs: Passed to LiveTranscripts.finish, such as max_bytes or keep
+        :return: A string of the transcript, or a list of strings if max_bytes is set
+        """
+        return await self._live().finish(channel, **kwargs)
+
+    @extension_listener
+    async def on_message_create(self, message):
+        if self.live is not None:
+            await self.live.message_create(message)
+
+    @extension_listener
+    async def on_message_update(self, before, after):
+        if self.live is not None:
+            await self.live.message_update(after)
+
+    @extension_listener
+    async def on_message_delete(self, message):
+        if self.live is not None:
+            await self.live.message_delete(message.channel_id, [message.id])
+
+    @extension_listener
+    async def on_message_delete_bulk(self, event):
+        if self.live is not None:
+            await self.live.message_delete(event.channel_id, event.ids)
+
+    async def teardown(self, *args, **kwargs):
+        await self.jobs.close()
+        if self.live is not None:
+            await self.live.close()
+        await super().teardown(*args, **kwargs)
 
 
 async def get_transcript(
@@ -63,750 +175,534 @@ async def get_transcript(
     military_time: bool = False,
     fancy_time: bool = True,
     mode: str = "html",
+    max_bytes: int = None,
+    executor: Executor = None,
+    time_slice: float = None,
+    stats: ExportStats = None,
+    progress: Callable[[int, int], None] = None,
+    rate_limiter: RateLimiter = None,
+    on_stats: Callable[[ExportStats], None] = None,
+    max_api_calls: int = None,
+    max_api_time: float = None,
+    profile_memory: float = None,
+    after: Union[datetime, int] = None,
+    before: Union[datetime, int] = None,
+    authors: List[int] = None,
+    fragment_cache: FragmentCache = None,
+    search_index: bool = False,
+    archive: Archive = None,
+    archive_transcript: str = None,
 ):
     """
     :param channel: The channel to get the transcript from
-    :param limit: The maximum number of messages to get
+    :param limit: The maximum number of messages to get, or None to get every message
     :param pytz_timezone: The timezone to use for the transcript
     :param military_time: Whether to use military time or not
     :param fancy_time: Whether to use fancy time or not (only with html mode)
-    :param mode: The mode to use for the transcript (html, json, csv, or plain)
-    :return: A string of the transcript
+    :param mode: The mode to use for the transcript (html, json, jsonl, csv, or plain)
+    :param max_bytes: Split the transcript into self-contained parts of at most this many bytes (only with html or plain mode)
+    :param executor: A ProcessPoolExecutor to render the messages in instead of the event loop (only with html mode)
+    :param time_slice: Yield to the event loop whenever rendering has run for this many seconds without pausing
+    :param stats: An ExportStats to record the number of messages and the largest event loop lag of the export in
+    :param progress: A callable taking the number of messages fetched and rendered so far, called as the export goes
+    :param rate_limiter: A RateLimiter to share with other exports, every API request of the export has to pass it
+    :param on_stats: A callable taking the ExportStats of the export, with its stage timings, called when it is done
+    :param max_api_calls: The maximum number of API requests of the export, mentions and references are left unresolved after that
+    :param max_api_time: The number of seconds after which the export stops resolving mentions and references
+    :param profile_memory: The fraction of exports, from 0 to 1, to profile the memory of with tracemalloc, the report is set on the ExportStats or logged
+    :param after: Only get the messages sent after this datetime or message id
+    :param before: Only get the messages sent before this datetime or message id
+    :param authors: Only get the messages of these users or user ids
+    :param fragment_cache: A FragmentCache to reuse the rendered messages of earlier exports from
+    :param search_index: Whether to embed a search index of the messages with a search box (only with html mode)
+    :param archive: An Archive to add the exported messages to
+    :param archive_transcript: Where the transcript is kept, such as a path or URL, recorded in the archive, {channel_id} and {channel} are replaced with the id and name of the channel
+    :return: A string of the transcript, or a list of strings if max_bytes is set
     """
 
-    msg = await channel.get_history(limit=limit)
-    msg.reverse()
-
-    guild = Guild(**await channel._client.get_guild(channel.guild_id))
+    if max_bytes is not None and mode not in ("html", "plain"):
+        raise ValueError("max_bytes is only supported with html or plain mode")
 
-    if mode == "plain":
-        content = "==============================================================\nGuild: {}\nChannel: {}\n==============================================================\n".format(
-            guild.name, channel.name
+    resolver = Resolver(
+        channel._client,
+        channel.guild_id,
+        limiter=rate_limiter,
+        budget=_budget(max_api_calls, max_api_time),
+    )
+    try:
+        parts = await _transcript(
+            channel,
+            resolver,
+            partial(PartWriter, max_bytes=max_bytes),
+            limit,
+            pytz_timezone,
+            military_time,
+            fancy_time,
+            mode,
+            executor,
+            time_slice=time_slice,
+            stats=stats,
+            progress=progress,
+            on_stats=on_stats,
+            profile_memory=profile_memory,
+            after=after,
+            before=before,
+            authors=authors,
+            fragment_cache=fragment_cache,
+            search_index=search_index,
+            archive=archive,
+            archive_transcript=archive_transcript,
         )
-        for i in msg:
-            if military_time:
-                time = i.id.timestamp.astimezone(pytz.timezone(pytz_timezone)).strftime(
-                    "%d-%b-%y %H:%M:%S"
-                )
-                edit_time = (
-                    i.edited_timestamp.astimezone(pytz.timezone(pytz_timezone)).strftime(
-                        "%d-%b-%y %H:%M:%S"
-                    )
-                    if i.edited_timestamp
-                    else None
-                )
-            else:
-                time = i.id.timestamp.astimezone(pytz.timezone(pytz_timezone)).strftime(
-                    "%d-%b-%y %I:%M:%S%p"
-                )
-                edit_time = (
-                    i.edited_timestamp.astimezone(pytz.timezone(pytz_timezone)).strftime(
-                        "%d-%b-%y %I:%M:%S%p"
-                    )
-                    if i.edited_timestamp
-                    else None
-                )
-            content += "\n[{}] {} ({})\n{}".format(
-                time,
-                i.author.username + "#" + i.author.discriminator,
-                i.author.id,
-                i.content,
-            )
-            if i.embeds:
-                content += "\n{Embed}"
-                for e in i.embeds:
-                    content += f"{newline}{f'{newline}{e.author.url}' if e.author and e.author.url else ''}{f'{newline}{e.author.name}' if e.author and e.author.name else ''}{f'{newline}{e.title}' if e.title else ''}{f'{newline}{e.description}' if e.description else ''}{''.join([f'{newline}{f.name}{newline}{f.value}' for f in e.fields]) if e.fields else ''}{f'{newline}{e.thumbnail.url}' if e.thumbnail else ''}{f'{newline}{e.image.url}' if e.image else ''}"
-            if i.attachments:
-                content += "\n{Attachments}"
-                for a in i.attachments:
-                    content += f"{newline}{a.url}"
-            if i.sticker_items:
-                content += "\n{Stickers}"
-                for s in i.sticker_items:
-                    if s.format_type == 3:
-                        sticker = Sticker(
-                            **await channel._client.get_sticker(i.sticker_items[0].id)
-                        )
-                        content += f"{newline}https://cdn.jsdelivr.net/gh/mahtoid/DiscordUtils@master/stickers/{sticker.pack_id}/{sticker.id}.gif"
-                    else:
-                        content += f"{newline}https://media.discordapp.net/stickers/{s.id}.png"
-            if i.reactions:
-                content += "\n{Reactions}"
-                for r in i.reactions:
-                    content += f"{newline}{r.emoji} - {r.count}"
-            if not content.endswith("\n\n"):
-                content += "\n"
-                if not content.startswith("\n"):
-                    content += "\n"
-        content += "==============================================================\nExported {} messages.\n==============================================================".format(
-            len(msg)
-        )
-        return content
+    finally:
+        await resolver.close()
+        clear_cache()
+    return parts if max_bytes is not None else parts[0]
 
-    elif mode == "csv" or mode == "json":
-        data = []
-        for i in msg:
-            if military_time:
-                time = i.id.timestamp.astimezone(pytz.timezone(pytz_timezone)).strftime(
-                    "%d-%b-%y %H:%M:%S"
-                )
-                edit_time = (
-                    i.edited_timestamp.astimezone(pytz.timezone(pytz_timezone)).strftime(
-                        "%d-%b-%y %H:%M:%S"
-                    )
-                    if i.edited_timestamp
-                    else None
-                )
-            else:
-                time = i.id.timestamp.astimezone(pytz.timezone(pytz_timezone)).strftime(
-                    "%d-%b-%y %I:%M:%S%p"
-                )
-                edit_time = (
-                    i.edited_timestamp.astimezone(pytz.timezone(pytz_timezone)).strftime(
-                        "%d-%b-%y %I:%M:%S%p"
-                    )
-                    if i.edited_timestamp
-                    else None
-                )
-            data.append(
-                {
-                    "Guild": {"name": guild.name, "id": str(guild.id)},
-                    "Channel": {"name": channel.name, "id": str(channel.id)},
-                    "Metadata": {"id": str(i.id)},
-                    "Author": {
-                        "username": i.author.username + "#" + i.author.discriminator,
-                        "id": str(i.author.id),
-                    },
-                    "Time": time,
-                    "Edited": edit_time,
-                    "Content": i.content,
-                    "Embeds": [
-                        {
-                            "title": e.title,
-                            "description": e.description,
-                            "author": {
-                                "name": e.author.name,
-                                "url": e.author.url,
-                                "icon": e.author.icon_url,
-                            }
-                            if e.author
-                            else {},
-                            "thumbnail": e.thumbnail.url if e.thumbnail else None,
-                            "image": e.image.url if e.image else None,
-                            "fields": [
-                                {"name": f.name, "value": f.value, "inline": f.inline}
-                                for f in e.fields
-                            ]
-                            if e.fields
-                            else [],
-                        }
-                        for e in i.embeds
-                    ]
-                    if i.embeds
-                    else [],
-                    "Attachments": [a.url for a in i.attachments] if i.attachments else [],
-                    "Stickers": [
-                        {"name": s.name, "id": str(s.id), "format": s.format_type}
-                        for s in i.sticker_items
-                    ]
-                    if i.sticker_items
-                    else [],
-                    "Reactions": [
-                        {"name": r.emoji.name, "id": str(r.emoji.id), "count": r.count}
-                        for r in i.reactions
-                    ]
-                    if i.reactions
-                    else [],
-                }
+
+async def get_transcript_file(
+    channel: Channel,
+    limit: int = 100,
+    pytz_timezone="UTC",
+    military_time: bool = False,
+    fancy_time: bool = True,
+    mode: str = "html",
+    filename: str = None,
+    spool_size: int = 1024 * 1024,
+    assets: str = None,
+    asset_hosts: List[str] = None,
+    asset_concurrency: int = 8,
+    executor: Executor = None,
+    time_slice: float = None,
+    stats: ExportStats = None,
+    progress: Callable[[int, int], None] = None,
+    rate_limiter: RateLimiter = None,
+    on_stats: Callable[[ExportStats], None] = None,
+    max_api_calls: int = None,
+    max_api_time: float = None,
+    profile_memory: float = None,
+    after: Union[datetime, int] = None,
+    before: Union[datetime, int] = None,
+    authors: List[int] = None,
+    fragment_cache: FragmentCache = None,
+    search_index: bool = False,
+    archive: Archive = None,
+    archive_transcript: str = None,
+) -> File:
+    """
+    Renders the transcript straight into a temporary file that can be uploaded as is.
+    The file is kept in memory until it grows past spool_size, then it is moved to disk.
+
+    :param channel: The channel to get the transcript from
+    :param limit: The maximum number of messages to get, or None to get every message
+    :param pytz_timezone: The timezone to use for the transcript
+    :param military_time: Whether to use military time or not
+    :param fancy_time: Whether to use fancy time or not (only with html mode)
+    :param mode: The mode to use for the transcript (html, json, jsonl, csv, or plain)
+    :param filename: The name of the file, defaults to the channel name
+    :param spool_size: The size in bytes above which the file is written to disk
+    :param assets: Set to "bundle" to download the linked assets and return a zip of the transcript and its assets (only with html mode)
+    :param asset_hosts: The hosts (and path prefixes) to download assets from, the Discord and twemoji CDNs if not given
+    :param asset_concurrency: The maximum number of assets downloaded at the same time
+    :param executor: A ProcessPoolExecutor to render the messages in instead of the event loop (only with html mode), bundled thumbnails are generated in it too
+    :param time_slice: Yield to the event loop whenever rendering has run for this many seconds without pausing
+    :param stats: An ExportStats to record the number of messages and the largest event loop lag of the export in
+    :param progress: A callable taking the number of messages fetched and rendered so far, called as the export goes
+    :param rate_limiter: A RateLimiter to share with other exports, every API request of the export has to pass it
+    :param on_stats: A callable taking the ExportStats of the export, with its stage timings, called when it is done
+    :param max_api_calls: The maximum number of API requests of the export, mentions and references are left unresolved after that
+    :param max_api_time: The number of seconds after which the export stops resolving mentions and references
+    :param profile_memory: The fraction of exports, from 0 to 1, to profile the memory of with tracemalloc, the report is set on the ExportStats or logged
+    :param after: Only get the messages sent after this datetime or message id
+    :param before: Only get the messages sent before this datetime or message id
+    :param authors: Only get the messages of these users or user ids
+    :param fragment_cache: A FragmentCache to reuse the rendered messages of earlier exports from
+    :param search_index: Whether to embed a search index of the messages with a search box (only with html mode)
+    :param archive: An Archive to add the exported messages to
+    :param archive_transcript: Where the transcript is kept, such as a path or URL, recorded in the archive, {channel_id} and {channel} are replaced with the id and name of the channel, the file name if not given
+    :return: A file of the transcript
+    """
+
+    if assets not in (None, "bundle"):
+        raise ValueError("Invalid assets option")
+    if assets == "bundle" and mode != "html":
+        raise ValueError("Assets can only be bundled with html mode")
+
+    resolver = Resolver(
+        channel._client,
+        channel.guild_id,
+        limiter=rate_limiter,
+        budget=_budget(max_api_calls, max_api_time),
+    )
+    try:
+        if assets == "bundle":
+            bundle = AssetBundle(
+                session=resolver.session,
+                concurrency=asset_concurrency,
+                hosts=asset_hosts or default_asset_hosts,
+                executor=executor,
             )
-        df = pd.DataFrame(data)
-        if mode == "csv":
-            df.to_csv(file := io.StringIO(), index=True, header=True)
-            return file.getvalue()
-        elif mode == "json":
-            df.to_json(file := io.StringIO(), index=True, orient="records")
-            return file.getvalue()
+            writer = partial(BundleWriter, max_size=spool_size, bundle=bundle)
+            extension = "zip"
+        else:
+            writer = partial(SpooledWriter, max_size=spool_size)
+            extension = "txt" if mode == "plain" else mode
+        if filename is None:
+            filename = f"{channel.name}.{extension}"
+        if archive_transcript is None:
+            archive_transcript = filename.replace("{", "{{").replace("}", "}}")
 
-    elif mode == "html":
-        time_format = "%A, %e %B %Y at %H:%M" if military_time else "%A, %e %B %Y at %I:%M %p"
-        previous = None
-        data = ""
-        metadata = {}
-        for i in msg:
-            current = i
-            create = i.id.timestamp.astimezone(pytz.timezone(pytz_timezone)).strftime(time_format)
-            edit = (
-                i.edited_timestamp.astimezone(pytz.timezone(pytz_timezone)).strftime(time_format)
-                if i.edited_timestamp
-                else None
+        try:
+            fp = await _transcript(
+                channel,
+                resolver,
+                writer,
+                limit,
+                pytz_timezone,
+                military_time,
+                fancy_time,
+                mode,
+                executor,
+                time_slice=time_slice,
+                stats=stats,
+                progress=progress,
+                on_stats=on_stats,
+                profile_memory=profile_memory,
+                after=after,
+                before=before,
+                authors=authors,
+                fragment_cache=fragment_cache,
+                search_index=search_index,
+                archive=archive,
+                archive_transcript=archive_transcript,
             )
-            if i.type == MessageType.CHANNEL_PINNED_MESSAGE:
-                data += "</div>" if previous is not None else ""
-                with open(dir_path + "/html/messag/pin.html", "r") as f:
-                    rawhtml = f.read()
-                rawhtml = rawhtml.replace("{{PIN_URL}}", Default.pinned_message_icon)
-                rawhtml = rawhtml.replace(
-                    "{{USER_COLOUR}}",
-                    await parse_md(
-                        f"color: {hex(i.author.accent_color)[2:] if i.author.accent_color else '000000'}",
-                        channel,
-                        tz=pytz_timezone,
-                    ),
+        except BaseException:
+            if assets == "bundle":
+                await bundle.discard()
+            raise
+        if assets == "bundle":
+            html_fp = fp
+            fp = tempfile.SpooledTemporaryFile(max_size=spool_size, mode="w+b")
+            try:
+                await bundle.pack(
+                    html_fp, f"{os.path.splitext(os.path.basename(filename))[0]}.html", fp
                 )
-                rawhtml = rawhtml.replace(
-                    "{{NAME}}",
-                    await parse_md(str(html.escape(i.author.username)), channel, tz=pytz_timezone),
-                )
-                rawhtml = rawhtml.replace(
-                    "{{NAME_TAG}}", f"{i.author.username}#{i.author.discriminator}"
-                )
-                rawhtml = rawhtml.replace("{{MESSAGE_ID}}", str(i.id))
-                rawhtml = rawhtml.replace(
-                    "{{REF_MESSAGE_ID}}", str(i.referenced_message.message_id)
-                )
-                data += rawhtml
+            except BaseException:
+                fp.close()
+                raise
+            finally:
+                html_fp.close()
+    finally:
+        await resolver.close()
+        clear_cache()
+    return File(filename, fp=fp)
 
-            elif i.type == MessageType.THREAD_CREATED:
-                data += "</div>" if previous is not None else ""
-                with open(dir_path + "/html/message/thread.html", "r") as f:
-                    rawhtml = f.read()
-                rawhtml = rawhtml.replace("{{THREAD_URL}}", Default.thread_channel_icon)
-                rawhtml = rawhtml.replace("{{THREAD_NAME}}", i.content)
-                rawhtml = rawhtml.replace(
-                    "{{USER_COLOUR}}",
-                    await parse_md(
-                        f"color: {hex(i.author.accent_color)[2:] if i.author.accent_color else '000000'}",
-                        channel,
-                        tz=pytz_timezone,
-                    ),
-                )
-                rawhtml = rawhtml.replace(
-                    "{{NAME}}",
-                    await parse_md(str(html.escape(i.author.username)), channel, tz=pytz_timezone),
-                )
-                rawhtml = rawhtml.replace(
-                    "{{NAME_TAG}}", f"{i.author.username}#{i.author.discriminator}"
+
+async def get_transcripts_batch(
+    channels: List[Channel],
+    limit: int = 100,
+    pytz_timezone="UTC",
+    military_time: bool = False,
+    fancy_time: bool = True,
+    mode: str = "html",
+    max_bytes: int = None,
+    concurrency: int = 4,
+    rate: float = None,
+    return_exceptions: bool = False,
+    executor: Executor = None,
+    time_slice: float = None,
+    on_stats: Callable[[ExportStats], None] = None,
+    max_api_calls: int = None,
+    max_api_time: float = None,
+    profile_memory: float = None,
+    after: Union[datetime, int] = None,
+    before: Union[datetime, int] = None,
+    authors: List[int] = None,
+    fragment_cache: FragmentCache = None,
+    search_index: bool = False,
+    archive: Archive = None,
+    archive_transcript: str = None,
+):
+    """
+    Gets the transcripts of several channels concurrently.
+    All exports share one cache of guilds, members, channels, roles and stickers, one HTTP
+    session and one rate limit, so channels of the same guild look everything up once.
+
+    :param channels: The channels to get the transcripts from
+    :param limit: The maximum number of messages to get per channel, or None to get every message
+    :param pytz_timezone: The timezone to use for the transcripts
+    :param military_time: Whether to use military time or not
+    :param fancy_time: Whether to use fancy time or not (only with html mode)
+    :param mode: The mode to use for the transcripts (html, json, csv, or plain)
+    :param max_bytes: Split each transcript into self-contained parts of at most this many bytes (only with html or plain mode)
+    :param concurrency: The maximum number of channels exported at the same time
+    :param rate: The maximum number of API requests per second across all exports, unlimited if not given
+    :param return_exceptions: Whether to yield the exception of a failed export instead of raising it
+    :param executor: A ProcessPoolExecutor to render the messages in instead of the event loop (only with html mode)
+    :param time_slice: Yield to the event loop whenever rendering has run for this many seconds without pausing
+    :param on_stats: A callable taking the ExportStats of each export, with its stage timings, called when it is done
+    :param max_api_calls: The maximum number of API requests of each export, mentions and references are left unresolved after that
+    :param max_api_time: The number of seconds after which each export stops resolving mentions and references
+    :param profile_memory: The fraction of exports, from 0 to 1, to profile the memory of with tracemalloc, the report is set on the ExportStats or logged
+    :param after: Only get the messages sent after this datetime or message id
+    :param before: Only get the messages sent before this datetime or message id
+    :param authors: Only get the messages of these users or user ids
+    :param fragment_cache: A FragmentCache to reuse the rendered messages of earlier exports from, shared by every export
+    :param search_index: Whether to embed a search index of the messages with a search box (only with html mode)
+    :param archive: An Archive to add the exported messages to
+    :param archive_transcript: Where each transcript is kept, such as a path or URL, recorded in the archive, {channel_id} and {channel} are replaced with the id and name of the channel
+    :return: An async iterator of (channel, transcript) tuples, in the order the exports finish
+    """
+
+    if max_bytes is not None and mode not in ("html", "plain"):
+        raise ValueError("max_bytes is only supported with html or plain mode")
+
+    cache = {}
+    limiter = RateLimiter(rate) if rate else None
+    semaphore = asyncio.Semaphore(concurrency)
+    session = aiohttp.ClientSession()
+
+    async def export(channel):
+        async with semaphore:
+            resolver = Resolver(
+                channel._client,
+                channel.guild_id,
+                session=session,
+                cache=cache,
+                limiter=limiter,
+                budget=_budget(max_api_calls, max_api_time),
+            )
+            try:
+                parts = await _transcript(
+                    channel,
+                    resolver,
+                    partial(PartWriter, max_bytes=max_bytes),
+                    limit,
+                    pytz_timezone,
+                    military_time,
+                    fancy_time,
+                    mode,
+                    executor,
+                    time_slice=time_slice,
+                    on_stats=on_stats,
+                    profile_memory=profile_memory,
+                    after=after,
+                    before=before,
+                    authors=authors,
+                    fragment_cache=fragment_cache,
+                    search_index=search_index,
+                    archive=archive,
+                    archive_transcript=archive_transcript,
                 )
-                rawhtml = rawhtml.replace("{{MESSAGE_ID}}", str(i.id))
-                data += rawhtml
+            except Exception as e:
+                if not return_exceptions:
+                    raise
+                return channel, e
+            return channel, parts if max_bytes is not None else parts[0]
 
-            else:
-                msg_content = ""
-                if i.content:
-                    with open(dir_path + "/html/message/content.html", "r") as f:
-                        rawhtml = f.read()
-                    rawhtml = rawhtml.replace(
-                        "{{MESSAGE_CONTENT}}",
-                        await parse_md(str(html.escape(i.content)), channel, tz=pytz_timezone),
-                    )
-                    rawhtml = rawhtml.replace(
-                        "{{EDIT}}",
-                        f'<span class="chatlog__reference-edited-timestamp" title="{i.edited_timestamp}">(edited)</span>'
-                        if edit
-                        else "",
-                    )
-                    msg_content = rawhtml
-                if not i.referenced_message:
-                    referenced_message = ""
-                else:
-                    if not (
-                        ref := await channel._client.get_message(
-                            channel.id,
-                            int(i.referenced_message._json["id"]),
-                        )
-                    ):
-                        with open(dir_path + "/html/message/reference_unknown.html", "r") as f:
-                            rawhtml = f.read()
-                        referenced_message = rawhtml
-                    else:
-                        ref = Message(**ref)
-                        if not ref.content:
-                            ref.content = "Click to see attachment"
-                        with open(dir_path + "/html/message/reference.html", "r") as f:
-                            rawhtml = f.read()
-                        rawhtml = rawhtml.replace("{{AVATAR_URL}}", ref.author.avatar_url)
-                        rawhtml = rawhtml.replace(
-                            "{{BOT_TAG}}",
-                            '<span class="chatlog__bot-tag">BOT</span>' if ref.author.bot else "",
-                        )
-                        rawhtml = rawhtml.replace(
-                            "{{NAME}}",
-                            await parse_md(
-                                str(html.escape(ref.author.username)), channel, tz=pytz_timezone
-                            ),
-                        )
-                        rawhtml = rawhtml.replace(
-                            "{{NAME_TAG}}",
-                            f"{ref.author.username}#{ref.author.discriminator}",
-                        )
-                        rawhtml = rawhtml.replace(
-                            "{{USER_COLOUR}}",
-                            await parse_md(
-                                f"color: {hex(ref.author.accent_color)[2:] if ref.author.accent_color else '000000'}",
-                                channel,
-                                tz=pytz_timezone,
-                            ),
-                        )
-                        rawhtml = rawhtml.replace(
-                            "{{CONTENT}}",
-                            await parse_msg_ref(ref.content, channel, tz=pytz_timezone),
-                        )
-                        rawhtml = rawhtml.replace(
-                            "{{EDIT}}",
-                            f'<span class="chatlog__reference-edited-timestamp" title="{i.edited_timestamp}">(edited)</span>'
-                            if edit
-                            else "",
-                        )
-                        rawhtml = rawhtml.replace(
-                            "{{ATTACHMENT_ICON}}",
-                            Default.reference_attachment_icon
-                            if ref.embeds or ref.attachments
-                            else "",
-                        )
-                        rawhtml = rawhtml.replace("{{MESSAGE_ID}}", str(ref.id))
-                        referenced_message = rawhtml
+    tasks = [asyncio.ensure_future(export(channel)) for channel in channels]
+    try:
+        for task in asyncio.as_completed(tasks):
+            yield await task
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await session.close()
+        clear_cache()
 
-                if i.sticker_items:
-                    if i.sticker_items[0].format_type == 3:
-                        sticker = Sticker(
-                            **await channel._client.get_sticker(i.sticker_items[0].id)
-                        )
-                        url = f"https://cdn.jsdelivr.net/gh/mahtoid/DiscordUtils@master/stickers/{sticker.pack_id}/{sticker.id}.gif"
-                    else:
-                        url = f"https://media.discordapp.net/stickers/{i.sticker_items[0].id}.png"
 
-                    with open(dir_path + "/html/attachment/image.html", "r") as f:
-                        rawhtml = f.read()
-                    rawhtml = rawhtml.replace("{{ATTACH_URL}}", str(url))
-                    rawhtml = rawhtml.replace("{{ATTACH_URL_THUMB}}", str(url))
-                    msg_content = rawhtml
-
-                embeds = ""
-                if i.embeds:
-                    for e in i.embeds:
-                        (r, g, b) = (
-                            ((e.color >> 16) & 255, (e.color >> 8) & 255, e.color & 255)
-                            if e.color
-                            else (0x20, 0x22, 0x25)
-                        )
+def _archive_location(archive_transcript, channel):
+    if archive_transcript is None:
+        return None
+    return archive_transcript.format(channel_id=int(channel.id), channel=channel.name)
 
-                        title = ""
-                        if e.title:
-                            with open(dir_path + "/html/embed/title.html", "r") as f:
-                                rawhtml = f.read()
-                            rawhtml = rawhtml.replace(
-                                "{{EMBED_TITLE}}",
-                                await parse_md(e.title, channel, tz=pytz_timezone),
-                            )
-                            title = rawhtml
 
-                        description = ""
-                        if e.description:
-                            with open(dir_path + "/html/embed/description.html", "r") as f:
-                                rawhtml = f.read()
-                            rawhtml = rawhtml.replace(
-                                "{{EMBED_DESC}}",
-                                await parse_embed(e.description, channel, tz=pytz_timezone),
-                            )
-                            description = rawhtml
-
-                        fields = ""
-                        if e.fields:
-                            for field in e.fields:
-                                if field.inline:
-                                    with open(dir_path + "/html/embed/field-inline.html", "r") as f:
-                                        rawhtml = f.read()
-                                else:
-                                    with open(dir_path + "/html/embed/field.html", "r") as f:
-                                        rawhtml = f.read()
-                                rawhtml = rawhtml.replace(
-                                    "{{FIELD_NAME}}",
-                                    await parse_md(field.name, channel, tz=pytz_timezone),
-                                )
-                                rawhtml = rawhtml.replace(
-                                    "{{FIELD_VALUE}}",
-                                    await parse_embed(field.value, channel, tz=pytz_timezone),
-                                )
-                                fields += rawhtml
-
-                        author = ""
-                        if e.author:
-                            author = e.author.name if e.author.name else ""
-                            author = (
-                                f'<a class="chatlog__embed-author-name-link" href="{e.author.url}">{author}</a>'
-                                if e.author.url
-                                else author
-                            )
-                            author_icon = ""
-                            if e.author.icon_url:
-                                with open(dir_path + "/html/embed/author_icon.html", "r") as f:
-                                    rawhtml = f.read()
-                                rawhtml = rawhtml.replace("{{AUTHOR}}", author)
-                                rawhtml = rawhtml.replace("{{AUTHOR_ICON}}", e.author.icon_url)
-                                author_icon = rawhtml
-
-                            if author_icon == "" and author != "":
-                                with open(dir_path + "/html/embed/author.html", "r") as f:
-                                    rawhtml = f.read()
-                                rawhtml = rawhtml.replace("{{AUTHOR}}", author)
-                                author = rawhtml
-                            else:
-                                author = author_icon
-
-                        image = ""
-                        if e.image:
-                            with open(dir_path + "/html/embed/image.html", "r") as f:
-                                rawhtml = f.read()
-                            rawhtml = rawhtml.replace("{{EMBED_IMAGE}}", e.image.proxy_url)
-                            image = rawhtml
+def _budget(max_api_calls, max_api_time):
+    if max_api_calls is None and max_api_time is None:
+        return None
+    return ApiBudget(max_api_calls, max_api_time)
 
-                        thumbnail = ""
-                        if e.thumbnail:
-                            with open(dir_path + "/html/embed/thumbnail.html", "r") as f:
-                                rawhtml = f.read()
-                            rawhtml = rawhtml.replace("{{EMBED_THUMBNAIL}}", e.thumbnail.url)
-                            thumbnail = rawhtml
-
-                        footer = ""
-                        if e.footer:
-                            footer = e.footer.text if e.footer.text else ""
-                            icon = e.footer.icon_url if e.footer.icon_url else None
-
-                            if icon is not None:
-                                with open(dir_path + "/html/embed/footer_image.html", "r") as f:
-                                    rawhtml = f.read()
-                                rawhtml = rawhtml.replace("{{EMBED_FOOTER}}", footer)
-                                rawhtml = rawhtml.replace("{{EMBED_FOOTER_ICON}}", icon)
-                            else:
-                                with open(dir_path + "/html/embed/footer.html", "r") as f:
-                                    rawhtml = f.read()
-                                rawhtml = rawhtml.replace("{{EMBED_FOOTER}}", footer)
-                            footer = rawhtml
-
-                        with open(dir_path + "/html/embed/body.html", "r") as f:
-                            rawhtml = f.read()
-                        rawhtml = rawhtml.replace("{{EMBED_R}}", str(r))
-                        rawhtml = rawhtml.replace("{{EMBED_G}}", str(g))
-                        rawhtml = rawhtml.replace("{{EMBED_B}}", str(b))
-                        rawhtml = rawhtml.replace("{{EMBED_AUTHOR}}", author)
-                        rawhtml = rawhtml.replace("{{EMBED_TITLE}}", title)
-                        rawhtml = rawhtml.replace("{{EMBED_IMAGE}}", image)
-                        rawhtml = rawhtml.replace("{{EMBED_THUMBNAIL}}", thumbnail)
-                        rawhtml = rawhtml.replace("{{EMBED_DESC}}", description)
-                        rawhtml = rawhtml.replace("{{EMBED_FIELDS}}", fields)
-                        rawhtml = rawhtml.replace("{{EMBED_FOOTER}}", footer)
-                        embeds += rawhtml
-
-                attachments = ""
-                if i.attachments:
-                    for a in i.attachments:
-                        if a.content_type is None or (
-                            "image" not in a.content_type
-                            and "video" not in a.content_type
-                            and "audio" not in a.content_type
-                        ):
-                            with open(dir_path + "/html/attachment/message.html", "r") as f:
-                                rawhtml = f.read()
-                            rawhtml = rawhtml.replace("{{ATTACH_ICON}}", get_file_icon(a.url))
-                            rawhtml = rawhtml.replace("{{ATTACH_URL}}", str(a.url))
-                            rawhtml = rawhtml.replace(
-                                "{{ATTACH_BYTES}}", str(get_file_size(a.size))
-                            )
-                            rawhtml = rawhtml.replace("{{ATTACH_FILE}}", str(a.filename))
 
-                        else:
-                            if "image" in a.content_type:
-                                with open(dir_path + "/html/attachment/image.html", "r") as f:
-                                    rawhtml = f.read()
-                                rawhtml = rawhtml.replace("{{ATTACH_URL}}", str(a.proxy_url))
-                                rawhtml = rawhtml.replace("{{ATTACH_URL_THUMB}}", str(a.proxy_url))
-                            elif "video" in a.content_type:
-                                with open(dir_path + "/html/attachment/video.html", "r") as f:
-                                    rawhtml = f.read()
-                                rawhtml = rawhtml.replace("{{ATTACH_URL}}", str(a.proxy_url))
-                            elif "audio" in a.content_type:
-                                with open(dir_path + "/html/attachment/audio.html", "r") as f:
-                                    rawhtml = f.read()
-                                rawhtml = rawhtml.replace(
-                                    "{{ATTACH_ICON}}", Default.file_attachment_audio
-                                )
-                                rawhtml = rawhtml.replace("{{ATTACH_URL}}", str(a.url))
-                                rawhtml = rawhtml.replace(
-                                    "{{ATTACH_BYTES}}", str(get_file_size(a.size))
-                                )
-                                rawhtml = rawhtml.replace("{{ATTACH_AUDIO}}", str(a.proxy_url))
-                                rawhtml = rawhtml.replace("{{ATTACH_FILE}}", str(a.filename))
-                        attachments += rawhtml
-
-                components = ""
-                menu_div_id = 0
-                if i.components:
-                    for r in i.components:
-                        for c in r.components:
-                            if c.type == ComponentType.BUTTON:
-                                with open(
-                                    dir_path + "/html/component/component_button.html",
-                                    "r",
-                                ) as f:
-                                    rawhtml = f.read()
-                                rawhtml = rawhtml.replace(
-                                    "{{DISABLED}}",
-                                    "chatlog__component-disabled" if c.disabled else "",
-                                )
-                                rawhtml = rawhtml.replace("{{URL}}", c.url if c.url else "")
-                                rawhtml = rawhtml.replace(
-                                    "{{LABEL}}",
-                                    await parse_md(
-                                        c.label if c.label else "", channel, tz=pytz_timezone
-                                    ),
-                                )
-                                rawhtml = rawhtml.replace(
-                                    "{{EMOJI}}",
-                                    await parse_emoji(
-                                        str(c.emoji) if c.emoji else ""
-                                    ),
-                                )
-                                rawhtml = rawhtml.replace(
-                                    "{{ICON}}",
-                                    Default.button_external_link if c.url else "",
-                                )
-                                rawhtml = rawhtml.replace("{{STYLE}}", styles[c.style.name.lower()])
-                                components += f'<div class="chatlog__components">{rawhtml}</div>'
-
-                            elif c.type == ComponentType.SELECT:
-                                option_content = ""
-                                if not c.disabled:
-                                    option_content = []
-                                    for option in c.options:
-                                        if option.emoji:
-                                            with open(
-                                                dir_path
-                                                + "/html/component/component_menu_option.html",
-                                                "r",
-                                            ) as f:
-                                                rawhtml = f.read()
-                                            rawhtml = rawhtml.replace(
-                                                "{{EMOJI}}",
-                                                await parse_emoji(
-                                                    str(option.emoji)
-                                                ),
-                                            )
-                                            rawhtml = rawhtml.replace(
-                                                "{{TITLE}}",
-                                                await parse_md(
-                                                    str(option.label), channel, tz=pytz_timezone
-                                                ),
-                                            )
-                                            rawhtml = rawhtml.replace(
-                                                "{{DESCRIPTION}}",
-                                                await parse_md(
-                                                    str(option.description)
-                                                    if option.description
-                                                    else "",
-                                                    channel,
-                                                    tz=pytz_timezone,
-                                                ),
-                                            )
-                                        else:
-                                            with open(
-                                                dir_path
-                                                + "/html/component/component_menu_option_emoji.html",
-                                                "r",
-                                            ) as f:
-                                                rawhtml = f.read()
-                                            rawhtml = rawhtml.replace(
-                                                "{{TITLE}}",
-                                                await parse_md(
-                                                    str(option.label), channel, tz=pytz_timezone
-                                                ),
-                                            )
-                                            rawhtml = rawhtml.replace(
-                                                "{{DESCRIPTION}}",
-                                                await parse_md(
-                                                    str(option.description)
-                                                    if option.description
-                                                    else "",
-                                                    channel,
-                                                    tz=pytz_timezone,
-                                                ),
-                                            )
-                                        option_content.append(rawhtml)
-                                    if option_content:
-                                        option_content = f'<div id="dropdownMenu{menu_div_id}" class="dropdownContent">{"".join(content)}</div>'
-
-                                with open(
-                                    dir_path + "/html/component/component_menu.html",
-                                    "r",
-                                ) as f:
-                                    rawhtml = f.read()
-                                rawhtml = rawhtml.replace(
-                                    "{{DISABLED}}",
-                                    "chatlog__component-disabled" if c.disabled else "",
-                                )
-                                rawhtml = rawhtml.replace(
-                                    "{{PLACEHOLDER}}",
-                                    await parse_md(
-                                        c.placeholder if c.placeholder else "",
-                                        channel,
-                                        tz=pytz_timezone,
-                                    ),
-                                )
-                                rawhtml = rawhtml.replace("{{ID}}", str(menu_div_id))
-                                rawhtml = rawhtml.replace("{{CONTENT}}", str(option_content))
-                                rawhtml = rawhtml.replace(
-                                    "{{ICON}}", Default.interaction_dropdown_icon
-                                )
-                                components += f'<div class="chatlog__components">{rawhtml}</div>'
-                                menu_div_id += 1
-
-                reactions = ""
-                if i.reactions:
-                    for r in i.reactions:
-                        if not r.emoji.id:
-                            with open(dir_path + "/html/reaction/emoji.html", "r") as f:
-                                rawhtml = f.read()
-                            rawhtml = rawhtml.replace(
-                                "{{EMOJI}}", await convert_emoji(str(r.emoji))
-                            )
-                            rawhtml = rawhtml.replace("{{EMOJI_COUNT}}", str(r.count))
-                        else:
-                            with open(dir_path + "/html/reaction/custom_emoji.html", "r") as f:
-                                rawhtml = f.read()
-                            rawhtml = rawhtml.replace("{{EMOJI}}", str(r.emoji.id))
-                            rawhtml = rawhtml.replace("{{EMOJI_COUNT}}", str(r.count))
-                            rawhtml = rawhtml.replace(
-                                "{{EMOJI_FILE}}", "gif" if r.emoji.animated else "png"
-                            )
-                        reactions += rawhtml
-
-                if reactions:
-                    reactions = f'<div class="chatlog__reactions">{reactions}</div>'
-
-                if (
-                    previous is None
-                    or referenced_message != ""
-                    or (previous and previous.author.id != i.author.id)
-                    or i.webhook_id is not None
-                    or (
-                        previous and i.id.timestamp > (previous.id.timestamp + timedelta(minutes=4))
-                    )
-                ):
-                    if previous is not None:
-                        data += "</div>"
-                    reference_symbol = ""
-                    if referenced_message != "":
-                        reference_symbol = "<div class='chatlog__reference-symbol'></div>"
+async def _transcript(
+    channel,
+    resolver,
+    writer,
+    limit,
+    pytz_timezone,
+    military_time,
+    fancy_time,
+    mode,
+    executor=None,
+    time_slice=None,
+    stats=None,
+    progress=None,
+    on_stats=None,
+    profile_memory=None,
+    after=None,
+    before=None,
+    authors=None,
+    state=None,
+    fragment_cache=None,
+    search_index=False,
+    archive=None,
+    archive_transcript=None,
+):
+    profiler = MemoryProfiler.sample(profile_memory) if profile_memory else None
+    report = profiler is not None and stats is None and on_stats is None
+    if stats is None and (on_stats is not None or registry.enabled or profiler is not None):
+        stats = ExportStats()
+    if stats is not None:
+        stats.channel_id = int(channel.id)
+        stats.mode = mode
+    slicer = TimeSlicer(time_slice)
+    monitor = LagMonitor() if stats is not None else None
+    if monitor is not None:
+        monitor.start()
+    try:
+        with measure(stats, profiler), stage("render"):
+            result = await _render_transcript(
+                channel,
+                resolver,
+                writer,
+                limit,
+                pytz_timezone,
+                military_time,
+                fancy_time,
+                mode,
+                executor,
+                slicer,
+                stats,
+                progress,
+                after,
+                before,
+                authors,
+                state,
+                fragment_cache,
+                search_index,
+                archive,
+                archive_transcript,
+            )
+    finally:
+        if monitor is not None:
+            stats.max_loop_lag = await monitor.stop()
+            stats.slices = slicer.slices
+        if fragment_cache is not None:
+            fragment_cache.flush()
+        if archive is not None:
+            archive.flush()
+    if report:
+        log.info("Memory profile of %s export of channel %s: %s", mode, channel.id, stats.memory)
+    if stats is not None:
+        if registry.enabled:
+            registry.add(stats, mode)
+        if on_stats is not None:
+            on_stats(stats)
+    return result
 
-                    with open(dir_path + "/html/message/start.html", "r") as f:
-                        rawhtml = f.read()
-                    rawhtml = rawhtml.replace("{{REFERENCE_SYMBOL}}", reference_symbol)
-                    rawhtml = rawhtml.replace("{{REFERENCE}}", referenced_message)
-                    rawhtml = rawhtml.replace("{{AVATAR_URL}}", str(i.author.avatar_url))
-                    rawhtml = rawhtml.replace(
-                        "{{NAME_TAG}}", f"{i.author.username}#{i.author.discriminator}"
-                    )
-                    rawhtml = rawhtml.replace(
-                        "{{USER_ID}}", await parse_md(str(i.author.id), channel, tz=pytz_timezone)
-                    )
-                    rawhtml = rawhtml.replace(
-                        "{{USER_COLOUR}}",
-                        await parse_md(
-                            f"color: {hex(i.author.accent_color)[2:] if i.author.accent_color else '000000'}",
-                            channel,
-                            tz=pytz_timezone,
-                        ),
-                    )
-                    rawhtml = rawhtml.replace("{{USER_ICON}}", "")
-                    rawhtml = rawhtml.replace(
-                        "{{NAME}}",
-                        await parse_md(
-                            str(html.escape(i.author.username)), channel, tz=pytz_timezone
-                        ),
-                    )
-                    rawhtml = rawhtml.replace(
-                        "{{BOT_TAG}}",
-                        '<span class="chatlog__bot-tag">BOT</span>' if i.author.bot else "",
-                    )
-                    rawhtml = rawhtml.replace("{{TIMESTAMP}}", str(create))
-                    rawhtml = rawhtml.replace("{{DEFAULT_TIMESTAMP}}", str(create))
-                    rawhtml = rawhtml.replace(
-                        "{{MESSAGE_ID}}", await parse_md(str(i.id), channel, tz=pytz_timezone)
-                    )
-                    rawhtml = rawhtml.replace("{{MESSAGE_CONTENT}}", msg_content)
-                    rawhtml = rawhtml.replace("{{EMBEDS}}", embeds)
-                    rawhtml = rawhtml.replace("{{EMOJI}}", reactions)
-                    rawhtml = rawhtml.replace("{{ATTACHMENTS}}", attachments)
-                    rawhtml = rawhtml.replace("{{COMPONENTS}}", components)
 
-                else:
-                    with open(dir_path + "/html/message/message.html", "r") as f:
-                        rawhtml = f.read()
-                    rawhtml = rawhtml.replace(
-                        "{{MESSAGE_ID}}", await parse_md(str(i.id), channel, tz=pytz_timezone)
-                    )
-                    rawhtml = rawhtml.replace("{{MESSAGE_CONTENT}}", msg_content)
-                    rawhtml = rawhtml.replace("{{EMBEDS}}", embeds)
-                    rawhtml = rawhtml.replace("{{EMOJI}}", reactions)
-                    rawhtml = rawhtml.replace("{{ATTACHMENTS}}", attachments)
-                    rawhtml = rawhtml.replace("{{COMPONENTS}}", components)
-                    rawhtml = rawhtml.replace("{{TIMESTAMP}}", str(create))
-                    rawhtml = rawhtml.replace("{{TIME}}", str(create.split()[-1]))
-
-                if str(user_id := i.author.id) in metadata:
-                    metadata[str(user_id)][4] += 1
-                else:
-                    username = i.author.username + "#" + i.author.discriminator
-                    created_at = i.author.id.timestamp
-                    bot = i.author.bot
-                    avatar = i.author.avatar_url
-                    joined_at = i.member.joined_at if i.member and i.member.joined_at else None
-                    display_name = (
-                        f'<div class="meta__display-name">{i.member.name}</div>'
-                        if i.member and i.member.name != i.author.username
-                        else ""
-                    )
-                    metadata[str(user_id)] = [
-                        username,
-                        created_at,
-                        bot,
-                        avatar,
-                        1,
-                        joined_at,
-                        display_name,
-                    ]
+async def _render_transcript(
+    channel,
+    resolver,
+    writer,
+    limit,
+    pytz_timezone,
+    military_time,
+    fancy_time,
+    mode,
+    executor,
+    slicer,
+    stats,
+    progress,
+    after,
+    before,
+    authors,
+    state=None,
+    fragment_cache=None,
+    search_index=False,
+    archive=None,
+    archive_transcript=None,
+):
+    msg = await resolver.history(
+        channel,
+        limit,
+        progress=(lambda n: progress(n, 0)) if progress is not None else None,
+        after=to_snowflake(after, high=True),
+        before=to_snowflake(before),
+        authors={to_snowflake(a) for a in authors} if authors else None,
+    )
+    if stats is not None:
+        stats.messages = len(msg)
+    if state is not None and msg:
+        state.last = msg[-1]
 
-                data += rawhtml
-            previous = current
+    def rendered(count):
+        if progress is not None:
+            progress(len(msg), count)
 
-        meta_data_html: str = ""
-        for md in metadata:
-            creation_time = (
-                metadata[str(md)][1]
-                .astimezone(pytz.timezone(pytz_timezone))
-                .strftime("%d/%m/%y @ %T")
+    guild = await resolver.guild()
+
+    if archive is not None:
+        with stage("serialize"):
+            archive.add_channel(
+                channel, guild.id, _archive_location(archive_transcript, channel)
             )
-            joined_time = (
-                metadata[str(md)][5].astimezone(pytz.timezone(pytz_timezone)).strftime("%b %d, %Y")
-                if metadata[str(md)][5]
-                else "Unknown"
+            archive.add(msg, channel, guild.id)
+
+    if mode == "plain":
+        footer = "==============================================================\nExported {} messages.\n=============================================================="
+        writer = writer(
+            "==============================================================\nGuild: {}\nChannel: {}\n==============================================================\n".format(
+                guild.name, channel.name
+            ),
+            lambda counts, messages: footer.format(messages),
+            lambda counts, messages: len(footer.format(messages).encode()),
+        )
+        for n, i in enumerate(msg, 1):
+            content = await _plain_fragment(
+                fragment_cache, resolver, i, pytz_timezone, military_time
             )
-            guild_icon = guild.icon_url if guild.icon else Default.default_avatar
-            with open(dir_path + "/html/message/meta.html", "r") as f:
-                rawhtml = f.read()
-            rawhtml = rawhtml.replace("{{USER_ID}}", str(md))
-            rawhtml = rawhtml.replace("{{USERNAME}}", str(metadata[str(md)][0][:-5]))
-            rawhtml = rawhtml.replace("{{DISCRIMINATOR}}", str(metadata[str(md)][0][-5:]))
-            rawhtml = rawhtml.replace("{{BOT}}", str(metadata[str(md)][2]))
-            rawhtml = rawhtml.replace("{{CREATED_AT}}", str(creation_time))
-            rawhtml = rawhtml.replace("{{JOINED_AT}}", str(joined_time))
-            rawhtml = rawhtml.replace("{{GUILD_ICON}}", str(guild_icon))
-            rawhtml = rawhtml.replace("{{DISCORD_ICON}}", str(Default.logo))
-            rawhtml = rawhtml.replace("{{MEMBER_ID}}", str(md))
-            rawhtml = rawhtml.replace("{{USER_AVATAR}}", str(metadata[str(md)][3]))
-            rawhtml = rawhtml.replace("{{DISPLAY}}", str(metadata[str(md)][6]))
-            rawhtml = rawhtml.replace("{{MESSAGE_COUNT}}", str(metadata[str(md)][4]))
-            meta_data_html += rawhtml
+            with stage("serialize"):
+                writer.write(content, {str(i.author.id): 1})
+            rendered(n)
+            await slicer.tick()
+        with stage("serialize"):
+            return writer.close()
+
+    elif mode == "csv" or mode == "json":
+        data = []
+        for n, i in enumerate(msg, 1):
+            data.append(
+                await _cached_record(
+                    fragment_cache, resolver, i, guild, channel, pytz_timezone, military_time
+                )
+            )
+            rendered(n)
+            await slicer.tick()
+        with stage("serialize"):
+            df = pd.DataFrame(data)
+            if mode == "csv":
+                df.to_csv(file := io.StringIO(), index=True, header=True)
+            elif mode == "json":
+                df.to_json(file := io.StringIO(), index=True, orient="records")
+            writer = writer("", lambda counts, messages: "", lambda counts, messages: 0)
+            writer.write(file.getvalue(), messages=len(msg))
+            return writer.close()
+
+    elif mode == "jsonl":
+        writer = writer("", lambda counts, messages: "", lambda counts, messages: 0)
+        for n, i in enumerate(msg, 1):
+            record = await _cached_record(
+                fragment_cache, resolver, i, guild, channel, pytz_timezone, military_time
+            )
+            with stage("serialize"):
+                writer.write(json.dumps(record) + "\n", {str(i.author.id): 1})
+            rendered(n)
+            await slicer.tick()
+        with stage("serialize"):
+            return writer.close()
 
+    elif mode == "html":
+        time_format = _time_format(military_time)
         _limit = "start"
         if limit:
             _limit = f"latest {limit} messages"
@@ -833,18 +729,15 @@ async def get_transcript(
             rawhtml = f.read()
         rawhtml = rawhtml.replace(
             "{{SERVER_NAME}}",
-            await parse_md(f"{html.escape(guild.name)}", channel, tz=pytz_timezone),
+            await parse_md(f"{html.escape(guild.name)}", resolver, tz=pytz_timezone),
         )
         rawhtml = rawhtml.replace(
             "{{SERVER_AVATAR_URL}}",
             str(guild.icon_url if guild.icon_url else Default.default_avatar),
         )
         rawhtml = rawhtml.replace(
-            "{{CHANNEL_NAME}}", await parse_md(f"{channel.name}", channel, tz=pytz_timezone)
+            "{{CHANNEL_NAME}}", await parse_md(f"{channel.name}", resolver, tz=pytz_timezone)
         )
-        rawhtml = rawhtml.replace("{{MESSAGE_COUNT}}", str(len(msg)))
-        rawhtml = rawhtml.replace("{{MESSAGES}}", data)
-        rawhtml = rawhtml.replace("{{META_DATA}}", meta_data_html)
         rawhtml = rawhtml.replace("{{TIMEZONE}}", str(pytz_timezone))
         rawhtml = rawhtml.replace(
             "{{DATE_TIME}}",
@@ -861,17 +754,1076 @@ async def get_transcript(
         )
         rawhtml = rawhtml.replace("{{CHANNEL_TOPIC}}", str(channel_topic))
         rawhtml = rawhtml.replace("{{CHANNEL_ID}}", str(channel.id))
-        rawhtml = rawhtml.replace("{{MESSAGE_PARTICIPANTS}}", str(len(metadata)))
         rawhtml = rawhtml.replace("{{FANCY_TIME}}", _fancy_time)
         rawhtml = rawhtml.replace("{{SD}}", str(""))
-        final = rawhtml
-        clear_cache()
+        search = SearchIndex(pytz_timezone) if search_index else None
+        if search is None:
+            rawhtml = rawhtml.replace("{{SEARCH}}", "")
+        head, foot = rawhtml.split("{{MESSAGES}}")
+
+        with open(dir_path + "/html/message/meta.html", "r") as f:
+            meta_html = f.read()
+        guild_icon = guild.icon_url if guild.icon else Default.default_avatar
+        metadata = state.metadata if state is not None else {}
+        meta_sizes = {}
+
+        def meta_entry(user_id, message_count):
+            username, created_at, bot, avatar, joined_at, display_name = metadata[user_id]
+            creation_time = created_at.astimezone(pytz.timezone(pytz_timezone)).strftime(
+                "%d/%m/%y @ %T"
+            )
+            joined_time = (
+                joined_at.astimezone(pytz.timezone(pytz_timezone)).strftime("%b %d, %Y")
+                if joined_at
+                else "Unknown"
+            )
+            rawhtml = meta_html.replace("{{USER_ID}}", str(user_id))
+            rawhtml = rawhtml.replace("{{USERNAME}}", str(username[:-5]))
+            rawhtml = rawhtml.replace("{{DISCRIMINATOR}}", str(username[-5:]))
+            rawhtml = rawhtml.replace("{{BOT}}", str(bot))
+            rawhtml = rawhtml.replace("{{CREATED_AT}}", str(creation_time))
+            rawhtml = rawhtml.replace("{{JOINED_AT}}", str(joined_time))
+            rawhtml = rawhtml.replace("{{GUILD_ICON}}", str(guild_icon))
+            rawhtml = rawhtml.replace("{{DISCORD_ICON}}", str(Default.logo))
+            rawhtml = rawhtml.replace("{{MEMBER_ID}}", str(user_id))
+            rawhtml = rawhtml.replace("{{USER_AVATAR}}", str(avatar))
+            rawhtml = rawhtml.replace("{{DISPLAY}}", str(display_name))
+            rawhtml = rawhtml.replace("{{MESSAGE_COUNT}}", str(message_count))
+            return rawhtml
+
+        def footer(counts, message_count):
+            rawhtml = foot.replace("{{MESSAGE_COUNT}}", str(message_count))
+            rawhtml = rawhtml.replace(
+                "{{META_DATA}}", "".join(meta_entry(md, counts[md]) for md in counts)
+            )
+            rawhtml = rawhtml.replace("{{MESSAGE_PARTICIPANTS}}", str(len(counts)))
+            if search is not None:
+                rawhtml = rawhtml.replace("{{SEARCH}}", search.render())
+            return rawhtml
+
+        foot_size = len(
+            foot.replace("{{MESSAGE_COUNT}}", "")
+            .replace("{{META_DATA}}", "")
+            .replace("{{MESSAGE_PARTICIPANTS}}", "")
+            .replace("{{SEARCH}}", "")
+            .encode()
+        )
 
-        return final
+        def footer_size(counts, message_count):
+            size = foot_size + len(str(message_count)) + len(str(len(counts)))
+            if search is not None:
+                size += search.size()
+            for md in counts:
+                if md not in meta_sizes:
+                    meta_sizes[md] = len(meta_entry(md, "").encode())
+                size += meta_sizes[md] + len(str(counts[md]))
+            return size
+
+        writer = writer(head, footer, footer_size, separator="</div>")
+        previous = state.previous if state is not None else None
+        if executor is not None:
+            messages = await _render_pool(
+                executor,
+                msg,
+                channel,
+                resolver,
+                pytz_timezone,
+                time_format,
+                previous,
+                fragment_cache,
+            )
+        else:
+            messages = _render_inline(
+                msg,
+                channel,
+                resolver,
+                pytz_timezone,
+                time_format,
+                slicer,
+                previous,
+                fragment_cache,
+            )
+        group = None
+        group_authors = {}
+        group_messages = 0
+        n = 0
+        async for i, (new_group, rawhtml) in messages:
+            n += 1
+            if new_group:
+                if group is not None:
+                    with stage("serialize"):
+                        writer.write(group, group_authors, group_messages)
+                    if search is not None:
+                        search.commit()
+                group, group_authors, group_messages = "", {}, 0
+            elif group is None:
+                # the message continues the last group of an earlier export
+                group, group_authors, group_messages = "", {}, 0
+                state.continued = True
+            if i.type not in (MessageType.CHANNEL_PINNED_MESSAGE, MessageType.THREAD_CREATED):
+                user_id = str(i.author.id)
+                group_authors[user_id] = group_authors.get(user_id, 0) + 1
+                if user_id not in metadata:
+                    username = i.author.username + "#" + i.author.discriminator
+                    created_at = i.author.id.timestamp
+                    bot = i.author.bot
+                    avatar = i.author.avatar_url
+                    joined_at = i.member.joined_at if i.member and i.member.joined_at else None
+                    display_name = (
+                        f'<div class="meta__display-name">{i.member.name}</div>'
+                        if i.member and i.member.name != i.author.username
+                        else ""
+                    )
+                    metadata[user_id] = [
+                        username,
+                        created_at,
+                        bot,
+                        avatar,
+                        joined_at,
+                        display_name,
+                    ]
+
+            group += rawhtml
+            group_messages += 1
+            if search is not None:
+                search.add(i)
+            rendered(n)
+
+        with stage("serialize"):
+            if group is not None:
+                writer.write(group, group_authors, group_messages)
+            if search is not None:
+                search.commit()
+            return writer.close()
     else:
         raise ValueError("Invalid mode")
 
 
-def setup(client):
+async def _plain_message(i, resolver, pytz_timezone, military_time):
+    """
+    Renders a single message of a plain transcript.
+
+    :return: The text of the message
+    """
+    if military_time:
+        time = i.id.timestamp.astimezone(pytz.timezone(pytz_timezone)).strftime(
+            "%d-%b-%y %H:%M:%S"
+        )
+        edit_time = (
+            i.edited_timestamp.astimezone(pytz.timezone(pytz_timezone)).strftime(
+                "%d-%b-%y %H:%M:%S"
+            )
+            if i.edited_timestamp
+            else None
+        )
+    else:
+        time = i.id.timestamp.astimezone(pytz.timezone(pytz_timezone)).strftime(
+            "%d-%b-%y %I:%M:%S%p"
+        )
+        edit_time = (
+            i.edited_timestamp.astimezone(pytz.timezone(pytz_timezone)).strftime(
+                "%d-%b-%y %I:%M:%S%p"
+            )
+            if i.edited_timestamp
+            else None
+        )
+    content = "\n[{}] {} ({})\n{}".format(
+        time,
+        i.author.username + "#" + i.author.discriminator,
+        i.author.id,
+        i.content,
+    )
+    if i.embeds:
+        content += "\n{Embed}"
+        for e in i.embeds:
+            content += f"{newline}{f'{newline}{e.author.url}' if e.author and e.author.url else ''}{f'{newline}{e.author.name}' if e.author and e.author.name else ''}{f'{newline}{e.title}' if e.title else ''}{f'{newline}{e.description}' if e.description else ''}{''.join([f'{newline}{f.name}{newline}{f.value}' for f in e.fields]) if e.fields else ''}{f'{newline}{e.thumbnail.url}' if e.thumbnail else ''}{f'{newline}{e.image.url}' if e.image else ''}"
+    if i.attachments:
+        content += "\n{Attachments}"
+        for a in i.attachments:
+            content += f"{newline}{a.url}"
+    if i.sticker_items:
+        content += "\n{Stickers}"
+        for s in i.sticker_items:
+            if s.format_type == 3 and (
+                sticker := await resolver.sticker(i.sticker_items[0].id)
+            ):
+                content += f"{newline}https://cdn.jsdelivr.net/gh/mahtoid/DiscordUtils@master/stickers/{sticker.pack_id}/{sticker.id}.gif"
+            else:
+                content += f"{newline}https://media.discordapp.net/stickers/{s.id}.png"
+    if i.reactions:
+        content += "\n{Reactions}"
+        for r in i.reactions:
+            content += f"{newline}{r.emoji} - {r.count}"
+    if not content.endswith("\n\n"):
+        content += "\n\n"
+    return content
+
+
+async def _cached(fragment_cache, resolver, i, options, render):
+    """
+    Gets a fragment of a message from the fragment cache, or renders and stores it.
+    Fragments rendered after the API budget ran out are not stored.
+
+    :param options: The kind of the fragment and the render options it depends on
+    :param render: A coroutine function rendering the fragment as a string
+    :return: The fragment
+    """
+    if fragment_cache is None:
+        return await render()
+    key = fragment_cache.key(i, *options)
+    fragment = fragment_cache.get(key)
+    if fragment is None:
+        fragment = await render()
+        if not resolver.degraded:
+            fragment_cache.put(key, fragment)
+    return fragment
+
+
+async def _plain_fragment(fragment_cache, resolver, i, pytz_timezone, military_time):
+    return await _cached(
+        fragment_cache,
+        resolver,
+        i,
+        ("plain", pytz_timezone, military_time),
+        partial(_plain_message, i, resolver, pytz_timezone, military_time),
+    )
+
+
+async def _cached_record(fragment_cache, resolver, i, guild, channel, pytz_timezone, military_time):
+    if fragment_cache is None:
+        return _message_record(i, guild, channel, pytz_timezone, military_time)
+
+    async def render():
+        return json.dumps(_message_record(i, guild, channel, pytz_timezone, military_time))
+
+    options = ("record", guild.name, guild.id, channel.name, pytz_timezone, military_time)
+    return json.loads(await _cached(fragment_cache, resolver, i, options, render))
+
+
+async def _html_fragment(fragment_cache, i, previous, channel, resolver, pytz_timezone, time_format):
+    if fragment_cache is None:
+        return await _html_message(i, previous, channel, resolver, pytz_timezone, time_format)
+    new_group = _starts_group(i, previous)
+
+    async def render():
+        return (await _html_message(i, previous, channel, resolver, pytz_timezone, time_format))[1]
+
+    options = ("html", new_group, channel.id, pytz_timezone, time_format)
+    return new_group, await _cached(fragment_cache, resolver, i, options, render)
+
+
+async def _prerender(
+    fragment_cache, resolver, i, previous, channel, mode, pytz_timezone, military_time
+):
+    """
+    Renders the fragment of a message into the fragment cache ahead of an export, the
+    same way the export would render it after the previous message.
+    """
+    if mode == "html":
+        await _html_fragment(
+            fragment_cache,
+            i,
+            previous,
+            channel,
+            resolver,
+            pytz_timezone,
+            _time_format(military_time),
+        )
+    elif mode == "plain":
+        await _plain_fragment(fragment_cache, resolver, i, pytz_timezone, military_time)
+    else:
+        guild = await resolver.guild()
+        await _cached_record(
+            fragment_cache, resolver, i, guild, channel, pytz_timezone, military_time
+        )
+
+
+def _time_format(military_time):
+    return "%A, %e %B %Y at %H:%M" if military_time else "%A, %e %B %Y at %I:%M %p"
+
+
+def _starts_group(i, previous):
+    """
+    :return: Whether a message starts a new message group after the previous message
+    """
+    return (
+        i.type in (MessageType.CHANNEL_PINNED_MESSAGE, MessageType.THREAD_CREATED)
+        or previous is None
+        or bool(i.referenced_message)
+        or previous.author.id != i.author.id
+        or i.webhook_id is not None
+        or i.id.timestamp > (previous.id.timestamp + timedelta(minutes=4))
+    )
+
+
+def _message_record(i, guild, channel, pytz_timezone, military_time):
+    """
+    Builds the record of a message used by the csv, json and jsonl modes.
+
+    :return: A dict of the message
+    """
+    if military_time:
+        time = i.id.timestamp.astimezone(pytz.timezone(pytz_timezone)).strftime(
+            "%d-%b-%y %H:%M:%S"
+        )
+        edit_time = (
+            i.edited_timestamp.astimezone(pytz.timezone(pytz_timezone)).strftime(
+                "%d-%b-%y %H:%M:%S"
+            )
+            if i.edited_timestamp
+            else None
+        )
+    else:
+        time = i.id.timestamp.astimezone(pytz.timezone(pytz_timezone)).strftime(
+            "%d-%b-%y %I:%M:%S%p"
+        )
+        edit_time = (
+            i.edited_timestamp.astimezone(pytz.timezone(pytz_timezone)).strftime(
+                "%d-%b-%y %I:%M:%S%p"
+            )
+            if i.edited_timestamp
+            else None
+        )
+    return {
+        "Guild": {"name": guild.name, "id": str(guild.id)},
+        "Channel": {"name": channel.name, "id": str(channel.id)},
+        "Metadata": {"id": str(i.id)},
+        "Author": {
+            "username": i.author.username + "#" + i.author.discriminator,
+            "id": str(i.author.id),
+        },
+        "Time": time,
+        "Edited": edit_time,
+        "Content": i.content,
+        "Embeds": [
+            {
+                "title": e.title,
+                "description": e.description,
+                "author": {
+                    "name": e.author.name,
+                    "url": e.author.url,
+                    "icon": e.author.icon_url,
+                }
+                if e.author
+                else {},
+                "thumbnail": e.thumbnail.url if e.thumbnail else None,
+                "image": e.image.url if e.image else None,
+                "fields": [
+                    {"name": f.name, "value": f.value, "inline": f.inline}
+                    for f in e.fields
+                ]
+                if e.fields
+                else [],
+            }
+            for e in i.embeds
+        ]
+        if i.embeds
+        else [],
+        "Attachments": [a.url for a in i.attachments] if i.attachments else [],
+        "Stickers": [
+            {"name": s.name, "id": str(s.id), "format": s.format_type}
+            for s in i.sticker_items
+        ]
+        if i.sticker_items
+        else [],
+        "Reactions": [
+            {"name": r.emoji.name, "id": str(r.emoji.id), "count": r.count}
+            for r in i.reactions
+        ]
+        if i.reactions
+        else [],
+    }
+
+
+async def _render_inline(
+    msg, channel, resolver, pytz_timezone, time_format, slicer, previous=None, fragment_cache=None
+):
+    for i in msg:
+        yield i, await _html_fragment(
+            fragment_cache, i, previous, channel, resolver, pytz_timezone, time_format
+        )
+        previous = i
+        await slicer.tick()
+
+
+async def _render_pool(
+    executor, msg, channel, resolver, pytz_timezone, time_format, previous=None, fragment_cache=None
+):
+    """
+    Renders the messages in chunks of render_chunk_size in an executor, such as a process pool.
+    Everything the messages refer to is resolved beforehand and handed to the workers as a
+    snapshot, so the workers never call the API.
+
+    :param previous: The message before the first one, if any
+    :param fragment_cache: The FragmentCache the workers open by its path, if any
+    :return: An async iterator of (message, (new_group, html)) tuples, in order
+    """
+    await resolver.prefetch(msg, channel)
+    snapshot = resolver.snapshot()
+    loop = asyncio.get_running_loop()
+    futures = []
+    for start in range(0, len(msg), render_chunk_size):
+        futures.append(
+            loop.run_in_executor(
+                executor,
+                _render_chunk,
+                payload(channel),
+                [payload(i) for i in msg[start : start + render_chunk_size]],
+                payload(msg[start - 1]) if start else previous and payload(previous),
+                snapshot,
+                pytz_timezone,
+                time_format,
+                (fragment_cache.path, fragment_cache.max_bytes) if fragment_cache else None,
+            )
+        )
+
+    async def results():
+        try:
+            for start, future in zip(range(0, len(msg), render_chunk_size), futures):
+                for i, result in zip(msg[start : start + render_chunk_size], await future):
+                    yield i, result
+        finally:
+            for future in futures:
+                future.cancel()
+
+    return results()
+
+
+def _render_chunk(
+    channel, payloads, previous, snapshot, pytz_timezone, time_format, fragment_cache=None
+):
+    """
+    Renders a chunk of messages in a worker.
+
+    :param channel: The payload of the channel
+    :param payloads: The payloads of the messages
+    :param previous: The payload of the message before the chunk, if any
+    :param snapshot: The snapshot of the resolver of the export
+    :param fragment_cache: The path and max_bytes of the FragmentCache of the export, if any
+    :return: A list of (new_group, html) tuples
+    """
+    return asyncio.run(
+        _render_payloads(
+            channel, payloads, previous, snapshot, pytz_timezone, time_format, fragment_cache
+        )
+    )
+
+
+async def _render_payloads(
+    channel, payloads, previous, snapshot, pytz_timezone, time_format, fragment_cache=None
+):
+    resolver = Resolver.from_snapshot(snapshot)
+    fragment_cache = FragmentCache(*fragment_cache) if fragment_cache else None
+    channel = Channel(**channel)
+    previous = Message(**previous) if previous else None
+    results = []
+    try:
+        for payload in payloads:
+            i = Message(**payload)
+            results.append(
+                await _html_fragment(
+                    fragment_cache, i, previous, channel, resolver, pytz_timezone, time_format
+                )
+            )
+            previous = i
+    finally:
+        if fragment_cache is not None:
+            fragment_cache.close()
+        await resolver.close()
+        clear_cache()
+    return results
+
+
+async def _html_message(i, previous, channel, resolver, pytz_timezone, time_format):
+    """
+    Renders a single message of a html transcript.
+
+    :return: A tuple of whether the message starts a new message group, and its html
+    """
+    create = i.id.timestamp.astimezone(pytz.timezone(pytz_timezone)).strftime(time_format)
+    edit = (
+        i.edited_timestamp.astimezone(pytz.timezone(pytz_timezone)).strftime(time_format)
+        if i.edited_timestamp
+        else None
+    )
+    if i.type == MessageType.CHANNEL_PINNED_MESSAGE:
+        new_group = True
+        with open(dir_path + "/html/message/pin.html", "r") as f:
+            rawhtml = f.read()
+        rawhtml = rawhtml.replace("{{PIN_URL}}", Default.pinned_message_icon)
+        rawhtml = rawhtml.replace(
+            "{{USER_COLOUR}}",
+            await parse_md(
+                f"color: {hex(i.author.accent_color)[2:] if i.author.accent_color else '000000'}",
+                resolver,
+                tz=pytz_timezone,
+            ),
+        )
+        rawhtml = rawhtml.replace(
+            "{{NAME}}",
+            await parse_md(str(html.escape(i.author.username)), resolver, tz=pytz_timezone),
+        )
+        rawhtml = rawhtml.replace(
+            "{{NAME_TAG}}", f"{i.author.username}#{i.author.discriminator}"
+        )
+        rawhtml = rawhtml.replace("{{MESSAGE_ID}}", str(i.id))
+        rawhtml = rawhtml.replace(
+            "{{REF_MESSAGE_ID}}", str(i.referenced_message.message_id)
+        )
+
+    elif i.type == MessageType.THREAD_CREATED:
+        new_group = True
+        with open(dir_path + "/html/message/thread.html", "r") as f:
+            rawhtml = f.read()
+        rawhtml = rawhtml.replace("{{THREAD_URL}}", Default.thread_channel_icon)
+        rawhtml = rawhtml.replace("{{THREAD_NAME}}", i.content)
+        rawhtml = rawhtml.replace(
+            "{{USER_COLOUR}}",
+            await parse_md(
+                f"color: {hex(i.author.accent_color)[2:] if i.author.accent_color else '000000'}",
+                resolver,
+                tz=pytz_timezone,
+            ),
+        )
+        rawhtml = rawhtml.replace(
+            "{{NAME}}",
+            await parse_md(str(html.escape(i.author.username)), resolver, tz=pytz_timezone),
+        )
+        rawhtml = rawhtml.replace(
+            "{{NAME_TAG}}", f"{i.author.username}#{i.author.discriminator}"
+        )
+        rawhtml = rawhtml.replace("{{MESSAGE_ID}}", str(i.id))
+
+    else:
+        msg_content = ""
+        if i.content:
+            with open(dir_path + "/html/message/content.html", "r") as f:
+                rawhtml = f.read()
+            rawhtml = rawhtml.replace(
+                "{{MESSAGE_CONTENT}}",
+                await parse_md(str(html.escape(i.content)), resolver, tz=pytz_timezone),
+            )
+            rawhtml = rawhtml.replace(
+                "{{EDIT}}",
+                f'<span class="chatlog__reference-edited-timestamp" title="{i.edited_timestamp}">(edited)</span>'
+                if edit
+                else "",
+            )
+            msg_content = rawhtml
+        if not i.referenced_message:
+            referenced_message = ""
+        else:
+            if not (
+                ref := await resolver.message(
+                    int(channel.id),
+                    int(i.referenced_message._json["id"]),
+                )
+            ):
+                if resolver.degraded:
+                    with open(dir_path + "/html/message/reference_unresolved.html", "r") as f:
+                        rawhtml = f.read()
+                    rawhtml = rawhtml.replace(
+                        "{{MESSAGE_ID}}", str(i.referenced_message._json["id"])
+                    )
+                else:
+                    with open(dir_path + "/html/message/reference_unknown.html", "r") as f:
+                        rawhtml = f.read()
+                referenced_message = rawhtml
+            else:
+                ref_text = ref.content or "Click to see attachment"
+                with open(dir_path + "/html/message/reference.html", "r") as f:
+                    rawhtml = f.read()
+                rawhtml = rawhtml.replace("{{AVATAR_URL}}", ref.author.avatar_url)
+                rawhtml = rawhtml.replace(
+                    "{{BOT_TAG}}",
+                    '<span class="chatlog__bot-tag">BOT</span>' if ref.author.bot else "",
+                )
+                rawhtml = rawhtml.replace(
+                    "{{NAME}}",
+                    await parse_md(
+                        str(html.escape(ref.author.username)), resolver, tz=pytz_timezone
+                    ),
+                )
+                rawhtml = rawhtml.replace(
+                    "{{NAME_TAG}}",
+                    f"{ref.author.username}#{ref.author.discriminator}",
+                )
+                rawhtml = rawhtml.replace(
+                    "{{USER_COLOUR}}",
+                    await parse_md(
+                        f"color: {hex(ref.author.accent_color)[2:] if ref.author.accent_color else '000000'}",
+                        resolver,
+                        tz=pytz_timezone,
+                    ),
+                )
+                rawhtml = rawhtml.replace(
+                    "{{CONTENT}}",
+                    await parse_msg_ref(ref_text, resolver, tz=pytz_timezone),
+                )
+                rawhtml = rawhtml.replace(
+                    "{{EDIT}}",
+                    f'<span class="chatlog__reference-edited-timestamp" title="{i.edited_timestamp}">(edited)</span>'
+                    if edit
+                    else "",
+                )
+                rawhtml = rawhtml.replace(
+                    "{{ATTACHMENT_ICON}}",
+                    Default.reference_attachment_icon
+                    if ref.embeds or ref.attachments
+                    else "",
+                )
+                rawhtml = rawhtml.replace("{{MESSAGE_ID}}", str(ref.id))
+                referenced_message = rawhtml
+
+        if i.sticker_items:
+            if i.sticker_items[0].format_type == 3 and (
+                sticker := await resolver.sticker(i.sticker_items[0].id)
+            ):
+                url = f"https://cdn.jsdelivr.net/gh/mahtoid/DiscordUtils@master/stickers/{sticker.pack_id}/{sticker.id}.gif"
+            else:
+                url = f"https://media.discordapp.net/stickers/{i.sticker_items[0].id}.png"
+
+            with open(dir_path + "/html/attachment/image.html", "r") as f:
+                rawhtml = f.read()
+            rawhtml = rawhtml.replace("{{ATTACH_URL}}", str(url))
+            rawhtml = rawhtml.replace("{{ATTACH_URL_THUMB}}", str(url))
+            msg_content = rawhtml
+
+        embeds = ""
+        if i.embeds:
+            for e in i.embeds:
+                embeds += await _memoized(
+                    resolver,
+                    ("embed", pytz_timezone, json.dumps(payload(e), sort_keys=True)),
+                    partial(_html_embed, e, resolver, pytz_timezone),
+                )
+
+        attachments = ""
+        if i.attachments:
+            for a in i.attachments:
+                if a.content_type is None or (
+                    "image" not in a.content_type
+                    and "video" not in a.content_type
+                    and "audio" not in a.content_type
+                ):
+                    with open(dir_path + "/html/attachment/message.html", "r") as f:
+                        rawhtml = f.read()
+                    rawhtml = rawhtml.replace("{{ATTACH_ICON}}", get_file_icon(a.url))
+                    rawhtml = rawhtml.replace("{{ATTACH_URL}}", str(a.url))
+                    rawhtml = rawhtml.replace(
+                        "{{ATTACH_BYTES}}", str(get_file_size(a.size))
+                    )
+                    rawhtml = rawhtml.replace("{{ATTACH_FILE}}", str(a.filename))
+
+                else:
+                    if "image" in a.content_type:
+                        with open(dir_path + "/html/attachment/image.html", "r") as f:
+                            rawhtml = f.read()
+                        rawhtml = rawhtml.replace("{{ATTACH_URL}}", str(a.proxy_url))
+                        rawhtml = rawhtml.replace("{{ATTACH_URL_THUMB}}", str(a.proxy_url))
+                    elif "video" in a.content_type:
+                        with open(dir_path + "/html/attachment/video.html", "r") as f:
+                            rawhtml = f.read()
+                        rawhtml = rawhtml.replace("{{ATTACH_URL}}", str(a.proxy_url))
+                    elif "audio" in a.content_type:
+                        with open(dir_path + "/html/attachment/audio.html", "r") as f:
+                            rawhtml = f.read()
+                        rawhtml = rawhtml.replace(
+                            "{{ATTACH_ICON}}", Default.file_attachment_audio
+                        )
+                        rawhtml = rawhtml.replace("{{ATTACH_URL}}", str(a.url))
+                        rawhtml = rawhtml.replace(
+                            "{{ATTACH_BYTES}}", str(get_file_size(a.size))
+                        )
+                        rawhtml = rawhtml.replace("{{ATTACH_AUDIO}}", str(a.proxy_url))
+                        rawhtml = rawhtml.replace("{{ATTACH_FILE}}", str(a.filename))
+                attachments += rawhtml
+
+        components = ""
+        if i.components:
+            components = await _memoized(
+                resolver,
+                (
+                    "components",
+                    pytz_timezone,
+                    json.dumps([payload(r) for r in i.components], sort_keys=True),
+                ),
+                partial(_html_components, i, resolver, pytz_timezone),
+            )
+
+        reactions = ""
+        if i.reactions:
+            for r in i.reactions:
+                if not r.emoji.id:
+                    with open(dir_path + "/html/reaction/emoji.html", "r") as f:
+                        rawhtml = f.read()
+                    rawhtml = rawhtml.replace(
+                        "{{EMOJI}}",
+                        await convert_emoji(str(r.emoji), session=resolver.session),
+                    )
+                    rawhtml = rawhtml.replace("{{EMOJI_COUNT}}", str(r.count))
+                else:
+                    with open(dir_path + "/html/reaction/custom_emoji.html", "r") as f:
+                        rawhtml = f.read()
+                    rawhtml = rawhtml.replace("{{EMOJI}}", str(r.emoji.id))
+                    rawhtml = rawhtml.replace("{{EMOJI_COUNT}}", str(r.count))
+                    rawhtml = rawhtml.replace(
+                        "{{EMOJI_FILE}}", "gif" if r.emoji.animated else "png"
+                    )
+                reactions += rawhtml
+
+        if reactions:
+            reactions = f'<div class="chatlog__reactions">{reactions}</div>'
+
+        if _starts_group(i, previous):
+            new_group = True
+            reference_symbol = ""
+            if referenced_message != "":
+                reference_symbol = "<div class='chatlog__reference-symbol'></div>"
+
+            rawhtml = await _memoized(
+                resolver,
+                (
+                    "author",
+                    pytz_timezone,
+                    str(i.author.id),
+                    i.author.username,
+                    i.author.discriminator,
+                    str(i.author.avatar_url),
+                    i.author.accent_color,
+                    i.author.bot,
+                ),
+                partial(_html_group_start, i, resolver, pytz_timezone),
+            )
+            rawhtml = rawhtml.replace("{{REFERENCE_SYMBOL}}", reference_symbol)
+            rawhtml = rawhtml.replace("{{REFERENCE}}", referenced_message)
+            rawhtml = rawhtml.replace("{{TIMESTAMP}}", str(create))
+            rawhtml = rawhtml.replace("{{DEFAULT_TIMESTAMP}}", str(create))
+            rawhtml = rawhtml.replace(
+                "{{MESSAGE_ID}}", await parse_md(str(i.id), resolver, tz=pytz_timezone)
+            )
+            rawhtml = rawhtml.replace("{{MESSAGE_CONTENT}}", msg_content)
+            rawhtml = rawhtml.replace("{{EMBEDS}}", embeds)
+            rawhtml = rawhtml.replace("{{EMOJI}}", reactions)
+            rawhtml = rawhtml.replace("{{ATTACHMENTS}}", attachments)
+            rawhtml = rawhtml.replace("{{COMPONENTS}}", components)
+
+        else:
+            new_group = False
+            with open(dir_path + "/html/message/message.html", "r") as f:
+                rawhtml = f.read()
+            rawhtml = rawhtml.replace(
+                "{{MESSAGE_ID}}", await parse_md(str(i.id), resolver, tz=pytz_timezone)
+            )
+            rawhtml = rawhtml.replace("{{MESSAGE_CONTENT}}", msg_content)
+            rawhtml = rawhtml.replace("{{EMBEDS}}", embeds)
+            rawhtml = rawhtml.replace("{{EMOJI}}", reactions)
+            rawhtml = rawhtml.replace("{{ATTACHMENTS}}", attachments)
+            rawhtml = rawhtml.replace("{{COMPONENTS}}", components)
+            rawhtml = rawhtml.replace("{{TIMESTAMP}}", str(create))
+            rawhtml = rawhtml.replace("{{TIME}}", str(create.split()[-1]))
+
+    return new_group, rawhtml
+
+
+async def _memoized(resolver, key, render):
+    """
+    Gets a fragment rendered earlier in the same export, or renders and remembers it.
+
+    :param key: The structural key of the fragment, such as the kind and payload of an embed
+    :param render: A coroutine function rendering the fragment
+    :return: The fragment
+    """
+    try:
+        return resolver.memo[key]
+    except KeyError:
+        fragment = resolver.memo[key] = await render()
+        return fragment
+
+
+async def _html_group_start(i, resolver, pytz_timezone):
+    """
+    Fills the author of a message into the header of a message group, which is the same
+    for every group of the author.
+
+    :return: The start.html template with the author filled in
+    """
+    with open(dir_path + "/html/message/start.html", "r") as f:
+        rawhtml = f.read()
+    rawhtml = rawhtml.replace("{{AVATAR_URL}}", str(i.author.avatar_url))
+    rawhtml = rawhtml.replace("{{NAME_TAG}}", f"{i.author.username}#{i.author.discriminator}")
+    rawhtml = rawhtml.replace(
+        "{{USER_ID}}", await parse_md(str(i.author.id), resolver, tz=pytz_timezone)
+    )
+    rawhtml = rawhtml.replace(
+        "{{USER_COLOUR}}",
+        await parse_md(
+            f"color: {hex(i.author.accent_color)[2:] if i.author.accent_color else '000000'}",
+            resolver,
+            tz=pytz_timezone,
+        ),
+    )
+    rawhtml = rawhtml.replace("{{USER_ICON}}", "")
+    rawhtml = rawhtml.replace(
+        "{{NAME}}",
+        await parse_md(str(html.escape(i.author.username)), resolver, tz=pytz_timezone),
+    )
+    rawhtml = rawhtml.replace(
+        "{{BOT_TAG}}",
+        '<span class="chatlog__bot-tag">BOT</span>' if i.author.bot else "",
+    )
+    return rawhtml
+
+
+async def _html_embed(e, resolver, pytz_timezone):
+    """
+    Renders an embed of a html transcript.
+
+    :return: The html of the embed
+    """
+    (r, g, b) = (
+        ((e.color >> 16) & 255, (e.color >> 8) & 255, e.color & 255)
+        if e.color
+        else (0x20, 0x22, 0x25)
+    )
+
+    title = ""
+    if e.title:
+        with open(dir_path + "/html/embed/title.html", "r") as f:
+            rawhtml = f.read()
+        rawhtml = rawhtml.replace(
+            "{{EMBED_TITLE}}",
+            await parse_md(e.title, resolver, tz=pytz_timezone),
+        )
+        title = rawhtml
+
+    description = ""
+    if e.description:
+        with open(dir_path + "/html/embed/description.html", "r") as f:
+            rawhtml = f.read()
+        rawhtml = rawhtml.replace(
+            "{{EMBED_DESC}}",
+            await parse_embed(e.description, resolver, tz=pytz_timezone),
+        )
+        description = rawhtml
+
+    fields = ""
+    if e.fields:
+        for field in e.fields:
+            if field.inline:
+                with open(dir_path + "/html/embed/field-inline.html", "r") as f:
+                    rawhtml = f.read()
+            else:
+                with open(dir_path + "/html/embed/field.html", "r") as f:
+                    rawhtml = f.read()
+            rawhtml = rawhtml.replace(
+                "{{FIELD_NAME}}",
+                await parse_md(field.name, resolver, tz=pytz_timezone),
+            )
+            rawhtml = rawhtml.replace(
+                "{{FIELD_VALUE}}",
+                await parse_embed(field.value, resolver, tz=pytz_timezone),
+            )
+            fields += rawhtml
+
+    author = ""
+    if e.author:
+        author = e.author.name if e.author.name else ""
+        author = (
+            f'<a class="chatlog__embed-author-name-link" href="{e.author.url}">{author}</a>'
+            if e.author.url
+            else author
+        )
+        author_icon = ""
+        if e.author.icon_url:
+            with open(dir_path + "/html/embed/author_icon.html", "r") as f:
+                rawhtml = f.read()
+            rawhtml = rawhtml.replace("{{AUTHOR}}", author)
+            rawhtml = rawhtml.replace("{{AUTHOR_ICON}}", e.author.icon_url)
+            author_icon = rawhtml
+
+        if author_icon == "" and author != "":
+            with open(dir_path + "/html/embed/author.html", "r") as f:
+                rawhtml = f.read()
+            rawhtml = rawhtml.replace("{{AUTHOR}}", author)
+            author = rawhtml
+        else:
+            author = author_icon
+
+    image = ""
+    if e.image:
+        with open(dir_path + "/html/embed/image.html", "r") as f:
+            rawhtml = f.read()
+        rawhtml = rawhtml.replace("{{EMBED_IMAGE}}", e.image.proxy_url)
+        image = rawhtml
+
+    thumbnail = ""
+    if e.thumbnail:
+        with open(dir_path + "/html/embed/thumbnail.html", "r") as f:
+            rawhtml = f.read()
+        rawhtml = rawhtml.replace("{{EMBED_THUMBNAIL}}", e.thumbnail.url)
+        thumbnail = rawhtml
+
+    footer = ""
+    if e.footer:
+        footer = e.footer.text if e.footer.text else ""
+        icon = e.footer.icon_url if e.footer.icon_url else None
+
+        if icon is not None:
+            with open(dir_path + "/html/embed/footer_image.html", "r") as f:
+                rawhtml = f.read()
+            rawhtml = rawhtml.replace("{{EMBED_FOOTER}}", footer)
+            rawhtml = rawhtml.replace("{{EMBED_FOOTER_ICON}}", icon)
+        else:
+            with open(dir_path + "/html/embed/footer.html", "r") as f:
+                rawhtml = f.read()
+            rawhtml = rawhtml.replace("{{EMBED_FOOTER}}", footer)
+        footer = rawhtml
+
+    with open(dir_path + "/html/embed/body.html", "r") as f:
+        rawhtml = f.read()
+    rawhtml = rawhtml.replace("{{EMBED_R}}", str(r))
+    rawhtml = rawhtml.replace("{{EMBED_G}}", str(g))
+    rawhtml = rawhtml.replace("{{EMBED_B}}", str(b))
+    rawhtml = rawhtml.replace("{{EMBED_AUTHOR}}", author)
+    rawhtml = rawhtml.replace("{{EMBED_TITLE}}", title)
+    rawhtml = rawhtml.replace("{{EMBED_IMAGE}}", image)
+    rawhtml = rawhtml.replace("{{EMBED_THUMBNAIL}}", thumbnail)
+    rawhtml = rawhtml.replace("{{EMBED_DESC}}", description)
+    rawhtml = rawhtml.replace("{{EMBED_FIELDS}}", fields)
+    rawhtml = rawhtml.replace("{{EMBED_FOOTER}}", footer)
+    return rawhtml
+
+
+async def _html_components(i, resolver, pytz_timezone):
+    """
+    Renders the components of a message of a html transcript.
+
+    :return: The html of the components
+    """
+    components = ""
+    menu_div_id = 0
+    for r in i.components:
+        for c in r.components:
+            if c.type == ComponentType.BUTTON:
+                with open(
+                    dir_path + "/html/component/component_button.html",
+                    "r",
+                ) as f:
+                    rawhtml = f.read()
+                rawhtml = rawhtml.replace(
+                    "{{DISABLED}}",
+                    "chatlog__component-disabled" if c.disabled else "",
+                )
+                rawhtml = rawhtml.replace("{{URL}}", c.url if c.url else "")
+                rawhtml = rawhtml.replace(
+                    "{{LABEL}}",
+                    await parse_md(
+                        c.label if c.label else "", resolver, tz=pytz_timezone
+                    ),
+                )
+                rawhtml = rawhtml.replace(
+                    "{{EMOJI}}",
+                    await parse_emoji(
+                        str(c.emoji) if c.emoji else "", resolver
+                    ),
+                )
+                rawhtml = rawhtml.replace(
+                    "{{ICON}}",
+                    Default.button_external_link if c.url else "",
+                )
+                rawhtml = rawhtml.replace("{{STYLE}}", styles[c.style.name.lower()])
+                components += f'<div class="chatlog__components">{rawhtml}</div>'
+
+            elif c.type == ComponentType.SELECT:
+                option_content = ""
+                if not c.disabled:
+                    option_content = []
+                    for option in c.options:
+                        if option.emoji:
+                            with open(
+                                dir_path
+                                + "/html/component/component_menu_option.html",
+                                "r",
+                            ) as f:
+                                rawhtml = f.read()
+                            rawhtml = rawhtml.replace(
+                                "{{EMOJI}}",
+                                await parse_emoji(
+                                    str(option.emoji), resolver
+                                ),
+                            )
+                            rawhtml = rawhtml.replace(
+                                "{{TITLE}}",
+                                await parse_md(
+                                    str(option.label), resolver, tz=pytz_timezone
+                                ),
+                            )
+                            rawhtml = rawhtml.replace(
+                                "{{DESCRIPTION}}",
+                                await parse_md(
+                                    str(option.description)
+                                    if option.description
+                                    else "",
+                                    resolver,
+                                    tz=pytz_timezone,
+                                ),
+                            )
+                        else:
+                            with open(
+                                dir_path
+                                + "/html/component/component_menu_option_emoji.html",
+                                "r",
+                            ) as f:
+                                rawhtml = f.read()
+                            rawhtml = rawhtml.replace(
+                                "{{TITLE}}",
+                                await parse_md(
+                                    str(option.label), resolver, tz=pytz_timezone
+                                ),
+                            )
+                            rawhtml = rawhtml.replace(
+                                "{{DESCRIPTION}}",
+                                await parse_md(
+                                    str(option.description)
+                                    if option.description
+                                    else "",
+                                    resolver,
+                                    tz=pytz_timezone,
+                                ),
+                            )
+                        option_content.append(rawhtml)
+                    if option_content:
+                        option_content = f'<div id="dropdownMenu{menu_div_id}" class="dropdownContent">{"".join(content)}</div>'
+
+                with open(
+                    dir_path + "/html/component/component_menu.html",
+                    "r",
+                ) as f:
+                    rawhtml = f.read()
+                rawhtml = rawhtml.replace(
+                    "{{DISABLED}}",
+                    "chatlog__component-disabled" if c.disabled else "",
+                )
+                rawhtml = rawhtml.replace(
+                    "{{PLACEHOLDER}}",
+                    await parse_md(
+                        c.placeholder if c.placeholder else "",
+                        resolver,
+                        tz=pytz_timezone,
+                    ),
+                )
+                rawhtml = rawhtml.replace("{{ID}}", str(menu_div_id))
+                rawhtml = rawhtml.replace("{{CONTENT}}", str(option_content))
+                rawhtml = rawhtml.replace(
+                    "{{ICON}}", Default.interaction_dropdown_icon
+                )
+                components += f'<div class="chatlog__components">{rawhtml}</div>'
+                menu_div_id += 1
+    return components
+
+
+def setup(client, workers=2, rate=None, live_directory=None, max_live_messages=10000):
     Channel.get_transcript = get_transcript
-    return Transcript(client)
+    Channel.get_transcript_file = get_transcript_file
+    return Transcript(client, workers, rate, live_directory, max_live_messages)
@@ -2,12 +2,14 @@ import datetime
 import html
 import math
 import re
+from functools import wraps
 
 import pytz
 
-from interactions import Channel, Guild, LibraryException, Member, User
+from interactions import Channel
 
 from .emoji_convert import convert_emoji
+from .metrics import timed
 
 styles = {
     "primary": "#5865F2",
@@ -18,6 +20,9 @@ styles = {
 }
 
 
+discord_epoch = 1420070400000
+
+
 class Default:
     logo: str = "https://cdn.jsdelivr.net/gh/mahtoid/DiscordUtils@master/discord-logo.svg"
     default_avatar: str = (
@@ -80,6 +85,25 @@ class Regex:
     ESCAPE_AMP = "______amp______"
 
 
+def to_snowflake(value, high=False):
+    """
+    Converts a datetime, Snowflake, object with an id or id to a snowflake.
+    Naive datetimes are taken as UTC.
+
+    :param value: The value to convert
+    :param high: Whether a datetime becomes the largest snowflake of its millisecond instead of the smallest
+    :return: The snowflake as an int, or None if value is None
+    """
+    if value is None:
+        return None
+    if isinstance(value, datetime.datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=datetime.timezone.utc)
+        snowflake = (int(value.timestamp() * 1000) - discord_epoch) << 22
+        return snowflake + (1 << 22) - 1 if high else snowflake
+    return int(getattr(value, "id", value))
+
+
 async def escape_mention(content):
     for match in re.finditer(f"({Regex.REGEX_ROLES}|{Regex.REGEX_MEMBERS}|{Regex.REGEX_CHANNELS}|{Regex.REGEX_EMOJIS}|{Regex.REGEX_ROLES_2}|{Regex.REGEX_MEMBERS_2}|{Regex.REGEX_CHANNELS_2}|{Regex.REGEX_EMOJIS_2})", content):
         pre_content = content[: match.start()]
@@ -104,38 +128,34 @@ async def unescape_mention(content):
     )
 
 
-async def channel_mention(content, c):
+async def channel_mention(content, resolver):
     for regex in [Regex.REGEX_CHANNELS, Regex.REGEX_CHANNELS_2]:
         match = re.search(regex, content)
         while match is not None:
             channel_id = int(match[1])
-            channel = Channel(**await c._client.get_channel(channel_id))
+            channel = await resolver.channel(channel_id)
 
-            content = content.replace(
-                content[match.start() : match.end()],
-                "#deleted-channel"
-                if channel is None
-                else '<span class="mention" title="%s">#%s</span>' % (channel.id, channel.name),
-            )
+            if channel is not None:
+                c = '<span class="mention" title="%s">#%s</span>' % (channel.id, channel.name)
+            elif resolver.degraded:
+                c = '<span class="mention" title="%s">&lt;#%s></span>' % (channel_id, channel_id)
+            else:
+                c = "#deleted-channel"
+            content = content.replace(content[match.start() : match.end()], c)
 
             match = re.search(regex, content)
     return content
 
 
-async def member_mention(content, c):
+async def member_mention(content, resolver):
     for regex in [Regex.REGEX_MEMBERS, Regex.REGEX_MEMBERS_2]:
         match = re.search(regex, content)
         while match is not None:
             member_id = int(match[1])
-            member = False
-            try:
-                member_name = (
-                    Member(**await c._client.get_member(c.guild_id, member_id)).name
-                    or User(**await c._client.get_user(member_id)).username
-                )
-                member = True
-            except AttributeError:
-                member_name = member
+            member_name = getattr(await resolver.member(member_id), "name", None)
+            if not member_name:
+                member_name = getattr(await resolver.user(member_id), "username", None)
+            member = bool(member_name)
 
             content = content.replace(
                 content[match.start() : match.end()],
@@ -149,16 +169,12 @@ async def member_mention(content, c):
     return content
 
 
-async def role_mention(content, c):
+async def role_mention(content, resolver):
     for regex in [Regex.REGEX_ROLES, Regex.REGEX_ROLES_2]:
         match = re.search(regex, content)
         while match is not None:
             role_id = int(match[1])
-            role = None
-            try:
-                role = await Guild(**await c._client.get_guild(c.guild_id)).get_role(role_id)
-            except LibraryException:
-                pass
+            role = await resolver.role(role_id)
 
             if role is None:
                 r = "@deleted-role"
@@ -194,7 +210,26 @@ async def time_mention(content, tz):
         return content
 
 
-async def parse_mention(content, channel, tz):
+def _accepts_channel(func):
+    # The parse functions used to take the channel of the transcript, a Channel is still
+    # accepted and looked up through a resolver of its own
+    @wraps(func)
+    async def wrapper(content, resolver, *args, **kwargs):
+        if not isinstance(resolver, Channel):
+            return await func(content, resolver, *args, **kwargs)
+        from .resolver import Resolver
+
+        resolver = Resolver(resolver._client, resolver.guild_id)
+        try:
+            return await func(content, resolver, *args, **kwargs)
+        finally:
+            await resolver.close()
+
+    return wrapper
+
+
+@_accepts_channel
+async def parse_mention(content, resolver, tz):
     return await time_mention(
         await role_mention(
             (
@@ -204,13 +239,13 @@ async def parse_mention(content, channel, tz):
                             await unescape_mention(
                                 await escape_mention(await escape_mention(content))
                             ),
-                            channel,
+                            resolver,
                         )
                     ),
-                    channel,
+                    resolver,
                 )
             ),
-            channel,
+            resolver,
         ),
         tz,
     )
@@ -501,7 +536,7 @@ def embed_markdown(content):
     return new_content
 
 
-async def parse_emoji(content):
+async def parse_emoji(content, resolver=None):
     holder = (
         [
             r"&lt;:.*?:(\d*)&gt;",
@@ -521,7 +556,10 @@ async def parse_emoji(content):
         ],
     )
 
-    content = await convert_emoji(list(content))
+    if isinstance(resolver, Channel):
+        resolver = None
+    session = resolver.session if resolver is not None else None
+    content = await convert_emoji(content, session=session)
 
     for x in holder:
         p, r = x
@@ -537,24 +575,33 @@ def parse_br(content):
     return content.replace("<br>", " ")
 
 
-async def parse_md(content, channel, tz):
+@timed("markdown")
+@_accepts_channel
+async def parse_md(content, resolver, tz):
     return await parse_emoji(
-        code_block_markdown(normal_markdown(links(await parse_mention(content, channel, tz)))),
+        code_block_markdown(normal_markdown(links(await parse_mention(content, resolver, tz)))),
+        resolver,
     )
 
 
-async def parse_embed(content, channel, tz):
+@timed("markdown")
+@_accepts_channel
+async def parse_embed(content, resolver, tz):
     return await parse_emoji(
         code_block_markdown(
-            normal_markdown(embed_markdown(links(await parse_mention(content, channel, tz))))
+            normal_markdown(embed_markdown(links(await parse_mention(content, resolver, tz))))
         ),
+        resolver,
     )
 
 
-async def parse_msg_ref(content, channel, tz):
+@timed("markdown")
+@_accepts_channel
+async def parse_msg_ref(content, resolver, tz):
     return parse_br(
         await parse_emoji(
-            code_block_markdown(normal_markdown(links(await parse_mention(content, channel, tz)))),
+            code_block_markdown(normal_markdown(links(await parse_mention(content, resolver, tz)))),
+            resolver,
         )
     )
 
@@ -0,0 +1,257 @@
+import os
+import tempfile
+
+
+class PartWriter:
+    """
+    Assembles rendered message groups into transcript parts.
+
+    Every part is self-contained: it starts with the head, ends with a footer built from
+    the messages and participants of that part only, and never splits a message group.
+    Sizes are tracked as groups are written, so a part is closed before the group that
+    would push it over ``max_bytes``. A single group larger than the budget is still
+    written as a part on its own.
+    """
+
+    def __init__(self, head, footer, footer_size, separator="", max_bytes=None):
+        """
+        :param head: The text every part starts with
+        :param footer: A callable taking (participant counts, message count) and returning the footer
+        :param footer_size: A callable taking the same arguments and returning the footer size in bytes
+        :param separator: The text written between two message groups
+        :param max_bytes: The maximum size of a part in bytes, or None for a single part
+        """
+        self.head = head
+        self.footer = footer
+        self.footer_size = footer_size
+        self.separator = separator
+        self.max_bytes = max_bytes
+        self.parts = []
+
+        self._head_size = len(head.encode())
+        self._separator_size = len(separator.encode())
+        self._reset()
+
+    def _reset(self):
+        self._groups = []
+        self._counts = {}
+        self._messages = 0
+        self._size = self._head_size
+
+    def write(self, text, authors=None, messages=1):
+        """
+        Adds a message group to the current part.
+
+        :param text: The rendered message group
+        :param authors: A dict of author id to the number of their messages in the group
+        :param messages: The number of messages in the group
+        """
+        authors = authors or {}
+        size = len(text.encode())
+
+        if self.max_bytes is not None and self._groups:
+            counts = self._merge(authors)
+            total = (
+                self._size
+                + self._separator_size
+                + size
+                + self.footer_size(counts, self._messages + messages)
+            )
+            if total > self.max_bytes:
+                self._flush()
+
+        if self._groups:
+            self._size += self._separator_size
+        self._size += size
+        self._groups.append(text)
+        self._counts = self._merge(authors)
+        self._messages += messages
+
+    def _merge(self, authors):
+        counts = dict(self._counts)
+        for author, count in authors.items():
+            counts[author] = counts.get(author, 0) + count
+        return counts
+
+    def _flush(self):
+        self.parts.append(
+            self.head
+            + self.separator.join(self._groups)
+            + self.footer(self._counts, self._messages)
+        )
+        self._reset()
+
+    def close(self):
+        """
+        Closes the current part.
+
+        :return: A list of the transcript parts
+        """
+        self._flush()
+        return self.parts
+
+
+class SpooledWriter(PartWriter):
+    """
+    Writes a transcript into a SpooledTemporaryFile while it is rendered.
+
+    The head is written straight away and every message group as soon as it is complete,
+    so the transcript is never held as a whole string. The file stays in memory until it
+    grows past ``max_size`` and is then rolled over to disk.
+    """
+
+    def __init__(self, head, footer, footer_size, separator="", max_size=1024 * 1024):
+        """
+        :param head: The text the transcript starts with
+        :param footer: A callable taking (participant counts, message count) and returning the footer
+        :param footer_size: Unused, accepted to match PartWriter
+        :param separator: The text written between two message groups
+        :param max_size: The size in bytes above which the file is moved to disk
+        """
+        super().__init__(head, footer, footer_size, separator)
+        self.file = tempfile.SpooledTemporaryFile(max_size=max_size, mode="w+b")
+        self._write(head)
+
+    def write(self, text, authors=None, messages=1):
+        """
+        Writes a message group to the file.
+
+        :param text: The rendered message group
+        :param authors: A dict of author id to the number of their messages in the group
+        :param messages: The number of messages in the group
+        """
+        if self._messages:
+            self._write(self.separator)
+        self._write(text)
+        self._counts = self._merge(authors or {})
+        self._messages += messages
+
+    def close(self):
+        """
+        Writes the footer and rewinds the file.
+
+        :return: The file of the transcript, positioned at the start
+        """
+        self._write(self.footer(self._counts, self._messages))
+        self.file.seek(0)
+        return self.file
+
+    def _write(self, text):
+        self.file.write(text.encode())
+
+
+class AppendWriter(PartWriter):
+    """
+    Appends message groups to the files of an earlier export instead of writing new ones.
+
+    The footer of the last file is cut off, the new groups are written after its body and
+    a footer counting every message of the file is written again when the writer is closed.
+    Once a file would grow past ``max_bytes`` the next group starts a new file, so a long
+    running export becomes a set of pages that are never rewritten as a whole.
+    """
+
+    def __init__(
+        self,
+        head,
+        footer,
+        footer_size,
+        separator="",
+        pages=None,
+        directory=".",
+        name="transcript-{}",
+        max_bytes=None,
+        state=None,
+    ):
+        """
+        :param head: The text every file starts with
+        :param footer: A callable taking (participant counts, message count) and returning the footer
+        :param footer_size: A callable taking the same arguments and returning the footer size in bytes
+        :param separator: The text written between two message groups
+        :param pages: The list of pages written so far, from the manifest, it is updated in place
+        :param directory: The directory the files are in
+        :param name: The format of the file names, taking the number of the page
+        :param max_bytes: The size in bytes after which a new file is started, or None for a single file
+        :param state: The IncrementalState of the export, if the first group may continue an earlier one
+        """
+        super().__init__(head, footer, footer_size, separator, max_bytes)
+        self.pages = [] if pages is None else pages
+        self.directory = directory
+        self.name = name
+        self.state = state
+        self.file = None
+        self._page = None
+
+    def _open(self):
+        if not self.pages:
+            return self._new_page()
+        self._page = self.pages[-1]
+        self.file = open(os.path.join(self.directory, self._page["file"]), "r+b")
+        self.file.truncate(self._page["body_end"])
+        self.file.seek(self._page["body_end"])
+        self._counts = dict(self._page["counts"])
+        self._messages = self._page["messages"]
+
+    def _new_page(self):
+        self._page = {
+            "file": self.name.format(len(self.pages) + 1),
+            "body_end": 0,
+            "messages": 0,
+            "counts": {},
+        }
+        self.pages.append(self._page)
+        self.file = open(os.path.join(self.directory, self._page["file"]), "w+b")
+        self._reset()
+        self._write(self.head)
+
+    def _close_page(self):
+        self.file.write(self.footer(self._counts, self._messages).encode())
+        self.file.truncate()
+        self.file.close()
+        self.file = None
+
+    def write(self, text, authors=None, messages=1):
+        """
+        Appends a message group to the current file.
+
+        :param text: The rendered message group
+        :param authors: A dict of author id to the number of their messages in the group
+        :param messages: The number of messages in the group
+        """
+        authors = authors or {}
+        continued = self.file is None and self.state is not None and self.state.continued
+        if self.file is None:
+            self._open()
+
+        if not continued and self.max_bytes is not None and self._messages:
+            total = (
+                self._page["body_end"]
+                + self._separator_size
+                + len(text.encode())
+                + self.footer_size(self._merge(authors), self._messages + messages)
+            )
+            if total > self.max_bytes:
+                self._close_page()
+                self._new_page()
+
+        if self._messages and not continued:
+            self._write(self.separator)
+        self._write(text)
+        self._counts = self._merge(authors)
+        self._messages += messages
+        self._page["counts"] = self._counts
+        self._page["messages"] = self._messages
+
+    def _write(self, text):
+        data = text.encode()
+        self.file.write(data)
+        self._page["body_end"] += len(data)
+
+    def close(self):
+        """
+        Writes the footer of the current file.
+
+        :return: The list of pages
+        """
+        if self.file is not None:
+            self._close_page()
+        return self.pages